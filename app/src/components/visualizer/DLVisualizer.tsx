@@ -1,4 +1,4 @@
-import React, { useMemo, useCallback, useEffect } from 'react';
+import React, { useMemo, useCallback, useEffect, useRef } from 'react';
 import ReactFlow, { 
   Background, 
   Controls, 
@@ -13,6 +13,7 @@ import ReactFlow, {
 import 'reactflow/dist/style.css';
 import { editorOpenFile } from '../../lib/editorBus';
 import { subscribeRuns } from '../../features/runs/runsStore';
+import { requestModelLayout, subscribeModelLayout } from '../../features/model/modelLayoutStore';
 import { Terminal } from 'lucide-react';
 
 // 自定义节点组件
@@ -20,6 +21,10 @@ const LayerNode = ({ data }: { data: any }) => (
   <div 
     className="px-4 py-2 shadow-lg rounded-md bg-slate-900 border-2 border-emerald-500/50 min-w-[140px] cursor-pointer hover:border-emerald-400 hover:shadow-emerald-500/10 transition-all"
     onClick={() => {
+      if (data.onExpand) {
+        data.onExpand();
+        return;
+      }
       if (data.source) {
         editorOpenFile(data.source);
       }
@@ -37,6 +42,9 @@ const LayerNode = ({ data }: { data: any }) => (
       {data.params && (
         <span className="text-[9px] text-slate-500 mt-1">参数量: {data.params}</span>
       )}
+      {data.collapsed && (
+        <span className="text-[9px] text-emerald-400/80 mt-1">▸ 已折叠 {data.children ?? 0} 个节点，点击展开</span>
+      )}
     </div>
     <Handle type="source" position={Position.Bottom} className="w-2 h-2 bg-emerald-500" />
   </div>
@@ -46,11 +54,63 @@ const nodeTypes = {
   layer: LayerNode,
 };
 
+const GROUP_PREFIX = 'group:';
+
+type LayoutState = { runId: string; hash: string; expanded: string[] };
+
 export const DLVisualizer: React.FC = () => {
   const [nodes, setNodes, onNodesChange] = useNodesState([]);
   const [edges, setEdges, onEdgesChange] = useEdgesState([]);
   const [isLive, setIsLive] = React.useState(false);
   const [showCommand, setShowCommand] = React.useState(false);
+  // 服务端布局（带 hash/expanded）时记录当前视图，用于展开/折叠分组
+  const [layoutState, setLayoutState] = React.useState<LayoutState | null>(null);
+  const layoutRef = useRef<LayoutState | null>(null);
+  const lastMetricRef = useRef<unknown>(null);
+
+  const toggleGroup = useCallback((group: string, collapse: boolean) => {
+    const cur = layoutRef.current;
+    if (!cur) return;
+    requestModelLayout({ run_id: cur.runId, hash: cur.hash, expanded: cur.expanded, group, collapse });
+  }, []);
+
+  const applyStructure = useCallback((structure: any, runId: string) => {
+    // 将后端传入的节点转换为 ReactFlow 格式；折叠的分组节点点击后展开
+    const newNodes = structure.nodes.map((n: any) => ({
+      ...n,
+      type: n.type || 'layer',
+      data: {
+        ...n.data,
+        onExpand: n.data?.collapsed && String(n.id).startsWith(GROUP_PREFIX)
+          ? () => toggleGroup(String(n.id).slice(GROUP_PREFIX.length), false)
+          : undefined,
+      }
+    }));
+
+    // 处理连线颜色
+    const newEdges = structure.edges.map((e: any) => ({
+      ...e,
+      animated: true,
+      markerEnd: { type: MarkerType.ArrowClosed, color: '#10b981' }
+    }));
+
+    setNodes(newNodes);
+    setEdges(newEdges);
+    const next = typeof structure.hash === 'string' && Array.isArray(structure.expanded)
+      ? { runId, hash: structure.hash, expanded: structure.expanded as string[] }
+      : null;
+    layoutRef.current = next;
+    setLayoutState(next);
+  }, [setNodes, setEdges, toggleGroup]);
+
+  // 展开/折叠的结果
+  useEffect(() => {
+    return subscribeModelLayout((layout) => {
+      const cur = layoutRef.current;
+      if (!layout || !cur || layout.run_id !== cur.runId || layout.hash !== cur.hash) return;
+      applyStructure(layout, layout.run_id);
+    });
+  }, [applyStructure]);
 
   // 监听真实模型架构数据
   useEffect(() => {
@@ -60,12 +120,17 @@ export const DLVisualizer: React.FC = () => {
         setIsLive(false);
         setNodes([]);
         setEdges([]);
+        layoutRef.current = null;
+        lastMetricRef.current = null;
+        setLayoutState(null);
         return;
       }
       setIsLive(true);
 
       const modelMetric = activeRun.metrics.findLast(m => m.name === 'model_structure');
-      if (modelMetric) {
+      // 其它指标到来时不重置视图，否则会丢掉用户展开的分组
+      if (modelMetric && modelMetric.value !== lastMetricRef.current) {
+        lastMetricRef.current = modelMetric.value;
         let structure: any = null;
         if (typeof modelMetric.value === 'string') {
           try {
@@ -77,27 +142,15 @@ export const DLVisualizer: React.FC = () => {
           structure = modelMetric.value;
         }
 
-        if (structure && structure.nodes && structure.edges) {
-          // 将后端传入的节点转换为 ReactFlow 格式
-          const newNodes = structure.nodes.map((n: any) => ({
-            ...n,
-            type: n.type || 'layer',
-            data: { ...n.data }
-          }));
-          
-          // 处理连线颜色
-          const newEdges = structure.edges.map((e: any) => ({
-            ...e,
-            animated: true,
-            markerEnd: { type: MarkerType.ArrowClosed, color: '#10b981' }
-          }));
-
-          setNodes(newNodes);
-          setEdges(newEdges);
+        const cur = layoutRef.current;
+        // 同一张图再次上报时保留当前的展开状态
+        const same = cur && cur.runId === activeRun.runId && structure && cur.hash === structure.hash;
+        if (!same && structure && structure.nodes && structure.edges) {
+          applyStructure(structure, activeRun.runId);
         }
       }
     });
-  }, [setNodes, setEdges]);
+  }, [setNodes, setEdges, applyStructure]);
 
   return (
     <div className="w-full h-full bg-slate-950 relative">
@@ -146,6 +199,22 @@ export const DLVisualizer: React.FC = () => {
         )}
       </div>
 
+      {layoutState && layoutState.expanded.length > 0 && (
+        <div className="absolute top-4 right-4 z-10 p-2 bg-slate-900/90 border border-emerald-500/20 rounded-lg max-h-[40%] overflow-y-auto backdrop-blur-md">
+          <div className="text-[9px] font-bold uppercase tracking-widest text-slate-500 mb-1">已展开分组</div>
+          {layoutState.expanded.map((group) => (
+            <button
+              key={group}
+              onClick={() => toggleGroup(group, true)}
+              className="w-full flex items-center justify-between gap-3 px-1.5 py-0.5 rounded text-[10px] text-slate-300 hover:bg-emerald-500/10 hover:text-emerald-400 transition-all"
+            >
+              <span className="font-mono truncate">{group}</span>
+              <span className="text-emerald-500/80">折叠</span>
+            </button>
+          ))}
+        </div>
+      )}
+
       <ReactFlow
         nodes={nodes}
         edges={edges}
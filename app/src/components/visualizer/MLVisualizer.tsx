@@ -4,8 +4,76 @@ import { OrbitControls, Stars } from '@react-three/drei';
 import * as THREE from 'three';
 import { editorOpenFile } from '../../lib/editorBus';
 import { subscribeRuns } from '../../features/runs/runsStore';
+import type { RunMetricPoint } from '../../features/runs/runTypes';
 import { Terminal } from 'lucide-react';
 
+type PointBuffer = {
+  name?: string | null;
+  total: number;
+  count: number;
+  method: string;
+  bounds: [number[], number[]];
+  positions: string;
+  colors: string | null;
+  legend?: { classes?: (string | number)[]; palette?: string[]; range?: [number, number] } | null;
+};
+
+// ml_points_buffer 的 positions / colors 是 base64 编码的小端 float32 (m, 3)
+const decodeF32 = (b64: string) => {
+  const bin = atob(b64);
+  const bytes = new Uint8Array(bin.length);
+  for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+  return new Float32Array(bytes.buffer);
+};
+
+const lastMetricIndex = (metrics: RunMetricPoint[], name: string) => {
+  for (let i = metrics.length - 1; i >= 0; i--) {
+    if (metrics[i].name === name) return i;
+  }
+  return -1;
+};
+
+const BufferCloud = ({ buffer }: { buffer: PointBuffer }) => {
+  const geometry = useMemo(() => {
+    const pos = decodeF32(buffer.positions);
+    // 按 bounds 居中并缩放到与旧视图相近的尺度
+    const [lo, hi] = buffer.bounds;
+    const center = lo.map((v, i) => (v + hi[i]) / 2);
+    const extent = Math.max(...lo.map((v, i) => hi[i] - v), 1e-6);
+    const scale = 10 / extent;
+    for (let i = 0; i < pos.length; i++) pos[i] = (pos[i] - center[i % 3]) * scale;
+    const g = new THREE.BufferGeometry();
+    g.setAttribute('position', new THREE.BufferAttribute(pos, 3));
+    const colors = buffer.colors ? decodeF32(buffer.colors) : null;
+    if (colors && colors.length === pos.length) {
+      g.setAttribute('color', new THREE.BufferAttribute(colors, 3));
+    } else {
+      const c = new THREE.Color('#10b981');
+      const fill = new Float32Array(pos.length);
+      for (let i = 0; i < fill.length; i += 3) fill.set([c.r, c.g, c.b], i);
+      g.setAttribute('color', new THREE.BufferAttribute(fill, 3));
+    }
+    return g;
+  }, [buffer]);
+
+  useEffect(() => () => geometry.dispose(), [geometry]);
+
+  const groupRef = useRef<THREE.Group>(null);
+  useFrame(() => {
+    if (groupRef.current) {
+      groupRef.current.rotation.y += 0.002;
+    }
+  });
+
+  return (
+    <group ref={groupRef}>
+      <points geometry={geometry}>
+        <pointsMaterial size={0.06} vertexColors sizeAttenuation />
+      </points>
+    </group>
+  );
+};
+
 const PointCloud = ({ data }: { data: any[] }) => {
   const points = useMemo(() => {
     if (data && data.length > 0) {
@@ -48,6 +116,7 @@ const PointCloud = ({ data }: { data: any[] }) => {
 
 export const MLVisualizer: React.FC = () => {
   const [realData, setRealData] = useState<any[]>([]);
+  const [buffer, setBuffer] = useState<PointBuffer | null>(null);
   const [showCommand, setShowCommand] = useState(false);
 
   // 监听真实运行指标
@@ -56,10 +125,21 @@ export const MLVisualizer: React.FC = () => {
       const activeRun = allRuns.find(r => !r.finishedAt);
       if (!activeRun) {
         setRealData([]);
+        setBuffer(null);
         return;
       }
 
-      const mlMetric = activeRun.metrics.findLast(m => m.name === 'ml_points');
+      // log_points 先发 ml_points_buffer，再紧跟一份兼容的 ml_points；两者相邻时用缓冲区版本
+      const bufferIdx = lastMetricIndex(activeRun.metrics, 'ml_points_buffer');
+      const legacyIdx = lastMetricIndex(activeRun.metrics, 'ml_points');
+      const latest = bufferIdx >= 0 ? (activeRun.metrics[bufferIdx].value as unknown as PointBuffer) : null;
+      if (latest && typeof latest.positions === 'string' && bufferIdx >= legacyIdx - 1) {
+        setBuffer(latest);
+        return;
+      }
+      setBuffer(null);
+
+      const mlMetric = legacyIdx >= 0 ? activeRun.metrics[legacyIdx] : undefined;
       if (mlMetric) {
         if (typeof mlMetric.value === 'string') {
           try {
@@ -77,12 +157,17 @@ export const MLVisualizer: React.FC = () => {
     });
   }, []);
 
+  const hasData = buffer !== null || realData.length > 0;
+  const legendClasses = buffer?.legend?.classes && buffer.legend.palette
+    ? buffer.legend.classes.map((c, i) => ({ label: String(c), color: buffer.legend!.palette![i] }))
+    : null;
+
   return (
     <div className="w-full h-full bg-slate-900 relative">
       <div className="absolute top-4 left-4 z-10 text-white flex flex-col gap-1">
         <div className="flex items-center gap-2">
           <h4 className="text-xs font-bold uppercase tracking-widest opacity-50 text-slate-400">特征空间 (Feature Space)</h4>
-          {realData.length > 0 ? (
+          {hasData ? (
             <span className="px-1.5 py-0.5 rounded bg-emerald-500/20 text-emerald-400 text-[9px] font-bold border border-emerald-500/30 animate-pulse">
               LIVE
             </span>
@@ -93,10 +178,12 @@ export const MLVisualizer: React.FC = () => {
           )}
         </div>
         <p className="text-[10px] opacity-70 text-slate-300">
-          {realData.length > 0 ? '实时模型数据投影' : '等待接入实时特征空间数据...'}
+          {buffer
+            ? `实时模型数据投影 · ${buffer.count.toLocaleString()} / ${buffer.total.toLocaleString()} 点（${buffer.method}）`
+            : realData.length > 0 ? '实时模型数据投影' : '等待接入实时特征空间数据...'}
         </p>
         
-        {realData.length === 0 && (
+        {!hasData && (
           <div className="mt-4 p-4 bg-slate-900/90 border border-emerald-500/20 rounded-xl max-w-[260px] backdrop-blur-md pointer-events-auto shadow-2xl">
             <div className="flex items-center gap-2 mb-3 text-emerald-400">
               <div className="p-1.5 bg-emerald-500/10 rounded-lg">
@@ -146,23 +233,34 @@ export const MLVisualizer: React.FC = () => {
         <ambientLight intensity={0.5} />
         <pointLight position={[10, 10, 10]} intensity={1} />
         <Stars radius={100} depth={50} count={5000} factor={4} saturation={0} fade speed={1} />
-        <PointCloud data={realData} />
+        {buffer ? <BufferCloud buffer={buffer} /> : <PointCloud data={realData} />}
         <OrbitControls autoRotate autoRotateSpeed={0.5} enablePan={false} />
       </Canvas>
-      <div className="absolute bottom-4 right-4 z-10 flex gap-4 pointer-events-none">
-        <div className="flex items-center gap-2">
-          <div className="w-2 h-2 rounded-full bg-cyan-500" />
-          <span className="text-[10px] text-white opacity-60">分类 A (Cluster A)</span>
-        </div>
-        <div className="flex items-center gap-2">
-          <div className="w-2 h-2 rounded-full bg-teal-500" />
-          <span className="text-[10px] text-white opacity-60">分类 B (Cluster B)</span>
+      {legendClasses ? (
+        <div className="absolute bottom-4 right-4 z-10 flex flex-wrap justify-end gap-4 max-w-[60%] pointer-events-none">
+          {legendClasses.map(({ label, color }) => (
+            <div key={label} className="flex items-center gap-2">
+              <div className="w-2 h-2 rounded-full" style={{ backgroundColor: color }} />
+              <span className="text-[10px] text-white opacity-60">{label}</span>
+            </div>
+          ))}
         </div>
-        <div className="flex items-center gap-2">
-          <div className="w-2 h-2 rounded-full bg-emerald-500" />
-          <span className="text-[10px] text-white opacity-60">分类 C (Cluster C)</span>
+      ) : (
+        <div className="absolute bottom-4 right-4 z-10 flex gap-4 pointer-events-none">
+          <div className="flex items-center gap-2">
+            <div className="w-2 h-2 rounded-full bg-cyan-500" />
+            <span className="text-[10px] text-white opacity-60">分类 A (Cluster A)</span>
+          </div>
+          <div className="flex items-center gap-2">
+            <div className="w-2 h-2 rounded-full bg-teal-500" />
+            <span className="text-[10px] text-white opacity-60">分类 B (Cluster B)</span>
+          </div>
+          <div className="flex items-center gap-2">
+            <div className="w-2 h-2 rounded-full bg-emerald-500" />
+            <span className="text-[10px] text-white opacity-60">分类 C (Cluster C)</span>
+          </div>
         </div>
-      </div>
+      )}
     </div>
   );
 };
@@ -6,6 +6,7 @@ import { setHwSnapshot } from '../hw/hwStore'
 import { setSystemInfo } from '../system/systemStore'
 import { setOomAnalysis } from '../oom/oomStore'
 import { clearTraceLocation, setTraceLocation } from '../trace/traceStore'
+import { setModelLayout, setModelLayoutHandler } from '../model/modelLayoutStore'
 import { getWorkspaceState } from '../workspace/workspaceStore'
 
 export type KernelStatus = 'connecting' | 'open' | 'closed' | 'error'
@@ -92,6 +93,10 @@ export function useKernel(): UseKernelResult {
           setSystemInfo(msg.data)
           return
         }
+        if (msg.type === 'model_layout') {
+          setModelLayout(msg)
+          return
+        }
         if (msg.type === 'oom') {
           const suggestions = msg.suggestions ?? []
           setOomAnalysis({
@@ -130,8 +135,12 @@ export function useKernel(): UseKernelResult {
 
     client.connect()
     clientRef.current = client
+    const releaseLayoutHandler = setModelLayoutHandler((req) =>
+      client.expandGroup(req.run_id, req.hash, req.expanded, req.group, req.collapse),
+    )
 
     return () => {
+      releaseLayoutHandler()
       clientRef.current = null
     }
   }, [])
@@ -0,0 +1,51 @@
+// 服务端布局后的模型结构图：DLVisualizer 发起展开/折叠请求，由持有 Kernel 连接的 useKernel 转发，
+// 返回的 model_layout 存在这里供视图订阅
+export type ModelLayout = {
+  run_id: string
+  hash: string
+  expanded: string[]
+  total_nodes: number
+  incremental?: string | null
+  nodes: any[]
+  edges: any[]
+}
+
+export type ModelLayoutRequest = {
+  run_id: string
+  hash: string
+  expanded: string[]
+  group: string
+  collapse?: boolean
+}
+
+type Listener = (layout: ModelLayout | null) => void
+type RequestHandler = (req: ModelLayoutRequest) => void
+
+let current: ModelLayout | null = null
+const listeners = new Set<Listener>()
+let handler: RequestHandler | null = null
+
+export function setModelLayout(layout: ModelLayout) {
+  current = layout
+  for (const l of listeners) l(current)
+}
+
+export function subscribeModelLayout(listener: Listener) {
+  listeners.add(listener)
+  listener(current)
+  return () => {
+    listeners.delete(listener)
+  }
+}
+
+// 同一时刻只保留一个转发者，避免多个 Kernel 连接重复请求
+export function setModelLayoutHandler(next: RequestHandler) {
+  handler = next
+  return () => {
+    if (handler === next) handler = null
+  }
+}
+
+export function requestModelLayout(req: ModelLayoutRequest) {
+  handler?.(req)
+}
@@ -36,6 +36,17 @@ export type KernelMessage =
       cancelled: boolean
     }
   | { type: 'error'; message: string; run_id?: string | null }
+  | {
+      type: 'model_layout'
+      request_id?: number | string | null
+      run_id: string
+      hash: string
+      expanded: string[]
+      total_nodes: number
+      incremental?: string | null
+      nodes: any[]
+      edges: any[]
+    }
   | {
       type: 'system_info'
       data: {
@@ -162,6 +173,10 @@ export class KernelClient {
     this.send({ type: 'request_system_info' })
   }
 
+  expandGroup(run_id: string, hash: string, expanded: string[], group: string, collapse = false) {
+    this.send({ type: 'expand_group', run_id, hash, expanded, group, collapse })
+  }
+
   private send(payload: unknown) {
     this.connect()
     const ws = this.ws
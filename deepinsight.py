@@ -1,7 +1,17 @@
 import json
 import sys
+import base64
+import hashlib
 import time
 import os
+import threading
+import itertools
+import contextlib
+import contextvars
+import inspect
+import functools
+import atexit
+import weakref
 
 def log_metric(name, value, step=0):
     """手动记录指标，统一格式输出给前端"""
@@ -10,86 +20,47 @@ def log_metric(name, value, step=0):
         value = value.tolist()
     
     print(f'__METRIC__ {json.dumps({"name": name, "value": value, "step": step})}')
+    global _last_step
+    # 非数值的 step 只原样记录，不参与步数推进
+    if not isinstance(step, (int, float)):
+        return
+    if step > _last_step:
+        _last_step = step
+    if _mem is not None and step != _mem["seen"]:
+        _memory_tick(step)
 
-def log_model(model):
-    """自动解析 PyTorch 模型结构并记录"""
+def log_model(model, example_input=None):
+    """记录 PyTorch 模型的数据流图（优先 torch.fx，失败时用 example_input 跑一次前向）"""
     try:
         import torch.nn as nn
         if not isinstance(model, nn.Module):
             return
-
-        nodes = []
-        edges = []
-        
-        # 简单的层解析
-        for name, module in model.named_modules():
-            if name == '': continue # skip root
-            
-            # 仅记录基础层
-            if len(list(module.children())) == 0:
-                nodes.append({
-                    "id": name,
-                    "type": "layer",
-                    "data": {
-                        "type": type(module).__name__,
-                        "label": name,
-                        "params": f"{sum(p.numel() for p in module.parameters()):,}"
-                    },
-                    "position": {"x": 250, "y": len(nodes) * 100}
-                })
-                
-                # 简单的线性连接假设 (如果是 Sequential)
-                if len(nodes) > 1:
-                    edges.append({
-                        "id": f"e-{len(edges)}",
-                        "source": nodes[-2]["id"],
-                        "target": nodes[-1]["id"]
-                    })
-        
-        log_metric("model_structure", {"nodes": nodes, "edges": edges})
+        input_sig = _input_signature(example_input)
+        # 同一模型对象、同样的输入已经记录过：不再遍历模块，也不重复输出
+        seen = _model_seen.get(model)
+        if seen is not None and input_sig in seen:
+            return
+        key = (_model_signature(model), input_sig)
+        if key not in _model_graph_cache:
+            graph = _model_graph(model, example_input)
+            # 同一模型换了输入形状，图里的形状标注也会不同，哈希要覆盖序列化后的整张图
+            graph["hash"] = hashlib.sha1(json.dumps(graph, sort_keys=True).encode()).hexdigest()[:16]
+            if graph["hash"] not in _model_graphs_sent:
+                _model_graphs_sent.add(graph["hash"])
+                print(f'__METRIC__ {json.dumps({"name": "model_structure", "value": graph, "step": 0})}')
+            if len(_model_graph_cache) >= _MODEL_GRAPH_CACHE_MAX:
+                _model_graph_cache.clear()
+            _model_graph_cache[key] = graph["hash"]
+        _model_seen.setdefault(model, set()).add(input_sig)
     except ImportError:
         pass
 
-def watch(obj, name=None):
-    """通用监控函数：支持模型、张量、数据集等"""
+def watch(obj, name=None, **options):
+    """通用监控函数：按对象类型分发到已注册的处理函数"""
     if obj is None: return
-    
-    # 1. 自动探测框架
-    # 检查是否为 PyTorch 模型
-    try:
-        import torch.nn as nn
-        import torch
-        if isinstance(obj, nn.Module):
-            print("DeepInsight: Detected PyTorch Model. Extracting structure...")
-            return log_model(obj)
-        if isinstance(obj, torch.Tensor):
-            if torch.isnan(obj).any():
-                print(f"⚠️ DeepInsight Warning: NaN detected in tensor {name or ''}!")
-            return log_metric(name or "tensor", obj.detach().cpu().numpy())
-    except ImportError:
-        pass
-
-    # 检查是否为 Numpy 数组或类似结构 (用于 ML 可视化)
-    try:
-        import numpy as np
-        if isinstance(obj, (list, np.ndarray)):
-            arr = np.array(obj)
-            if arr.ndim == 2 and arr.shape[1] >= 2:
-                # 提取前 3 维用于 3D 可视化
-                points = []
-                for row in arr[:500]: # 最多 500 点
-                    pos = row[:3].tolist()
-                    if len(pos) < 3: pos.extend([0] * (3 - len(pos)))
-                    points.append({"pos": pos})
-                return log_metric("ml_points", points)
-    except ImportError:
-        if isinstance(obj, list) and len(obj) > 0 and isinstance(obj[0], list):
-             points = [{"pos": (row[:3] + [0]*3)[:3]} for row in obj[:500]]
-             return log_metric("ml_points", points)
-
-    # 2. 普通指标
-    if isinstance(obj, (int, float, str, dict, list)):
-        log_metric(name or "data", obj)
+    handler = _watch_handler(type(obj))
+    if handler is not None:
+        return handler(obj, name, **options)
 
 def log_cv(stage_index, message="", image_path=None):
     """记录 CV 流水线状态"""
@@ -100,7 +71,7 @@ def log_cv(stage_index, message="", image_path=None):
         log_metric("cv_image", image_path)
 
 def log_rl(episode=None, reward=None, epsilon=None, steps=None, pos=None):
-    """记录强化学习指标"""
+    """记录强化学习指标（并行的向量化环境用 rl_vec 批量记录）"""
     if episode is not None: log_metric("rl_episode", episode)
     if reward is not None: log_metric("rl_reward", reward)
     if epsilon is not None: log_metric("rl_epsilon", epsilon)
@@ -110,7 +81,7 @@ def log_rl(episode=None, reward=None, epsilon=None, steps=None, pos=None):
 def log_llm(token=None, candidates=None, reasoning=None):
     """记录 LLM 生成过程"""
     if token is not None: log_metric("token_output", token)
-    if candidates is not None: log_metric("token_candidates", json.dumps(candidates))
+    if candidates is not None: log_metric("token_candidates", candidates)
     if reasoning is not None: log_metric("token_reasoning", reasoning)
 
 def log_agent(role, content, source=None):
@@ -120,6 +91,10 @@ def log_agent(role, content, source=None):
         "content": content,
         "source": source # {"path": "xxx.py", "lineNumber": 10}
     })
+    # 处在 agent_episode 内时同时记一个零时长的 span，使其出现在 trace 里
+    if _span_ctx.get():
+        with _span(role, attrs=_agent_attrs(role, content, source)):
+            pass
 
 def check_health(model):
     """检查模型参数和梯度是否健康 (NaN/Inf)"""
@@ -147,3 +122,1265 @@ def autolog():
                 break
     except:
         pass
+
+# ---- 控制通道：内核写控制文件，SDK 在 step 边界按 mtime 轮询 ----
+_CONTROL_PATH = os.environ.get("DEEPINSIGHT_CONTROL")
+_CONTROL_POLL_S = 0.2
+_control = {"seq": 0, "stop": False, "paused": False, "params": {}}
+_control_mtime = None
+_control_checked = 0.0
+_param_callbacks = {}
+_stop_callbacks = []
+_stop_fired = False
+
+
+def _control_ack(state):
+    print(f'__CONTROL__ {json.dumps({"seq": _control["seq"], "state": state, "params": _control["params"]})}')
+
+
+def _read_control(force=False):
+    """读取控制文件；未变化（mtime 相同）或距上次检查不足 _CONTROL_POLL_S 时直接返回 False"""
+    global _control_mtime, _control_checked
+    if not _CONTROL_PATH:
+        return False
+    now = time.monotonic()
+    if not force and now - _control_checked < _CONTROL_POLL_S:
+        return False
+    _control_checked = now
+    try:
+        st = os.stat(_CONTROL_PATH)
+    except OSError:
+        return False
+    # 内核用 os.replace 原子替换控制文件，每次写入都是新 inode；同尺寸、同一时间粒度内的改写也能识别
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if stamp == _control_mtime:
+        return False
+    try:
+        with open(_CONTROL_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+    _control_mtime = stamp
+    if state.get("seq", 0) <= _control["seq"]:
+        return False
+    old_params = _control["params"]
+    _control.update(state)
+    for name, value in _control["params"].items():
+        if name in old_params and old_params[name] == value:
+            continue
+        for cb in _param_callbacks.get(name, []):
+            cb(value)
+    return True
+
+
+def _sync_control(force=False):
+    global _stop_fired
+    changed = _read_control(force)
+    if changed and not _control["stop"]:
+        _control_ack("paused" if _control["paused"] else "running")
+    # 暂停时阻塞在这里，直到恢复或收到停止请求
+    while _control["paused"] and not _control["stop"]:
+        time.sleep(_CONTROL_POLL_S)
+        if _read_control() and not _control["stop"]:
+            _control_ack("paused" if _control["paused"] else "running")
+    if _control["stop"] and not _stop_fired:
+        _stop_fired = True
+        _control_ack("stopping")
+        for cb in _stop_callbacks:
+            cb()
+
+
+def should_stop():
+    """在训练循环的 step 边界调用：应用参数变更、处理暂停，返回是否应优雅停止"""
+    _sync_control()
+    return bool(_control["stop"])
+
+
+def get_param(name, default=None):
+    """读取通过控制通道下发的参数（如学习率），没有下发过则返回 default"""
+    _sync_control()
+    return _control["params"].get(name, default)
+
+
+def on_param(name, callback):
+    """注册参数变更回调，callback(value) 在下一次 should_stop()/get_param() 时于调用线程执行"""
+    _param_callbacks.setdefault(name, []).append(callback)
+
+
+def on_stop(callback):
+    """注册停止回调（如保存 checkpoint），收到 stop_gracefully 后只调用一次"""
+    _stop_callbacks.append(callback)
+
+
+# ---- 内存分配分析：在 step 边界取 tracemalloc 快照，与上一次快照增量对比 ----
+_mem = None
+
+
+def _short_path(path):
+    cwd = os.getcwd()
+    if path.startswith(cwd + os.sep):
+        return os.path.relpath(path, cwd)
+    return path
+
+
+def _memory_snapshot(step):
+    import tracemalloc
+    snap = tracemalloc.take_snapshot().filter_traces(_mem["filters"])
+    current, peak = tracemalloc.get_traced_memory()
+    top = []
+    if _mem["prev"] is not None:
+        # compare_to 按 |size_diff| 降序，只取增长的位置
+        for st in snap.compare_to(_mem["prev"], _mem["key"]):
+            if len(top) >= _mem["top"]:
+                break
+            if st.size_diff <= 0:
+                continue
+            site = st.traceback[-1]
+            top.append({
+                "location": f"{_short_path(site.filename)}:{site.lineno}",
+                "stack": [f"{_short_path(f.filename)}:{f.lineno}" for f in st.traceback] if _mem["frames"] > 1 else None,
+                "size_bytes": st.size,
+                "size_diff_bytes": st.size_diff,
+                "count_diff": st.count_diff,
+            })
+    _mem["prev"] = snap
+    _mem["last_step"] = step
+    log_metric("memory/current_bytes", current, step)
+    log_metric("memory/peak_bytes", peak, step)
+    log_metric("memory_profile", {"current_bytes": current, "peak_bytes": peak, "top": top}, step)
+
+
+def _memory_tick(step):
+    _mem["seen"] = step
+    if _mem["last_step"] is None or step - _mem["last_step"] >= _mem["every"]:
+        _memory_snapshot(step)
+
+
+def _memory_excepthook(tp, value, tb):
+    # 内存耗尽退出前再取一次快照，让内核的 OOM 诊断附带最新的增长位置
+    if _mem is not None and (issubclass(tp, MemoryError) or "OutOfMemory" in tp.__name__):
+        try:
+            _memory_snapshot(_mem["seen"] if _mem["seen"] is not None else 0)
+        except Exception:
+            pass
+    _mem["excepthook"](tp, value, tb)
+
+
+def memory_profile(every=100, top=10, frames=1):
+    """每 every 个 step 对比一次 tracemalloc 快照，输出增长最多的 top 个分配位置"""
+    global _mem
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(int(frames), 1))
+    _mem = {
+        "every": max(int(every), 1),
+        "top": int(top),
+        "frames": tracemalloc.get_traceback_limit(),
+        "key": "lineno" if tracemalloc.get_traceback_limit() <= 1 else "traceback",
+        "filters": [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ],
+        "prev": None,
+        "last_step": None,
+        "seen": None,
+        "excepthook": _mem["excepthook"] if _mem is not None else sys.excepthook,
+    }
+    # 基线快照，不输出
+    _mem["prev"] = tracemalloc.take_snapshot().filter_traces(_mem["filters"])
+    if sys.excepthook is not _memory_excepthook:
+        sys.excepthook = _memory_excepthook
+
+
+# ---- 计时 span：嵌套的墙钟区间，批量以 __SPANS__ 行输出，内核聚合各阶段分位数并可导出 Chrome trace ----
+_SPAN_FLUSH_N = 256
+_SPAN_FLUSH_S = 1.0
+_SPAN_ORIGIN_NS = time.perf_counter_ns()
+_SPAN_ORIGIN_WALL = time.time()
+_span_lock = threading.Lock()
+# 当前打开的 span 链 ((id, step, episode), ...)：用不可变元组存在 ContextVar 里，asyncio 任务之间互不干扰
+_span_ctx = contextvars.ContextVar("deepinsight_spans", default=())
+_span_ids = itertools.count(1)
+_span_names = {}
+_span_new_names = {}
+_span_rows = []
+_span_flushed = time.monotonic()
+_last_step = 0
+
+
+def _flush_spans():
+    global _span_rows, _span_new_names, _span_flushed
+    with _span_lock:
+        rows, names = _span_rows, _span_new_names
+        _span_rows, _span_new_names = [], {}
+        _span_flushed = time.monotonic()
+    if rows:
+        batch = {"pid": os.getpid(), "origin": _SPAN_ORIGIN_WALL, "names": names, "rows": rows}
+        print(f'__SPANS__ {json.dumps(batch, separators=(",", ":"), ensure_ascii=False)}')
+
+
+def _record_span(span_id, parent, name, start_ns, end_ns, step, attrs=None):
+    # 行格式：[id, parent, 名称编号, 起点(us), 时长(us), step, 线程, 可选属性]
+    with _span_lock:
+        idx = _span_names.get(name)
+        if idx is None:
+            idx = _span_names[name] = len(_span_names)
+            _span_new_names[idx] = name
+        row = [span_id, parent, idx, (start_ns - _SPAN_ORIGIN_NS) // 1000, (end_ns - start_ns) // 1000, step, threading.get_ident()]
+        if attrs:
+            row.append(attrs)
+        _span_rows.append(row)
+        due = len(_span_rows) >= _SPAN_FLUSH_N or time.monotonic() - _span_flushed >= _SPAN_FLUSH_S
+    if due:
+        _flush_spans()
+
+
+@contextlib.contextmanager
+def _span(name, step=None, attrs=None):
+    stack = _span_ctx.get()
+    span_id = next(_span_ids)
+    parent, parent_step, episode = stack[-1] if stack else (0, _last_step, None)
+    if step is None:
+        step = parent_step
+    if attrs is not None:
+        # episode 为 None 表示自身就是 Agent 任务的根
+        if "episode" in attrs and attrs["episode"] is None:
+            episode = span_id
+        attrs["episode"] = episode
+    elif episode is not None:
+        attrs = {"episode": episode}
+    token = _span_ctx.set(stack + ((span_id, step, episode),))
+    start = time.perf_counter_ns()
+    try:
+        yield attrs
+    except BaseException as e:
+        if attrs is not None:
+            attrs["error"] = f"{type(e).__name__}: {e}"[:_AGENT_TEXT_MAX]
+        raise
+    finally:
+        end = time.perf_counter_ns()
+        _span_ctx.reset(token)
+        _record_span(span_id, parent, name, start, end, step, attrs)
+
+
+def span(name, step=None):
+    """记录一段嵌套的计时区间：with deepinsight.span("forward"): ..."""
+    return _span(name, step)
+
+
+def timed(fn=None, name=None):
+    """装饰器：把函数的每次调用记录为一个 span，名称缺省为函数的 __qualname__"""
+    def wrap(f):
+        label = name or f.__qualname__
+
+        @functools.wraps(f)
+        def inner(*args, **kwargs):
+            with span(label):
+                return f(*args, **kwargs)
+        return inner
+
+    if fn is None:
+        return wrap
+    if isinstance(fn, str):
+        name = fn
+        return wrap
+    return wrap(fn)
+
+
+atexit.register(_flush_spans)
+
+
+# ---- 数据管道吞吐：包装任意可迭代对象，按固定间隔输出聚合指标而不是逐 batch 输出 ----
+def _batch_len(batch):
+    shape = getattr(batch, "shape", None)
+    if shape is not None and len(shape) > 0:
+        return int(shape[0])
+    if isinstance(batch, dict) and batch:
+        return _batch_len(next(iter(batch.values())))
+    if isinstance(batch, (list, tuple)) and batch:
+        first = batch[0]
+        if getattr(first, "shape", None) is not None or isinstance(first, (list, tuple, dict)):
+            return _batch_len(first)
+        return len(batch)
+    return 1
+
+
+class _TrackedIter:
+    def __init__(self, iterable, name, interval_s, batch_size, stall_fraction):
+        self.iterable = iterable
+        self.name = name
+        self.interval_s = interval_s
+        self.batch_size = batch_size
+        self.stall_fraction = stall_fraction
+
+    def __len__(self):
+        return len(self.iterable)
+
+    def _report(self, fetch, samples, elapsed):
+        fetch.sort()
+        wait = sum(fetch)
+        n = len(fetch)
+        prefix = self.name
+        log_metric(f"{prefix}/fetch_ms_mean", round(wait / n * 1000, 3), _last_step)
+        log_metric(f"{prefix}/fetch_ms_p90", round(fetch[min(int(n * 0.9), n - 1)] * 1000, 3), _last_step)
+        log_metric(f"{prefix}/fetch_ms_max", round(fetch[-1] * 1000, 3), _last_step)
+        log_metric(f"{prefix}/batches_per_s", round(n / elapsed, 3), _last_step)
+        log_metric(f"{prefix}/samples_per_s", round(samples / elapsed, 3), _last_step)
+        fraction = wait / elapsed
+        log_metric(f"{prefix}/wait_fraction", round(fraction, 4), _last_step)
+        if fraction >= self.stall_fraction:
+            print(
+                f"DeepInsight Warning: data loader '{prefix}' is the bottleneck: "
+                f"{fraction:.0%} of step time spent waiting for data (mean fetch {wait / n * 1000:.1f} ms)",
+                file=sys.stderr,
+            )
+
+    def __iter__(self):
+        it = iter(self.iterable)
+        t0 = time.perf_counter()
+        try:
+            batch = next(it)
+        except StopIteration:
+            return
+        start = time.perf_counter()
+        # 第一个 batch 包含 worker 启动开销，单独上报，不计入窗口
+        log_metric(f"{self.name}/first_batch_ms", round((start - t0) * 1000, 3), _last_step)
+        fetch = []
+        samples = 0
+        try:
+            while True:
+                yield batch
+                t0 = time.perf_counter()
+                try:
+                    batch = next(it)
+                except StopIteration:
+                    return
+                t1 = time.perf_counter()
+                fetch.append(t1 - t0)
+                samples += self.batch_size or _batch_len(batch)
+                if t1 - start >= self.interval_s:
+                    self._report(fetch, samples, t1 - start)
+                    fetch, samples, start = [], 0, t1
+        finally:
+            if fetch:
+                self._report(fetch, samples, max(time.perf_counter() - start, 1e-9))
+
+
+def track_iter(iterable, name="data", interval_s=5.0, batch_size=None, stall_fraction=0.5):
+    """包装 DataLoader 等可迭代对象，统计取数延迟、吞吐与等待数据的占比"""
+    return _TrackedIter(iterable, name, interval_s, batch_size, stall_fraction)
+
+
+# ---- LLM 生成会话：token 按帧批量输出，自动统计首 token 延迟、吞吐与 token 间延迟分布 ----
+_llm_sessions = itertools.count()
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)], 3)
+
+
+def _candidate_arrays(candidates):
+    """候选词统一为列式：{"tokens": [...], "probs": [...], "ids": [...] | None}"""
+    if isinstance(candidates, dict):
+        items = list(candidates.items())
+        return {"tokens": [str(t) for t, _ in items], "probs": [float(p) for _, p in items], "ids": None}
+    tokens, probs, ids = [], [], []
+    for c in candidates:
+        if isinstance(c, dict):
+            tokens.append(str(c.get("token", "")))
+            probs.append(float(c.get("prob", 0.0)))
+            ids.append(c.get("id"))
+        else:
+            tokens.append(str(c[0]))
+            probs.append(float(c[1]))
+            ids.append(c[2] if len(c) > 2 else None)
+    return {"tokens": tokens, "probs": probs, "ids": ids if any(i is not None for i in ids) else None}
+
+
+class _LLMSession:
+    def __init__(self, name, frame_tokens, frame_s):
+        self.name = name
+        self.index = next(_llm_sessions)
+        self.frame_tokens = frame_tokens
+        self.frame_s = frame_s
+        self.start = time.perf_counter()
+        self.times = []
+        self.count = 0
+        self._frame = self._new_frame()
+        self._frame_started = self.start
+
+    def _new_frame(self):
+        return {"tokens": [], "ids": [], "t_ms": [], "candidates": []}
+
+    def token(self, text, token_id=None, candidates=None):
+        """记录一个生成的 token；candidates 为 [(token, prob[, id])]、[{"token", "prob"}] 或 {token: prob}"""
+        now = time.perf_counter()
+        self.times.append(now)
+        f = self._frame
+        f["tokens"].append(text)
+        f["ids"].append(token_id)
+        f["t_ms"].append(round((now - self.start) * 1000, 3))
+        f["candidates"].append(_candidate_arrays(candidates) if candidates is not None else None)
+        self.count += 1
+        if len(f["tokens"]) >= self.frame_tokens or now - self._frame_started >= self.frame_s:
+            self.flush()
+
+    def reasoning(self, text):
+        """记录一段思考过程"""
+        log_metric("token_reasoning", text, self.index)
+
+    def flush(self):
+        f = self._frame
+        if not f["tokens"]:
+            return
+        self._frame = self._new_frame()
+        self._frame_started = time.perf_counter()
+        offset = self.count - len(f["tokens"])
+        frame = {
+            "session": self.index,
+            "name": self.name,
+            "offset": offset,
+            "tokens": f["tokens"],
+            "ids": f["ids"] if any(i is not None for i in f["ids"]) else None,
+            "t_ms": f["t_ms"],
+            "candidates": f["candidates"] if any(c is not None for c in f["candidates"]) else None,
+        }
+        log_metric("llm_tokens", frame, self.index)
+        # 兼容旧的 LLM 可视化：每帧一条 token_output，候选词取帧内最后一个
+        log_metric("token_output", "".join(str(t) for t in f["tokens"]), self.index)
+        last = next((c for c in reversed(f["candidates"]) if c is not None), None)
+        if last is not None:
+            log_metric("token_candidates", [{"token": t, "prob": p} for t, p in zip(last["tokens"], last["probs"])], self.index)
+
+    def stats(self):
+        """首 token 延迟、解码吞吐与 token 间延迟分布（毫秒）"""
+        end = time.perf_counter()
+        if not self.times:
+            return {"tokens": 0, "ttft_ms": None, "tokens_per_s": None, "total_ms": round((end - self.start) * 1000, 3)}
+        gaps = sorted((b - a) * 1000 for a, b in zip(self.times, self.times[1:]))
+        decode_s = self.times[-1] - self.times[0]
+        return {
+            "tokens": self.count,
+            "ttft_ms": round((self.times[0] - self.start) * 1000, 3),
+            "tokens_per_s": round((self.count - 1) / decode_s, 3) if decode_s > 0 else None,
+            "itl_ms": {
+                "p50": _percentile(gaps, 0.5),
+                "p90": _percentile(gaps, 0.9),
+                "p99": _percentile(gaps, 0.99),
+                "max": gaps[-1] if gaps else None,
+            },
+            "total_ms": round((end - self.start) * 1000, 3),
+        }
+
+    def close(self):
+        self.flush()
+        st = self.stats()
+        log_metric("llm_session", {"session": self.index, "name": self.name, **st}, self.index)
+        for key in ("ttft_ms", "tokens_per_s"):
+            if st[key] is not None:
+                log_metric(f"{self.name}/{key}", st[key], self.index)
+        if st["tokens"] > 1:
+            log_metric(f"{self.name}/itl_ms_p50", st["itl_ms"]["p50"], self.index)
+            log_metric(f"{self.name}/itl_ms_p99", st["itl_ms"]["p99"], self.index)
+
+
+@contextlib.contextmanager
+def llm_session(name="llm", frame_tokens=16, frame_s=0.25):
+    """记录一次 LLM 生成：with deepinsight.llm_session() as s: s.token(...)"""
+    session = _LLMSession(name, max(int(frame_tokens), 1), frame_s)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+# ---- Agent 追踪：thought/action/observation/tool 都是带父子关系的 span，复用 __SPANS__ 批量输出 ----
+_AGENT_TEXT_MAX = 2000
+
+
+def _agent_attrs(role, content, source=None):
+    attrs = {"agent": role}
+    if content is not None:
+        text = content if isinstance(content, str) else repr(content)
+        attrs["content"] = text[:_AGENT_TEXT_MAX]
+    if source is not None:
+        attrs["source"] = source
+    return attrs
+
+
+def agent_episode(name="episode", content=None):
+    """一次 Agent 任务的根 span；内核在它结束时计算该任务的关键路径"""
+    attrs = _agent_attrs("episode", content)
+    attrs["episode"] = None
+    return _span(name, attrs=attrs)
+
+
+def agent_span(role, content=None, name=None, source=None):
+    """记录 Agent 的一步：with deepinsight.agent_span("thought", "分析需求") as step: ..."""
+    return _span(name or role, attrs=_agent_attrs(role, content, source))
+
+
+def tool(fn=None, name=None):
+    """装饰器：把工具函数（含 async 函数）的每次调用记录为 tool span，附带参数摘要、结果摘要与异常"""
+    def wrap(f):
+        label = name or f.__name__
+
+        def attrs_for(args, kwargs):
+            shown = [repr(a) for a in args] + [f"{k}={v!r}" for k, v in kwargs.items()]
+            return _agent_attrs("tool", f"{label}({', '.join(shown)})")
+
+        if inspect.iscoroutinefunction(f):
+            @functools.wraps(f)
+            async def async_inner(*args, **kwargs):
+                with _span(label, attrs=attrs_for(args, kwargs)) as attrs:
+                    result = await f(*args, **kwargs)
+                    attrs["result"] = repr(result)[:_AGENT_TEXT_MAX]
+                    return result
+            return async_inner
+
+        @functools.wraps(f)
+        def inner(*args, **kwargs):
+            with _span(label, attrs=attrs_for(args, kwargs)) as attrs:
+                result = f(*args, **kwargs)
+                attrs["result"] = repr(result)[:_AGENT_TEXT_MAX]
+                return result
+        return inner
+
+    if fn is None:
+        return wrap
+    if isinstance(fn, str):
+        name = fn
+        return wrap
+    return wrap(fn)
+
+
+# ---- 向量化环境的 RL 记录：一次调用传入所有环境的数组，按时间间隔批量输出回合记录与抽稀后的轨迹 ----
+class _VecRL:
+    def __init__(self, num_envs, name, flush_s, traj_every, traj_envs):
+        import numpy as np
+        self.np = np
+        self.num_envs = num_envs
+        self.name = name
+        self.flush_s = flush_s
+        self.traj_every = max(int(traj_every), 1)
+        self.traj_envs = min(max(int(traj_envs), 0), num_envs)
+        self.returns = np.zeros(num_envs, dtype=np.float64)
+        self.lengths = np.zeros(num_envs, dtype=np.int64)
+        self.t = 0
+        self.episodes = 0
+        self.epsilon = None
+        self._done = []
+        self._traj = []
+        self._traj_start = None
+        self._last_flush = time.perf_counter()
+        self._last_flush_t = 0
+
+    def step(self, rewards, dones, positions=None, epsilon=None):
+        """rewards / dones 形状为 (num_envs,)；positions 为 (num_envs, D)，只按 traj_every 抽稀保留前 traj_envs 个环境"""
+        np = self.np
+        self.returns += np.asarray(rewards, dtype=np.float64).reshape(self.num_envs)
+        self.lengths += 1
+        self.t += 1
+        idx = np.flatnonzero(np.asarray(dones, dtype=bool).reshape(self.num_envs))
+        if idx.size:
+            self._done.append((self.t, idx, self.returns[idx], self.lengths[idx]))
+            self.returns[idx] = 0.0
+            self.lengths[idx] = 0
+        if positions is not None and self.traj_envs and self.t % self.traj_every == 0:
+            if self._traj_start is None:
+                self._traj_start = self.t
+            self._traj.append(np.asarray(positions, dtype=np.float32)[: self.traj_envs].reshape(self.traj_envs, -1))
+        if epsilon is not None:
+            self.epsilon = float(epsilon)
+        if time.perf_counter() - self._last_flush >= self.flush_s:
+            self.flush()
+
+    def flush(self):
+        np = self.np
+        now = time.perf_counter()
+        elapsed = now - self._last_flush
+        if self.t > self._last_flush_t and elapsed > 0:
+            log_metric(f"{self.name}/env_steps_per_s", round((self.t - self._last_flush_t) * self.num_envs / elapsed, 3), self.t)
+        self._last_flush, self._last_flush_t = now, self.t
+        if self.epsilon is not None:
+            log_metric("rl_epsilon", self.epsilon, self.t)
+        if self._done:
+            done_t = np.concatenate([np.full(idx.size, t) for t, idx, _, _ in self._done])
+            env = np.concatenate([d[1] for d in self._done])
+            ret = np.concatenate([d[2] for d in self._done])
+            length = np.concatenate([d[3] for d in self._done])
+            self._done = []
+            first = self.episodes
+            self.episodes += env.size
+            log_metric("rl_episodes", {
+                "name": self.name,
+                "first": first,
+                "t": done_t.tolist(),
+                "env": env.tolist(),
+                "return": np.round(ret, 6).tolist(),
+                "length": length.tolist(),
+            }, self.t)
+            log_metric(f"{self.name}/return_mean", round(float(ret.mean()), 6), self.t)
+            log_metric(f"{self.name}/return_max", round(float(ret.max()), 6), self.t)
+            log_metric(f"{self.name}/length_mean", round(float(length.mean()), 3), self.t)
+            # 兼容旧的 RL 可视化
+            log_metric("rl_episode", self.episodes, self.t)
+            log_metric("rl_reward", round(float(ret[-1]), 6), self.t)
+            log_metric("rl_steps", int(length[-1]), self.t)
+        if self._traj:
+            pos = np.round(np.stack(self._traj), 4)
+            log_metric("rl_trajectory", {
+                "name": self.name,
+                "start": self._traj_start,
+                "every": self.traj_every,
+                "envs": self.traj_envs,
+                "pos": pos.tolist(),
+            }, self.t)
+            log_metric("rl_pos", pos[-1, 0], self.t)
+            self._traj = []
+            self._traj_start = None
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def rl_vec(num_envs, name="rl", flush_s=1.0, traj_every=10, traj_envs=4):
+    """向量化环境的 RL 记录器：rl.step(rewards, dones, positions, epsilon)"""
+    return _VecRL(int(num_envs), name, flush_s, traj_every, traj_envs)
+
+
+# ---- 点云：高维数据随机化 PCA 投影到 3 维，按点数预算采样，位置与颜色以 base64 的 float32 缓冲区输出 ----
+_POINT_BUDGET = 20000
+# 拟合 PCA 最多使用的行数，投影本身对全部需要的行做一次矩阵乘法
+_PCA_FIT_ROWS = 50000
+# 旧的 ml_points（逐点字典）只保留这么多点
+_LEGACY_POINTS = 500
+_PALETTE = [
+    "#10b981", "#3b82f6", "#f59e0b", "#ef4444", "#8b5cf6",
+    "#06b6d4", "#ec4899", "#84cc16", "#f97316", "#64748b",
+]
+
+
+def _pca3(x, rng):
+    """随机化 PCA（Halko 等）：返回 (均值, 3 x d 的主成分, 解释方差占比)"""
+    import numpy as np
+    mean = x.mean(axis=0)
+    xc = x - mean
+    d = x.shape[1]
+    p = min(d, 3 + 10)
+    q, _ = np.linalg.qr(xc @ rng.standard_normal((d, p)).astype(x.dtype))
+    for _ in range(2):
+        # 两次幂迭代，谱衰减慢时也能分开前几个主成分
+        q, _ = np.linalg.qr(xc @ (xc.T @ q))
+    _, sv, vt = np.linalg.svd(q.T @ xc, full_matrices=False)
+    total = float((xc * xc).sum()) or 1.0
+    return mean, vt[:3], [round(float(v) ** 2 / total, 6) for v in sv[:3]]
+
+
+def _sample_stratified(labels, budget, rng):
+    """每个类别按占比分配名额，且至少保留 1 个点，保证小类别可见"""
+    import numpy as np
+    n = labels.shape[0]
+    order = rng.permutation(n)
+    order = order[np.argsort(labels[order], kind="stable")]
+    _, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    quota = np.maximum(counts * budget // n, 1)
+    rank = np.arange(n) - np.repeat(starts, counts)
+    return np.sort(order[rank < np.repeat(quota, counts)])
+
+
+def _sample_voxel(pos, labels, budget, rng):
+    """体素网格降采样：每个（体素, 类别）随机保留一个点，网格分辨率迭代调整到接近预算"""
+    import numpy as np
+    n = pos.shape[0]
+    order = rng.permutation(n)
+    lo = pos.min(axis=0)
+    span = np.maximum(pos.max(axis=0) - lo, 1e-12)
+    unit = (pos[order] - lo) / span
+    cls = None if labels is None else np.unique(labels[order], return_inverse=True)[1].astype(np.int64)
+    g = max(int(round(budget ** (1 / 3))), 1)
+    keep = order
+    for _ in range(6):
+        cells = np.minimum((unit * g).astype(np.int64), g - 1)
+        key = (cells[:, 0] * g + cells[:, 1]) * g + cells[:, 2]
+        if cls is not None:
+            key = key * (int(cls.max()) + 1) + cls
+        _, first = np.unique(key, return_index=True)
+        keep = order[first]
+        if 0.8 * budget <= keep.size <= budget:
+            break
+        g = max(int(g * (budget / keep.size) ** (1 / 3)), 1)
+    if keep.size > budget:
+        keep = rng.choice(keep, budget, replace=False)
+    return np.sort(keep)
+
+
+def _hex_rgb(color):
+    return [int(color[i:i + 2], 16) / 255 for i in (1, 3, 5)]
+
+
+def _label_colors(labels):
+    """按标签着色，返回 (colors, legend, codes)"""
+    import numpy as np
+    if labels.dtype.kind == "f" and np.unique(labels).size > len(_PALETTE):
+        lo, hi = float(labels.min()), float(labels.max())
+        t = ((labels - lo) / ((hi - lo) or 1.0))[:, None]
+        a, b = np.array(_hex_rgb(_PALETTE[1])), np.array(_hex_rgb(_PALETTE[2]))
+        return (a + (b - a) * t).astype(np.float32), {"range": [lo, hi]}, None
+    classes, inverse = np.unique(labels, return_inverse=True)
+    palette = np.array([_hex_rgb(c) for c in _PALETTE], dtype=np.float32)
+    legend = {
+        "classes": [c.item() if hasattr(c, "item") else c for c in classes],
+        "palette": [_PALETTE[i % len(_PALETTE)] for i in range(len(classes))],
+    }
+    return palette[inverse % len(_PALETTE)], legend, inverse
+
+
+def _b64(arr):
+    import numpy as np
+    return base64.b64encode(np.ascontiguousarray(arr, dtype="<f4").tobytes()).decode("ascii")
+
+
+def log_points(data, labels=None, name=None, max_points=_POINT_BUDGET, method=None, seed=0):
+    """记录点云：高维先投影到 3 维，超过 max_points 时降采样"""
+    import numpy as np
+    x = np.asarray(data)
+    if x.ndim != 2 or x.shape[0] == 0:
+        raise ValueError("log_points expects a non-empty (n, d) array")
+    x = x.astype(np.float32 if x.dtype != np.float64 else np.float64, copy=False)
+    n, d = x.shape
+    lab = None if labels is None else np.asarray(labels).reshape(-1)
+    if lab is not None and lab.shape[0] != n:
+        raise ValueError(f"labels has {lab.shape[0]} entries for {n} points")
+    method = method or ("stratified" if lab is not None else "uniform")
+    if method not in ("uniform", "stratified", "voxel"):
+        raise ValueError(f"unknown sampling method: {method}")
+    if method == "stratified" and lab is None:
+        raise ValueError("stratified sampling needs labels")
+    rng = np.random.default_rng(seed)
+    budget = max(int(max_points), 1)
+
+    variance = None
+    if d > 3:
+        fit = x if n <= _PCA_FIT_ROWS else x[rng.choice(n, _PCA_FIT_ROWS, replace=False)]
+        mean, comps, variance = _pca3(fit, rng)
+
+        def project(rows):
+            return (rows - mean) @ comps.T
+    else:
+        def project(rows):
+            return np.pad(rows, ((0, 0), (0, 3 - d)))
+
+    if n <= budget:
+        idx = np.arange(n)
+        pos = project(x)
+    elif method == "voxel":
+        # 体素需要所有点的 3 维坐标
+        full = project(x)
+        idx = _sample_voxel(full, lab, budget, rng)
+        pos = full[idx]
+    else:
+        idx = np.sort(rng.choice(n, budget, replace=False)) if method == "uniform" else _sample_stratified(lab, budget, rng)
+        pos = project(x[idx])
+    pos = pos.astype(np.float32)
+
+    colors, legend, codes = (None, None, None) if lab is None else _label_colors(lab[idx])
+    log_metric("ml_points_buffer", {
+        "name": name,
+        "total": n,
+        "count": int(idx.size),
+        "dims": d,
+        "method": method if n > budget else "all",
+        "projection": "pca" if d > 3 else None,
+        "explained_variance": variance,
+        "dtype": "float32",
+        "bounds": [pos.min(axis=0).tolist(), pos.max(axis=0).tolist()],
+        "positions": _b64(pos),
+        "colors": _b64(colors) if colors is not None else None,
+        "legend": legend,
+    })
+    # 兼容旧的特征空间视图：从采样结果里等间隔取一小部分
+    stride = max(-(-idx.size // _LEGACY_POINTS), 1)
+    legacy = [{"pos": p} for p in np.round(pos[::stride].astype(np.float64), 4).tolist()]
+    if codes is not None:
+        # legend 只包含采样后出现的类别，颜色按采样结果的类别下标取
+        for point, code in zip(legacy, codes[::stride].tolist()):
+            point["color"] = legend["palette"][code]
+    return log_metric("ml_points", legacy)
+
+
+# ---- watch 的类型分发：处理函数按类型注册，每个具体类只解析一次；
+# 框架类型写成 "模块.类名"，只在该模块已在 sys.modules 中时解析，从不为判断类型而导入框架 ----
+_WATCH_HANDLERS = []
+_watch_cache = {}
+# DataFrame 数值列分块统计的行数，避免一次把整张表转成 float64
+_FRAME_CHUNK_ROWS = 100000
+_SUMMARY_TOP = 5
+_SUMMARY_TEXT_MAX = 200
+
+
+def register_watch(type_or_name, fn=None):
+    """注册 watch 的处理函数 fn(obj, name, **options)，可作装饰器使用"""
+    def add(f):
+        _WATCH_HANDLERS.append((type_or_name, f))
+        _watch_cache.clear()
+        return f
+    return add if fn is None else add(fn)
+
+
+def _resolve_type(spec):
+    if isinstance(spec, type):
+        return spec
+    module, _, attr = spec.rpartition(".")
+    mod = sys.modules.get(module)
+    found = getattr(mod, attr, None) if mod is not None else None
+    return found if isinstance(found, type) else None
+
+
+def _watch_handler(cls):
+    try:
+        return _watch_cache[cls]
+    except KeyError:
+        pass
+    mro = cls.__mro__
+    best, best_rank = None, len(mro)
+    # 能匹配到的对象必然来自已导入的模块，所以缓存结果（包括未匹配）不会因之后的导入而失效
+    for spec, fn in _WATCH_HANDLERS:
+        t = _resolve_type(spec)
+        if t is not None and t in mro and mro.index(t) <= best_rank:
+            best, best_rank = fn, mro.index(t)
+    _watch_cache[cls] = best
+    return best
+
+
+def _short_repr(value):
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= _SUMMARY_TEXT_MAX else text[:_SUMMARY_TEXT_MAX] + "..."
+
+
+def _array_summary(arr):
+    import numpy as np
+    out = {"shape": list(arr.shape), "dtype": str(arr.dtype)}
+    if arr.size and arr.dtype.kind in "biuf":
+        finite = np.isfinite(arr) if arr.dtype.kind == "f" else None
+        vals = arr[finite] if finite is not None else arr
+        out["nan"] = int(np.isnan(arr).sum()) if finite is not None else 0
+        out["inf"] = int(np.isinf(arr).sum()) if finite is not None else 0
+        if vals.size:
+            out.update(min=float(vals.min()), max=float(vals.max()), mean=float(vals.mean()), std=float(vals.std()))
+    return out
+
+
+@register_watch("torch.nn.Module")
+def _watch_torch_module(obj, name, example_input=None, **options):
+    print("DeepInsight: Detected PyTorch Model. Extracting structure...")
+    return log_model(obj, example_input)
+
+
+@register_watch("torch.Tensor")
+def _watch_tensor(obj, name, **options):
+    import torch
+    if torch.isnan(obj).any():
+        print(f"⚠️ DeepInsight Warning: NaN detected in tensor {name or ''}!")
+    arr = obj.detach().cpu().numpy()
+    if arr.ndim == 2 and arr.shape[1] >= 2 and arr.dtype.kind in "biuf":
+        return log_points(arr, name=name, **options)
+    return log_metric(name or "tensor", arr)
+
+
+@register_watch("numpy.ndarray")
+def _watch_ndarray(obj, name, **options):
+    # 二维数值数组画点云，其余数组只输出统计摘要，不整体序列化
+    if obj.ndim == 2 and obj.shape[1] >= 2 and obj.dtype.kind in "biuf":
+        return log_points(obj, name=name, **options)
+    return log_metric(name or "array", _array_summary(obj))
+
+
+@register_watch(list)
+def _watch_list(obj, name, **options):
+    if obj and isinstance(obj[0], (list, tuple)):
+        try:
+            import numpy as np
+        except ImportError:
+            points = [{"pos": (list(row[:3]) + [0]*3)[:3]} for row in obj[:500]]
+            return log_metric("ml_points", points)
+        arr = np.asarray(obj)
+        if arr.ndim == 2 and arr.shape[1] >= 2 and arr.dtype.kind in "biuf":
+            return log_points(arr, name=name, **options)
+    return log_metric(name or "data", obj)
+
+
+@register_watch(int)
+@register_watch(float)
+@register_watch(str)
+@register_watch(dict)
+def _watch_plain(obj, name, **options):
+    return log_metric(name or "data", obj)
+
+
+@register_watch("pandas.DataFrame")
+def _watch_dataframe(obj, name, chunk_rows=_FRAME_CHUNK_ROWS, **options):
+    """逐列类型、空值数；数值列按行分块统计后合并（Chan 等的并行方差合并），非数值列给出基数与高频取值"""
+    import numpy as np
+    rows = len(obj)
+    numeric = obj.select_dtypes(include="number").columns
+    acc = {c: [0, 0.0, 0.0, np.inf, -np.inf] for c in numeric}  # count, mean, M2, min, max
+    chunk_rows = max(int(chunk_rows), 1)
+    for start in range(0, rows if len(numeric) else 0, chunk_rows):
+        block = obj.iloc[start:start + chunk_rows][numeric].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(block)
+        filled = np.where(valid, block, 0.0)
+        counts = valid.sum(axis=0)
+        means = filled.sum(axis=0) / np.maximum(counts, 1)
+        m2s = np.where(valid, (block - means) ** 2, 0.0).sum(axis=0)
+        mins = np.where(valid, block, np.inf).min(axis=0)
+        maxs = np.where(valid, block, -np.inf).max(axis=0)
+        for i, c in enumerate(numeric):
+            a = acc[c]
+            n_b = int(counts[i])
+            if n_b:
+                n = a[0] + n_b
+                delta = float(means[i]) - a[1]
+                a[2] += float(m2s[i]) + delta * delta * a[0] * n_b / n
+                a[1] += delta * n_b / n
+                a[0] = n
+            a[3] = min(a[3], float(mins[i])); a[4] = max(a[4], float(maxs[i]))
+    columns = []
+    for c in obj.columns:
+        col = {"name": str(c), "dtype": str(obj[c].dtype)}
+        if c in acc:
+            n, mean, m2, lo, hi = acc[c]
+            col["nulls"] = rows - n
+            if n:
+                col.update(mean=mean, std=(m2 / n) ** 0.5, min=lo, max=hi)
+        else:
+            series = obj[c]
+            col["nulls"] = int(series.isna().sum())
+            try:
+                col["unique"] = int(series.nunique())
+                col["top"] = [[_short_repr(k), int(v)] for k, v in series.value_counts().head(_SUMMARY_TOP).items()]
+            except TypeError:
+                # 列表等不可哈希的取值无法计数
+                pass
+        columns.append(col)
+    return log_metric("dataframe_summary", {
+        "name": name,
+        "rows": rows,
+        "memory_bytes": int(obj.memory_usage(deep=False).sum()),
+        "columns": columns,
+    })
+
+
+def _watch_sparse(obj, name, **options):
+    """形状、非零数、密度与每行非零数分布；数值统计只在非零值数组上计算"""
+    import numpy as np
+    m = obj.tocsr()
+    per_row = np.diff(m.indptr)
+    data = m.data
+    out = {
+        "name": name,
+        "format": obj.format,
+        "shape": list(obj.shape),
+        "dtype": str(obj.dtype),
+        "nnz": int(m.nnz),
+        "density": float(m.nnz) / max(obj.shape[0] * obj.shape[1], 1),
+        "row_nnz": {
+            "min": int(per_row.min()) if per_row.size else 0,
+            "mean": float(per_row.mean()) if per_row.size else 0.0,
+            "max": int(per_row.max()) if per_row.size else 0,
+            "empty_rows": int((per_row == 0).sum()),
+        },
+    }
+    if data.size and data.dtype.kind in "biuf":
+        out["values"] = {"min": float(data.min()), "max": float(data.max()), "mean": float(data.mean())}
+    return log_metric("sparse_summary", out)
+
+
+register_watch("scipy.sparse.spmatrix", _watch_sparse)
+register_watch("scipy.sparse.sparray", _watch_sparse)
+
+
+@register_watch("sklearn.base.BaseEstimator")
+def _watch_estimator(obj, name, **options):
+    """超参数与拟合得到的属性（数组只记形状与统计，不输出全部数值）"""
+    import numpy as np
+    params = {
+        k: v if v is None or isinstance(v, (int, float, str, bool)) else _short_repr(v)
+        for k, v in obj.get_params(deep=False).items()
+    }
+    fitted = {}
+    for key, value in vars(obj).items():
+        if not key.endswith("_") or key.startswith("_"):
+            continue
+        if isinstance(value, np.ndarray):
+            fitted[key] = _array_summary(value) if value.size > _SUMMARY_TOP else {"shape": list(value.shape), "value": value.tolist()}
+        elif isinstance(value, (int, float, str, bool)):
+            fitted[key] = value
+        else:
+            fitted[key] = _short_repr(value)
+    return log_metric("estimator_summary", {
+        "name": name,
+        "class": f"{type(obj).__module__}.{type(obj).__qualname__}",
+        "params": params,
+        "fitted": fitted,
+        "is_fitted": bool(fitted),
+    })
+
+
+# ---- 模型结构图：节点为层/算子，边为张量（带形状），groups 为非叶子模块，前端可按层级折叠 ----
+# (结构签名, 输入签名) -> 图哈希；本进程已输出过的图哈希；模型对象 -> 已记录过的输入签名
+_model_graph_cache = {}
+_MODEL_GRAPH_CACHE_MAX = 32
+_model_graphs_sent = set()
+_model_seen = weakref.WeakKeyDictionary()
+_NODE_SPACING_Y = 100
+
+
+def _model_signature(model):
+    """结构哈希：模块路径与类型、参数与缓冲区的形状；权重数值变化不影响结果"""
+    h = hashlib.sha1()
+    for name, m in model.named_modules():
+        h.update(f"m {name} {type(m).__module__}.{type(m).__qualname__}\n".encode())
+    for name, p in model.named_parameters():
+        h.update(f"p {name} {tuple(p.shape)} {p.dtype}\n".encode())
+    for name, b in model.named_buffers():
+        h.update(f"b {name} {tuple(b.shape)} {b.dtype}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def _as_args(example_input):
+    if example_input is None:
+        return ()
+    return tuple(example_input) if isinstance(example_input, (tuple, list)) else (example_input,)
+
+
+def _input_signature(example_input):
+    return tuple(
+        (tuple(a.shape), str(a.dtype)) if hasattr(a, "shape") else type(a).__name__
+        for a in _as_args(example_input)
+    )
+
+
+def _shape_of(value):
+    """张量或（嵌套的）张量元组的形状；fx 的 tensor_meta 同样适用"""
+    shape = getattr(value, "shape", None)
+    if shape is not None:
+        return list(shape)
+    if isinstance(value, (tuple, list)):
+        shapes = [_shape_of(v) for v in value]
+        return shapes if any(sh is not None for sh in shapes) else None
+    if isinstance(value, dict):
+        return _shape_of(list(value.values()))
+    return None
+
+
+def _shape_label(shape):
+    if shape is None:
+        return None
+    if shape and all(isinstance(d, int) for d in shape):
+        return "×".join(str(d) for d in shape)
+    return ", ".join(_shape_label(sh) or "?" for sh in shape)
+
+
+def _module_groups(model):
+    """非叶子模块 {路径: {type, parent, params(含子模块)}} 与叶子模块的参数量"""
+    groups, leaf_params = {}, {}
+    for path, m in model.named_modules():
+        if not path:
+            continue
+        params = sum(p.numel() for p in m.parameters())
+        if any(True for _ in m.children()):
+            groups[path] = {"type": type(m).__name__, "parent": path.rpartition(".")[0] or None, "params": params}
+        else:
+            leaf_params[path] = params
+    return groups, leaf_params
+
+
+def _graph_payload(model, nodes, edges, method):
+    groups, leaf_params = _module_groups(model)
+    for i, n in enumerate(nodes):
+        n["type"] = "layer"
+        n["position"] = {"x": 250, "y": i * _NODE_SPACING_Y}
+        module = n["data"].get("module")
+        if module in leaf_params:
+            n["data"]["params"] = f"{leaf_params[module]:,}"
+    for i, e in enumerate(edges):
+        e["id"] = f"e-{i}"
+        label = _shape_label(e.get("data", {}).get("shape"))
+        if label:
+            e["label"] = label
+    used = {n["data"].get("group") for n in nodes}
+    # 只保留包含节点的分组及其祖先
+    keep = set()
+    for g in used:
+        while g and g not in keep:
+            keep.add(g)
+            g = groups.get(g, {}).get("parent")
+    return {
+        "method": method,
+        "nodes": nodes,
+        "edges": edges,
+        "groups": [{**groups[g], "id": g} for g in sorted(keep) if g in groups],
+    }
+
+
+def _graph_fx(torch, model, args):
+    import torch.fx
+    gm = torch.fx.symbolic_trace(model)
+    if args:
+        try:
+            from torch.fx.passes.shape_prop import ShapeProp
+            with torch.no_grad():
+                ShapeProp(gm).propagate(*args)
+        except Exception:
+            # 形状传播失败时仍保留图结构
+            pass
+    nodes, edges = [], []
+    for node in gm.graph.nodes:
+        if node.op == "call_module":
+            target = str(node.target)
+            kind, group = type(gm.get_submodule(target)).__name__, target.rpartition(".")[0] or None
+        else:
+            stack = node.meta.get("nn_module_stack") or {}
+            group = next(reversed(stack), None) if stack else None
+            group = group if isinstance(group, str) and group else None
+            if node.op == "placeholder":
+                kind = "Input"
+            elif node.op == "output":
+                kind = "Output"
+            elif node.op == "get_attr":
+                kind = "Parameter"
+            else:
+                kind = getattr(node.target, "__name__", str(node.target))
+        target = str(node.target) if node.op == "call_module" else None
+        nodes.append({"id": node.name, "data": {"type": kind, "label": node.name, "op": node.op, "module": target, "group": group}})
+        for src in node.all_input_nodes:
+            meta = src.meta.get("tensor_meta")
+            edges.append({"source": src.name, "target": node.name, "data": {"shape": _shape_of(meta) if meta is not None else None}})
+    return _graph_payload(model, nodes, edges, "fx")
+
+
+def _graph_hooks(torch, model, args):
+    """跑一次前向，用模块钩子和 TorchFunctionMode 记录数据流"""
+    from torch.overrides import TorchFunctionMode
+    leaves = {m: path for path, m in model.named_modules() if path and not any(True for _ in m.children())}
+    paths = {m: path for path, m in model.named_modules()}
+    # keep 持有追踪期间的所有张量，避免按 id 连边时 id 被复用
+    nodes, edges, keep = [], [], []
+    producer = {}
+    stack = []
+    state = {"depth": 0, "ops": 0}
+    seen = {}
+
+    def tensors(obj):
+        if isinstance(obj, torch.Tensor):
+            yield obj
+        elif isinstance(obj, (tuple, list)):
+            for o in obj:
+                yield from tensors(o)
+        elif isinstance(obj, dict):
+            for o in obj.values():
+                yield from tensors(o)
+
+    def add(node_id, kind, inputs, module=None):
+        group = next((p for p in reversed(stack) if p and p != module), None)
+        nodes.append({"id": node_id, "data": {"type": kind, "label": node_id, "module": module, "group": group}})
+        linked = set()
+        for t in tensors(inputs):
+            src = producer.get(id(t))
+            if src is not None and src not in linked:
+                linked.add(src)
+                edges.append({"source": src, "target": node_id, "data": {"shape": list(t.shape)}})
+
+    def mark(node_id, out):
+        for t in tensors(out):
+            producer[id(t)] = node_id
+            keep.append(t)
+
+    def pre(module, inputs):
+        stack.append(paths.get(module, ""))
+        if module in leaves:
+            state["depth"] += 1
+
+    def post(module, inputs, out):
+        stack.pop()
+        if module not in leaves:
+            return
+        state["depth"] -= 1
+        path = leaves[module]
+        seen[path] = seen.get(path, 0) + 1
+        node_id = path if seen[path] == 1 else f"{path}#{seen[path]}"
+        add(node_id, type(module).__name__, inputs, module=path)
+        mark(node_id, out)
+
+    class Ops(TorchFunctionMode):
+        def __torch_function__(self, func, types, a=(), kw=None):
+            out = func(*a, **(kw or {}))
+            if state["depth"] == 0 and any(True for _ in tensors(out)):
+                ins = (a, kw or {})
+                if any(id(t) in producer for t in tensors(ins)):
+                    # Tensor.__add__ 等运算符方法与 fx 的命名保持一致
+                    name = getattr(func, "__name__", "op").strip("_")
+                    state["ops"] += 1
+                    node_id = f"{name}_{state['ops']}"
+                    add(node_id, name, ins)
+                    mark(node_id, out)
+            return out
+
+    for i, a in enumerate(args):
+        if isinstance(a, torch.Tensor):
+            nodes.append({"id": f"input_{i}", "data": {"type": "Input", "label": f"input_{i}", "module": None, "group": None}})
+            mark(f"input_{i}", a)
+    handles = []
+    try:
+        for m in paths:
+            handles.append(m.register_forward_pre_hook(pre))
+            handles.append(m.register_forward_hook(post))
+        with torch.no_grad(), Ops():
+            out = model(*args)
+    finally:
+        for h in handles:
+            h.remove()
+    add("output", "Output", out)
+    return _graph_payload(model, nodes, edges, "hooks")
+
+
+def _graph_modules(model):
+    """最后的退路：叶子模块按注册顺序线性连接"""
+    nodes, edges = [], []
+    for path, m in model.named_modules():
+        if path and not any(True for _ in m.children()):
+            nodes.append({"id": path, "data": {"type": type(m).__name__, "label": path, "module": path, "group": path.rpartition(".")[0] or None}})
+            if len(nodes) > 1:
+                edges.append({"source": nodes[-2]["id"], "target": path, "data": {"shape": None}})
+    return _graph_payload(model, nodes, edges, "modules")
+
+
+def _model_graph(model, example_input=None):
+    import torch
+    args = _as_args(example_input)
+    try:
+        return _graph_fx(torch, model, args)
+    except Exception as e:
+        fx_error = f"{type(e).__name__}: {e}"
+    if args:
+        try:
+            graph = _graph_hooks(torch, model, args)
+            graph["fx_error"] = fx_error[:_SUMMARY_TEXT_MAX]
+            return graph
+        except Exception:
+            pass
+    graph = _graph_modules(model)
+    graph["fx_error"] = fx_error[:_SUMMARY_TEXT_MAX]
+    return graph
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+from .spans import DurationStats
+
+# Agent 追踪：SDK 的 agent_episode / agent_span / tool 产生带 agent 属性的 span（见 spans.py）。
+# 内核把它们精简后增量推给前端，按工具名聚合延迟分位数；根 span（episode）到达时计算该任务的关键路径：
+# 从结束时刻往回，每次选在当前游标之前最晚结束的子 span，递归展开
+_CRITICAL_EPS_US = 1
+# 单个未结束任务最多缓存的 span 数，超出后不再计算关键路径
+EPISODE_SPANS_MAX = 50000
+
+
+def _compact(ev: dict[str, Any]) -> dict[str, Any]:
+    args = ev["args"]
+    return {
+        "id": args.get("id"),
+        "parent": args.get("parent"),
+        "episode": args.get("episode"),
+        "role": args.get("agent"),
+        "name": ev["name"],
+        "content": args.get("content"),
+        "result": args.get("result"),
+        "error": args.get("error"),
+        "source": args.get("source"),
+        "ts": ev["ts"],
+        "dur": ev["dur"],
+    }
+
+
+def critical_path(spans: dict[Any, dict[str, Any]], root_id: Any) -> list[dict[str, Any]]:
+    """返回关键路径上的 span（先序），每项带自身耗时 self_ms = 时长 - 路径上子 span 的时长"""
+    children: dict[Any, list[dict[str, Any]]] = {}
+    for sp in spans.values():
+        children.setdefault(sp["parent"], []).append(sp)
+    out: list[dict[str, Any]] = []
+
+    def walk(node: dict[str, Any]) -> None:
+        cursor = node["ts"] + node["dur"]
+        chosen: list[dict[str, Any]] = []
+        for child in sorted(children.get(node["id"], []), key=lambda c: c["ts"] + c["dur"], reverse=True):
+            if child["ts"] + child["dur"] <= cursor + _CRITICAL_EPS_US and child["dur"] > 0:
+                chosen.append(child)
+                cursor = child["ts"]
+        chosen.reverse()
+        entry = {
+            "id": node["id"],
+            "name": node["name"],
+            "role": node["role"],
+            "dur_ms": round(node["dur"] / 1000, 3),
+            "self_ms": round((node["dur"] - sum(c["dur"] for c in chosen)) / 1000, 3),
+        }
+        out.append(entry)
+        for child in chosen:
+            walk(child)
+
+    root = spans.get(root_id)
+    if root is not None:
+        walk(root)
+    return out
+
+
+class AgentTraceCollector:
+    def __init__(self) -> None:
+        self.tools: dict[str, DurationStats] = {}
+        self.tool_errors: dict[str, int] = {}
+        self.episodes = 0
+        self._open: dict[tuple[int, Any], dict[Any, dict[str, Any]]] = {}
+
+    def add(self, events: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """处理一批 trace 事件，返回 (精简后的 agent span, 本批结束的任务摘要)"""
+        compact: list[dict[str, Any]] = []
+        finished: list[dict[str, Any]] = []
+        for ev in events:
+            # 任务内的普通 span 也带 episode，保证父子链完整
+            if "agent" not in ev["args"] and "episode" not in ev["args"]:
+                continue
+            sp = _compact(ev)
+            compact.append(sp)
+            if sp["role"] == "tool":
+                stats = self.tools.get(sp["name"])
+                if stats is None:
+                    stats = self.tools[sp["name"]] = DurationStats(seed=len(self.tools))
+                stats.add(int(sp["dur"]))
+                if sp["error"]:
+                    self.tool_errors[sp["name"]] = self.tool_errors.get(sp["name"], 0) + 1
+            if sp["episode"] is None:
+                continue
+            key = (ev["pid"], sp["episode"])
+            bucket = self._open.setdefault(key, {})
+            if len(bucket) < EPISODE_SPANS_MAX:
+                bucket[sp["id"]] = sp
+            if sp["id"] == sp["episode"]:
+                finished.append(self._finish(self._open.pop(key), sp))
+        return compact, finished
+
+    def _finish(self, spans: dict[Any, dict[str, Any]], root: dict[str, Any]) -> dict[str, Any]:
+        self.episodes += 1
+        path = critical_path(spans, root["id"])
+        bottleneck: Optional[dict[str, Any]] = max(path[1:], key=lambda p: p["self_ms"], default=None)
+        return {
+            "episode": root["id"],
+            "name": root["name"],
+            "duration_ms": round(root["dur"] / 1000, 3),
+            "spans": len(spans),
+            "error": root["error"],
+            "critical_path": path,
+            "bottleneck": bottleneck,
+        }
+
+    def tool_summary(self) -> dict[str, Any]:
+        ordered = sorted(self.tools.items(), key=lambda kv: kv[1].total_us, reverse=True)
+        return {name: {**st.summary(), "errors": self.tool_errors.get(name, 0)} for name, st in ordered}
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, fields
+from fnmatch import fnmatchcase
+from typing import Any, Literal, Optional
+
+# 标量指标的在线异常检测：每条 series 只保留常数个统计量（Welford 均值/方差、EWMA 均值/方差、
+# 平滑后的历史最优值），每来一个点 O(1) 更新，检测 NaN/Inf、尖峰、发散与平台期
+Direction = Literal["min", "max"]
+AlertKind = Literal["nan", "spike", "divergence", "plateau"]
+
+_MIN_HINTS = ("loss", "error", "err", "perplexity", "ppl", "mse", "mae", "rmse", "nll")
+_MAX_HINTS = ("acc", "f1", "auc", "precision", "recall", "reward", "return", "score", "bleu", "iou", "map")
+_EPS = 1e-12
+
+
+@dataclass(frozen=True)
+class AlertConfig:
+    enabled: bool = True
+    # None 时按名称推断：loss/error 类越小越好，acc/reward 类越大越好；推断不出则只检测 NaN/Inf
+    direction: Optional[Direction] = None
+    warmup: int = 20
+    ewma_alpha: float = 0.05
+    # 偏离 EWMA 超过 spike_z 个标准差（且朝变坏方向）视为尖峰
+    spike_z: float = 6.0
+    # 仅对越小越好的指标：平滑值比历史最优高出 divergence_ratio * |最优值| 视为发散
+    divergence_ratio: float = 1.0
+    # 连续 plateau_patience 个点没有相对改善 plateau_min_delta 视为平台期；0 表示关闭
+    plateau_patience: int = 1000
+    plateau_min_delta: float = 1e-3
+    # 同一类告警至少间隔多少个点才会再次触发
+    cooldown: int = 200
+    # 触发 nan/spike/divergence 告警时经控制通道请求子进程优雅停止
+    stop_run: bool = False
+
+
+def infer_direction(name: str) -> Optional[Direction]:
+    low = name.lower()
+    if any(k in low for k in _MIN_HINTS):
+        return "min"
+    if any(k in low for k in _MAX_HINTS):
+        return "max"
+    return None
+
+
+def _coerce_option(pattern: Any, key: str, value: Any, default: Any) -> Any:
+    # 按字段默认值的类型解析；在这里报错，避免坏值到了逐点检测时才在 stdout 回调里抛出
+    where = f"alerts[{pattern!r}].{key}"
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{where} must be a boolean")
+        return value
+    if isinstance(value, bool):
+        raise ValueError(f"{where} must be a number")
+    try:
+        num = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where} must be a number") from None
+    if not math.isfinite(num) or num < 0:
+        raise ValueError(f"{where} must be a finite number >= 0")
+    if key == "ewma_alpha" and not 0 < num <= 1:
+        raise ValueError(f"{where} must be in (0, 1]")
+    if isinstance(default, int):
+        if not num.is_integer():
+            raise ValueError(f"{where} must be an integer")
+        return int(num)
+    return num
+
+
+def parse_alert_config(raw: Any) -> dict[str, AlertConfig]:
+    """解析 exec 消息里的 alerts：{指标名或通配符: {字段: 值} | false}"""
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("alerts must be an object")
+    defaults = {f.name: f.default for f in fields(AlertConfig)}
+    out: dict[str, AlertConfig] = {}
+    for pattern, spec in raw.items():
+        if spec is False:
+            out[str(pattern)] = AlertConfig(enabled=False)
+            continue
+        if not isinstance(spec, dict):
+            raise ValueError(f"alerts[{pattern!r}] must be an object or false")
+        unknown = set(spec) - set(defaults)
+        if unknown:
+            raise ValueError(f"unknown alert option: {sorted(unknown)[0]}")
+        if spec.get("direction") not in (None, "min", "max"):
+            raise ValueError(f"alerts[{pattern!r}].direction must be 'min' or 'max'")
+        opts = {k: v if k == "direction" else _coerce_option(pattern, k, v, defaults[k]) for k, v in spec.items()}
+        out[str(pattern)] = AlertConfig(**opts)
+    return out
+
+
+class SeriesMonitor:
+    __slots__ = (
+        "name", "cfg", "direction", "n", "mean", "m2", "ew_mean", "ew_var",
+        "best", "best_step", "since_best", "plateau_open", "last_fired",
+    )
+
+    def __init__(self, name: str, cfg: AlertConfig) -> None:
+        self.name = name
+        self.cfg = cfg
+        self.direction = cfg.direction or infer_direction(name)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ew_mean = 0.0
+        self.ew_var = 0.0
+        self.best = math.nan
+        self.best_step = 0
+        self.since_best = 0
+        self.plateau_open = False
+        self.last_fired: dict[str, int] = {}
+
+    def _fire(self, kind: AlertKind, step: int, value: float, message: str, alerts: list[dict[str, Any]]) -> None:
+        last = self.last_fired.get(kind)
+        if last is not None and self.n - last < self.cfg.cooldown:
+            return
+        self.last_fired[kind] = self.n
+        alerts.append(
+            {
+                "name": self.name,
+                "kind": kind,
+                "step": step,
+                "value": value if math.isfinite(value) else None,
+                "message": message,
+                "severity": "warning" if kind == "plateau" else "error",
+                "mean": self.mean,
+                "std": math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0,
+                "best": self.best if math.isfinite(self.best) else None,
+                "best_step": self.best_step,
+                "stop_run": self.cfg.stop_run and kind != "plateau",
+            }
+        )
+
+    def update(self, step: int, value: float) -> list[dict[str, Any]]:
+        alerts: list[dict[str, Any]] = []
+        cfg = self.cfg
+        if not math.isfinite(value):
+            self._fire("nan", step, value, f"{self.name} 在 step {step} 出现 {value}", alerts)
+            return alerts
+
+        # 尖峰只以截断后的幅度进入 EWMA，单个离群点不会把平滑值拖成“发散”
+        clip = math.inf
+        if self.n >= cfg.warmup and self.direction is not None:
+            std = math.sqrt(self.ew_var)
+            if std > _EPS:
+                clip = cfg.spike_z * std
+                z = (value - self.ew_mean) / std
+                worse = z if self.direction == "min" else -z
+                if worse > cfg.spike_z:
+                    self._fire(
+                        "spike", step, value,
+                        f"{self.name} 在 step {step} 突变为 {value:.6g}（偏离滑动均值 {self.ew_mean:.6g} 约 {worse:.1f}σ）",
+                        alerts,
+                    )
+
+        # Welford
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        # EWMA 均值/方差；第一个点直接作为初值
+        if self.n == 1:
+            self.ew_mean = value
+        else:
+            a = cfg.ewma_alpha
+            d = min(max(value - self.ew_mean, -clip), clip)
+            self.ew_mean += a * d
+            self.ew_var = (1 - a) * (self.ew_var + a * d * d)
+
+        if self.direction is None or self.n < cfg.warmup:
+            return alerts
+        # 用平滑值追踪历史最优，避免被单点噪声刷新
+        ew = self.ew_mean
+        scale = max(abs(self.best), _EPS) if math.isfinite(self.best) else _EPS
+        if not math.isfinite(self.best):
+            improved = True
+        elif self.direction == "min":
+            improved = self.best - ew > cfg.plateau_min_delta * scale
+        else:
+            improved = ew - self.best > cfg.plateau_min_delta * scale
+        if improved:
+            self.best = ew
+            self.best_step = step
+            self.since_best = 0
+            self.plateau_open = False
+        else:
+            if (ew < self.best) if self.direction == "min" else (ew > self.best):
+                # 小幅改善仍更新最优值，但不重置平台期计数
+                self.best = ew
+            self.since_best += 1
+
+        if self.direction == "min" and ew - self.best > cfg.divergence_ratio * max(abs(self.best), _EPS):
+            self._fire(
+                "divergence", step, value,
+                f"{self.name} 发散：滑动均值 {ew:.6g} 远高于 step {self.best_step} 时的最优 {self.best:.6g}",
+                alerts,
+            )
+        if cfg.plateau_patience > 0 and not self.plateau_open and self.since_best >= cfg.plateau_patience:
+            self.plateau_open = True
+            self._fire(
+                "plateau", step, value,
+                f"{self.name} 已连续 {self.since_best} 个点没有明显改善（最优 {self.best:.6g} @ step {self.best_step}）",
+                alerts,
+            )
+        return alerts
+
+
+class MetricMonitor:
+    """单次运行内所有标量指标的监控器；配置按精确名、通配符、'*' 的顺序匹配"""
+
+    def __init__(self, configs: Optional[dict[str, AlertConfig]] = None) -> None:
+        self.configs = configs or {}
+        self.series: dict[str, Optional[SeriesMonitor]] = {}
+        self.fired: list[dict[str, Any]] = []
+
+    def _config_for(self, name: str) -> AlertConfig:
+        if name in self.configs:
+            return self.configs[name]
+        for pattern, cfg in self.configs.items():
+            if pattern != "*" and fnmatchcase(name, pattern):
+                return cfg
+        return self.configs.get("*", AlertConfig())
+
+    def observe(self, name: str, value: Any, step: int) -> list[dict[str, Any]]:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return []
+        mon = self.series.get(name, False)
+        if mon is False:
+            cfg = self._config_for(name)
+            mon = SeriesMonitor(name, cfg) if cfg.enabled else None
+            self.series[name] = mon
+        if mon is None:
+            return []
+        alerts = mon.update(step, float(value))
+        self.fired.extend(alerts)
+        return alerts
@@ -1,22 +1,211 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import sys
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
 
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
+from .archive import export_runs, import_archive, media_type, resolve_format
+from .graph_layout import get_layout_cache, public_layout
+from .profiler import FlameGraph
+from .query import compare_runs, query_series, to_json_list
+from .search import SearchUnavailableError, get_search_index
+from .spans import chrome_trace_chunks
+from .store import LOG_RANGE_LIMIT, get_store
 from .ws import handle_ws
 
 
+async def _stream_chunks(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    # 存储只在事件循环线程里访问；每块之间让出循环，避免长导出卡住 WS
+    for chunk in chunks:
+        yield chunk
+        await asyncio.sleep(0)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # 后台增量维护日志全文索引，启动时补建历史 run
+    indexer = asyncio.create_task(get_search_index().run())
+    try:
+        yield
+    finally:
+        indexer.cancel()
+
+
 def create_app() -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=_lifespan)
 
     @app.get("/")
     def read_root():
         return {"Status": "DeepInsight Kernel Running", "Python": sys.version}
 
+    # 存储的公开读写方法有锁，耗时的查询放进 to_thread；iter_* 迭代器不受锁保护，只能在事件循环线程里用
+    @app.get("/runs")
+    async def list_runs():
+        return {"runs": get_store().list_runs()}
+
+    @app.post("/runs/import")
+    async def import_runs(request: Request):
+        with tempfile.TemporaryDirectory(prefix="deepinsight_import_") as tmp:
+            path = Path(tmp) / "archive"
+            with open(path, "wb") as f:
+                async for chunk in request.stream():
+                    f.write(chunk)
+            try:
+                run_ids = await asyncio.to_thread(import_archive, get_store(), path)
+            except (ValueError, KeyError) as e:
+                raise HTTPException(status_code=400, detail=f"invalid archive: {e}")
+        # 导入的 run 已结束，登记后由后台任务一次补齐其日志索引
+        for run_id in run_ids:
+            try:
+                await get_search_index().watch(run_id)
+            except Exception as e:
+                print(f"Failed to index run {run_id}: {e}")
+        return {"run_ids": run_ids}
+
+    @app.get("/runs/{run_id}")
+    async def get_run(run_id: str):
+        try:
+            run = get_store().get_run(run_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if run is None:
+            raise HTTPException(status_code=404, detail="run not found")
+        return run
+
+    @app.get("/runs/{run_id}/series/{name:path}")
+    async def get_series(
+        run_id: str,
+        name: str,
+        step_from: Optional[int] = None,
+        step_to: Optional[int] = None,
+        max_points: Optional[int] = None,
+        method: str = "lttb",
+    ):
+        try:
+            if max_points is not None:
+                return await asyncio.to_thread(query_series, get_store(), run_id, name, step_from, step_to, max_points, method)
+            steps, ts, values = await asyncio.to_thread(get_store().read_series, run_id, name, step_from, step_to)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            "run_id": run_id,
+            "name": name,
+            "steps": steps.tolist(),
+            "ts": ts.tolist(),
+            "values": to_json_list(values),
+        }
+
+    @app.get("/runs/{run_id}/profile")
+    async def get_profile(run_id: str, format: str = "tree", min_fraction: float = 0.002):
+        try:
+            folded = get_store().read_artifact(run_id, "profile.folded")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if folded is None:
+            raise HTTPException(status_code=404, detail="profile not found")
+        if format == "folded":
+            return PlainTextResponse(folded)
+        if format != "tree":
+            raise HTTPException(status_code=400, detail="format must be tree or folded")
+        return {"run_id": run_id, **FlameGraph.from_folded(folded).to_dict(min_fraction)}
+
+    @app.get("/runs/{run_id}/line_profile")
+    async def get_line_profile(run_id: str):
+        try:
+            raw = get_store().read_artifact(run_id, "line_profile.json")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if raw is None:
+            raise HTTPException(status_code=404, detail="line profile not found")
+        return {"run_id": run_id, **json.loads(raw)}
+
+    @app.get("/runs/{run_id}/model_graph")
+    async def get_model_graph(run_id: str, expanded: Optional[str] = None):
+        """服务端布局后的模型结构图；expanded 为逗号分隔的展开分组，省略时返回默认折叠视图"""
+        layouts = get_layout_cache()
+        try:
+            graph = await asyncio.to_thread(layouts.for_run, get_store(), run_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if graph is None:
+            raise HTTPException(status_code=404, detail="model graph not found")
+        groups = [g for g in expanded.split(",") if g] if expanded is not None else None
+        return {"run_id": run_id, **public_layout(await asyncio.to_thread(layouts.layout, graph, groups))}
+
+    @app.get("/runs/{run_id}/trace")
+    async def get_trace(run_id: str):
+        store = get_store()
+        try:
+            if not store.has_run(run_id):
+                raise HTTPException(status_code=404, detail="run not found")
+            lines = store.iter_artifact_lines(run_id, "trace.ndjson")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return StreamingResponse(
+            _stream_chunks(chrome_trace_chunks(lines)),
+            media_type="application/json",
+            headers={"Content-Disposition": f'attachment; filename="trace-{run_id}.json"'},
+        )
+
+    @app.get("/runs/{run_id}/log")
+    async def get_log(run_id: str, from_line: int = 0, to_line: Optional[int] = None):
+        store = get_store()
+        end = from_line + LOG_RANGE_LIMIT if to_line is None else min(to_line, from_line + LOG_RANGE_LIMIT)
+        try:
+            lines = store.read_log(run_id, from_line, end)
+            total = store.log_line_count(run_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"run_id": run_id, "from_line": from_line, "lines": lines, "total_lines": total}
+
+    @app.get("/compare")
+    async def compare(run_ids: str, name: str, grid: str = "step", points: int = 500, mode: str = "min"):
+        ids = [r for r in run_ids.split(",") if r]
+        try:
+            return await asyncio.to_thread(compare_runs, get_store(), ids, name, grid, points, mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.get("/search")
+    async def search_logs(q: str, limit: int = 50):
+        try:
+            results = await get_search_index().search(q, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except SearchUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return {"query": q, "results": results}
+
+    @app.get("/export")
+    async def export(run_ids: str, format: str = "arrow"):
+        ids = [r for r in run_ids.split(",") if r]
+        store = get_store()
+        try:
+            fmt = resolve_format(format)
+            missing = [r for r in ids if not store.has_run(r)]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if missing:
+            raise HTTPException(status_code=404, detail=f"run not found: {missing[0]}")
+        ext = {"arrow": "arrows", "parquet": "parquet", "ndjson": "ndjson"}[fmt]
+        return StreamingResponse(
+            _stream_chunks(export_runs(store, ids, fmt)),
+            media_type=media_type(fmt),
+            headers={
+                "Content-Disposition": f'attachment; filename="deepinsight-runs.{ext}"',
+                "X-DeepInsight-Format": fmt,
+            },
+        )
+
     @app.websocket("/ws")
     async def websocket_endpoint(websocket: WebSocket):
         await handle_ws(websocket)
 
     return app
-
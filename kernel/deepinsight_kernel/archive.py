@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+import io
+import json
+import math
+import time
+from pathlib import Path
+from typing import Any, Iterator, Optional
+from uuid import uuid4
+
+import numpy as np
+
+from .store import RUN_ARTIFACTS, MetricStore
+
+# 归档统一为一张长表：每行是 run 元数据 / 标量点 / 非标量指标 / 一行日志 / 一行附件之一
+# 列：run_id, kind(run|metric|object|log|artifact), name, step, ts, value, text
+# artifact 行的 name 为附件文件名（RUN_ARTIFACTS），step 为行号，text 为该行内容
+ARCHIVE_FORMATS = ("arrow", "parquet", "ndjson")
+_CHUNK_POINTS = 65536
+_CHUNK_ROWS = 8192
+
+_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _load_pyarrow() -> Any:
+    try:
+        import pyarrow
+
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def resolve_format(fmt: str) -> str:
+    """没有 pyarrow 时 arrow/parquet 回退为 ndjson"""
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    if fmt != "ndjson" and _load_pyarrow() is None:
+        return "ndjson"
+    return fmt
+
+
+def media_type(fmt: str) -> str:
+    return _MEDIA_TYPES[fmt]
+
+
+def _iter_chunks(store: MetricStore, run_ids: list[str]) -> Iterator[dict[str, Any]]:
+    """按块产出列式数据，任何时刻只持有一个块"""
+
+    def rows_chunk(run_id: str, kind: str, rows: list[tuple[Optional[str], int, float, Optional[str]]]) -> dict[str, Any]:
+        n = len(rows)
+        return {
+            "run_id": [run_id] * n,
+            "kind": [kind] * n,
+            "name": [r[0] for r in rows],
+            "step": np.fromiter((r[1] for r in rows), dtype=np.int64, count=n),
+            "ts": np.fromiter((r[2] for r in rows), dtype=np.float64, count=n),
+            "value": np.full(n, np.nan),
+            "text": [r[3] for r in rows],
+        }
+
+    for run_id in run_ids:
+        meta = store.get_run(run_id)
+        if meta is None:
+            raise ValueError(f"run not found: {run_id}")
+        yield rows_chunk(run_id, "run", [(None, 0, float(meta.get("started_at") or 0.0), json.dumps(meta, ensure_ascii=False))])
+
+        for name in meta["series"]:
+            for steps, ts, values in store.iter_series_chunks(run_id, name, _CHUNK_POINTS):
+                n = len(steps)
+                yield {
+                    "run_id": [run_id] * n,
+                    "kind": ["metric"] * n,
+                    "name": [name] * n,
+                    "step": steps,
+                    "ts": ts,
+                    "value": values,
+                    "text": [None] * n,
+                }
+
+        rows: list[tuple[Optional[str], int, float, Optional[str]]] = []
+        for obj in store.iter_objects(run_id):
+            rows.append((obj.get("name"), int(obj.get("step", 0)), float(obj.get("ts", 0.0)), json.dumps(obj.get("value"), ensure_ascii=False)))
+            if len(rows) >= _CHUNK_ROWS:
+                yield rows_chunk(run_id, "object", rows)
+                rows = []
+        if rows:
+            yield rows_chunk(run_id, "object", rows)
+
+        rows = []
+        for i, rec in enumerate(store.iter_log(run_id)):
+            rows.append((rec.get("stream"), i, float(rec.get("ts", 0.0)), rec.get("data", "")))
+            if len(rows) >= _CHUNK_ROWS:
+                yield rows_chunk(run_id, "log", rows)
+                rows = []
+        if rows:
+            yield rows_chunk(run_id, "log", rows)
+
+        for artifact in RUN_ARTIFACTS:
+            rows = []
+            for i, line in enumerate(store.iter_artifact_lines(run_id, artifact)):
+                rows.append((artifact, i, 0.0, line.rstrip("\n")))
+                if len(rows) >= _CHUNK_ROWS:
+                    yield rows_chunk(run_id, "artifact", rows)
+                    rows = []
+            if rows:
+                yield rows_chunk(run_id, "artifact", rows)
+
+
+class _ByteSink(io.RawIOBase):
+    """pyarrow 写入端：缓冲写出的字节，由导出生成器逐块取走"""
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:
+        data = bytes(b)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def _arrow_schema(pa: Any) -> Any:
+    return pa.schema(
+        [
+            ("run_id", pa.string()),
+            ("kind", pa.string()),
+            ("name", pa.string()),
+            ("step", pa.int64()),
+            ("ts", pa.float64()),
+            ("value", pa.float64()),
+            ("text", pa.string()),
+        ]
+    )
+
+
+def _ndjson_lines(chunk: dict[str, Any]) -> bytes:
+    kind = chunk["kind"][0] if chunk["kind"] else None
+    lines = []
+    if kind == "metric":
+        values = chunk["value"]
+        finite = np.isfinite(values)
+        for name, run_id, step, ts, v, ok in zip(chunk["name"], chunk["run_id"], chunk["step"].tolist(), chunk["ts"].tolist(), values.tolist(), finite.tolist()):
+            lines.append(json.dumps({"kind": kind, "run_id": run_id, "name": name, "step": step, "ts": ts, "value": v if ok else None}, ensure_ascii=False))
+    else:
+        for name, run_id, step, ts, text in zip(chunk["name"], chunk["run_id"], chunk["step"].tolist(), chunk["ts"].tolist(), chunk["text"]):
+            lines.append(json.dumps({"kind": kind, "run_id": run_id, "name": name, "step": step, "ts": ts, "text": text}, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def export_runs(store: MetricStore, run_ids: list[str], fmt: str) -> Iterator[bytes]:
+    """流式导出若干 run；fmt 需先经过 resolve_format"""
+    if fmt == "ndjson":
+        for chunk in _iter_chunks(store, run_ids):
+            yield _ndjson_lines(chunk)
+        return
+
+    pa = _load_pyarrow()
+    schema = _arrow_schema(pa)
+    sink = _ByteSink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for chunk in _iter_chunks(store, run_ids):
+            batch = pa.record_batch([pa.array(chunk[f.name], type=f.type, from_pandas=True) for f in schema], schema=schema)
+            if fmt == "parquet":
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _detect_format(path: Path) -> str:
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head == b"PAR1":
+        return "parquet"
+    if head == b"\xff\xff\xff\xff":
+        return "arrow"
+    return "ndjson"
+
+
+class _Importer:
+    def __init__(self, store: MetricStore) -> None:
+        self.store = store
+        self.id_map: dict[str, str] = {}
+        self.metas: dict[str, dict[str, Any]] = {}
+        self.pending: dict[tuple[str, str], tuple[list[int], list[float], list[float]]] = {}
+        self.artifacts: dict[tuple[str, str], list[str]] = {}
+
+    def _target(self, run_id: str, meta: Optional[dict[str, Any]] = None) -> str:
+        target = self.id_map.get(run_id)
+        if target is None:
+            # 已存在同名 run 时分配新 id，避免覆盖本机历史
+            target = run_id if not self.store.has_run(run_id) else str(uuid4())
+            self.id_map[run_id] = target
+            m = dict(meta or {})
+            m.pop("series", None)
+            m["run_id"] = target
+            if target != run_id:
+                m["imported_from"] = run_id
+            self.metas[target] = m
+            self.store.start_run(target, m)
+        return target
+
+    def add(self, run_id: str, kind: str, name: Optional[str], step: int, ts: float, value: Any, text: Optional[str]) -> None:
+        if kind == "run":
+            self._target(run_id, json.loads(text) if text else None)
+            return
+        target = self._target(run_id)
+        if kind == "metric" and name is not None:
+            steps, tss, values = self.pending.setdefault((target, name), ([], [], []))
+            steps.append(step)
+            tss.append(ts)
+            values.append(math.nan if value is None else value)
+            if len(steps) >= _CHUNK_POINTS:
+                self._flush_points(target, name)
+        elif kind == "object" and name is not None:
+            self.store.append_metric(target, name, json.loads(text) if text else None, step, ts=ts)
+        elif kind == "log":
+            self.store.append_log(target, name or "stdout", text or "", ts=ts)
+        elif kind == "artifact" and name in RUN_ARTIFACTS:
+            lines = self.artifacts.setdefault((target, name), [])
+            lines.append(text or "")
+            if len(lines) >= _CHUNK_ROWS:
+                self.store.append_artifact(target, name, self.artifacts.pop((target, name)))
+
+    def add_points(self, run_id: str, name: str, steps: np.ndarray, ts: np.ndarray, values: np.ndarray) -> None:
+        target = self._target(run_id)
+        if (target, name) in self.pending:
+            self._flush_points(target, name)
+        self.store.append_points(target, name, steps, ts, values)
+
+    def _flush_points(self, target: str, name: str) -> None:
+        steps, tss, values = self.pending.pop((target, name))
+        self.store.append_points(target, name, np.asarray(steps), np.asarray(tss), np.asarray(values, dtype=np.float64))
+
+    def finish(self) -> list[str]:
+        for target, name in list(self.pending):
+            self._flush_points(target, name)
+        for (target, name), lines in self.artifacts.items():
+            self.store.append_artifact(target, name, lines)
+        self.artifacts.clear()
+        now = time.time()
+        for target, meta in self.metas.items():
+            fields = {k: v for k, v in meta.items() if k not in ("run_id", "series")}
+            # 导出时仍在运行的 run 在本机不会再有写入，导入后一律视为已结束
+            if fields.get("status") in (None, "running"):
+                fields.pop("status", None)
+            fields["imported_at"] = now
+            self.store.finish_run(target, **fields)
+        return list(self.metas)
+
+    def abort(self) -> None:
+        """导入中途失败：删除已创建的 run，不留下半截数据"""
+        for target in self.metas:
+            self.store.delete_run(target)
+        self.pending.clear()
+        self.artifacts.clear()
+
+
+def _checked_batches(pa: Any, batches: Iterator[Any], fmt: str) -> Iterator[Any]:
+    """逐批读取；截断的流在 pyarrow 里报 OSError，与写入存储的错误区分开，统一按归档损坏处理"""
+    while True:
+        try:
+            batch = next(batches)
+        except StopIteration:
+            return
+        except (OSError, pa.ArrowException) as e:
+            raise ValueError(f"truncated or corrupt {fmt} archive: {e}") from e
+        yield batch
+
+
+def _feed(importer: _Importer, path: Path) -> None:
+    fmt = _detect_format(path)
+    if fmt == "ndjson":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                importer.add(
+                    rec["run_id"],
+                    rec.get("kind", ""),
+                    rec.get("name"),
+                    int(rec.get("step") or 0),
+                    float(rec.get("ts") or 0.0),
+                    rec.get("value"),
+                    rec.get("text"),
+                )
+        return
+
+    pa = _load_pyarrow()
+    if pa is None:
+        raise ValueError(f"pyarrow is required to import {fmt} archives")
+    source = None
+    try:
+        try:
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+
+                batches: Iterator[Any] = pq.ParquetFile(str(path)).iter_batches(batch_size=_CHUNK_POINTS)
+            else:
+                source = pa.OSFile(str(path), "rb")
+                batches = iter(pa.ipc.open_stream(source))
+        except (OSError, pa.ArrowException) as e:
+            raise ValueError(f"truncated or corrupt {fmt} archive: {e}") from e
+        for batch in _checked_batches(pa, batches, fmt):
+            kinds = batch.column("kind").unique().to_pylist()
+            run_ids = batch.column("run_id").unique().to_pylist()
+            names = batch.column("name").unique().to_pylist()
+            if kinds == ["metric"] and len(run_ids) == 1 and len(names) == 1:
+                # 导出时标量点按 series 分块，整块走向量化写入
+                importer.add_points(
+                    run_ids[0],
+                    names[0],
+                    batch.column("step").to_numpy(zero_copy_only=False),
+                    batch.column("ts").to_numpy(zero_copy_only=False),
+                    batch.column("value").fill_null(math.nan).to_numpy(zero_copy_only=False),
+                )
+                continue
+            cols = batch.to_pydict()
+            for run_id, kind, name, step, ts, value, text in zip(
+                cols["run_id"], cols["kind"], cols["name"], cols["step"], cols["ts"], cols["value"], cols["text"]
+            ):
+                importer.add(run_id, kind, name, int(step or 0), float(ts or 0.0), value, text)
+    finally:
+        if source is not None:
+            source.close()
+
+
+def import_archive(store: MetricStore, path: Path) -> list[str]:
+    """导入 export_runs 产出的归档（自动识别 arrow / parquet / ndjson），返回导入后的 run_id 列表；
+    中途失败时删除本次已创建的 run"""
+    importer = _Importer(store)
+    try:
+        _feed(importer, path)
+        return importer.finish()
+    except BaseException:
+        importer.abort()
+        raise
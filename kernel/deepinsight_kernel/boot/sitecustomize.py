@@ -0,0 +1,266 @@
+# DeepInsight 子进程引导：仅当内核开启 profile / line_profile 时才会被放到 PYTHONPATH 最前面。
+# DEEPINSIGHT_PROFILE：统计采样 profiler，调用栈增量以 JSON 行追加到 DEEPINSIGHT_PROFILE_OUT，由内核聚合成火焰图；
+# DEEPINSIGHT_LINE_PROFILE：只对工作区文件做逐行计时，按进程把快照写到 DEEPINSIGHT_LINE_PROFILE_OUT 目录；
+# 之后继续导入 PYTHONPATH 后面原有的 sitecustomize（如果有）
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+_FLUSH_S = 1.0
+_LINE_FLUSH_S = 2.0
+
+
+class _Batch:
+    """一次 flush 周期内的增量：新出现的栈帧定义与各调用栈的计数"""
+
+    __slots__ = ("counts", "new_frames")
+
+    def __init__(self):
+        self.counts = {}
+        self.new_frames = {}
+
+
+class _Sampler:
+    """定时采样主线程调用栈：POSIX 上用 ITIMER_PROF（按 CPU 时间触发），否则退回到后台线程"""
+
+    def __init__(self, interval, out_path):
+        self.interval = interval
+        self.out_path = out_path
+        self.pid = os.getpid()
+        self.frames = {}
+        self.batch = _Batch()
+        # record 与 flush 分处不同线程：record 的整次写入和 flush 换出 batch 互斥，
+        # 栈帧定义与引用它的计数因此总在同一个 batch 里。可重入锁：退出时 flush 在主线程上运行，
+        # 期间到来的 SIGPROF 会在同一线程里再次进入 record
+        self._lock = threading.RLock()
+        self._in_handler = False
+
+    def record(self, frame):
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        if not codes:
+            return
+        codes.reverse()
+        with self._lock:
+            batch = self.batch
+            frames = self.frames
+            ids = []
+            for code in codes:
+                fid = frames.get(code)
+                if fid is None:
+                    fid = len(frames)
+                    frames[code] = fid
+                    batch.new_frames[fid] = [code.co_filename, code.co_name, code.co_firstlineno]
+                ids.append(fid)
+            key = ";".join(map(str, ids))
+            batch.counts[key] = batch.counts.get(key, 0) + 1
+
+    def _on_signal(self, signum, frame):
+        # 处理函数执行中可能再次被 SIGPROF 打断，嵌套的这次采样直接丢弃，避免两次 record 交错分配同一个帧 id
+        if self._in_handler:
+            return
+        self._in_handler = True
+        try:
+            self.record(frame)
+        finally:
+            self._in_handler = False
+
+    def _poll_main(self):
+        main = threading.main_thread().ident
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(main)
+            if frame is None:
+                return
+            self.record(frame)
+
+    def start(self):
+        import signal
+
+        if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            atexit.register(self.stop_timer)
+        else:
+            threading.Thread(target=self._poll_main, name="deepinsight-profiler", daemon=True).start()
+        atexit.register(self.flush)
+        threading.Thread(target=self._flush_loop, name="deepinsight-profile-flush", daemon=True).start()
+        import sysconfig
+
+        self._write({
+            "pid": self.pid,
+            "root": os.getcwd(),
+            "stdlib": sysconfig.get_paths().get("stdlib"),
+            "interval_s": self.interval,
+        })
+
+    def stop_timer(self):
+        # 解释器退出时信号处理函数会被恢复为默认，残留的 SIGPROF 会以 "Profiling timer expired" 杀死进程
+        import signal
+
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+
+    def _write(self, record):
+        data = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        fd = os.open(self.out_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def flush(self):
+        # 持锁只为整体换出 batch；换出后 record 不会再写旧 batch，序列化与写文件在锁外进行
+        with self._lock:
+            batch = self.batch
+            if not batch.counts:
+                return
+            self.batch = _Batch()
+        try:
+            self._write({"pid": self.pid, "frames": batch.new_frames, "stacks": batch.counts})
+        except OSError:
+            pass
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(_FLUSH_S)
+            if os.getpid() != self.pid:
+                return
+            self.flush()
+
+
+class _LineProfiler:
+    """统计工作区文件每一行的命中次数与耗时；两次行事件之间的时间记到前一行上，
+    因此调用库函数的耗时计入调用它的那一行"""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.pid = os.getpid()
+        self.root = os.path.abspath(os.getcwd())
+        self.stats = {}
+        self.last = {}
+        self._wanted = {}
+        excluded = {os.path.dirname(os.path.abspath(__file__))}
+        for p in (sys.prefix, sys.base_prefix, sys.exec_prefix):
+            excluded.add(os.path.abspath(p))
+        self._excluded = tuple(p + os.sep for p in excluded)
+
+    def _want(self, code):
+        want = self._wanted.get(code)
+        if want is None:
+            fn = code.co_filename
+            if fn.startswith("<"):
+                # -c 传入的代码是 <string>；<frozen os> 等冻结模块不算工作区代码
+                want = fn == "<string>"
+            else:
+                path = os.path.abspath(fn)
+                want = (
+                    path.startswith(self.root + os.sep)
+                    and not path.startswith(self._excluded)
+                    and "site-packages" not in path
+                )
+            self._wanted[code] = want
+        return want
+
+    def _tick(self, filename, line, _now=time.perf_counter_ns, _tid=threading.get_ident):
+        now = _now()
+        tid = _tid()
+        prev = self.last.get(tid)
+        if prev is not None:
+            prev[0][1] += now - prev[1]
+        key = (filename, line)
+        rec = self.stats.get(key)
+        if rec is None:
+            rec = self.stats[key] = [0, 0]
+        rec[0] += 1
+        self.last[tid] = (rec, now)
+
+    def start(self):
+        mon = getattr(sys, "monitoring", None)
+        if mon is not None:
+            # 3.12+：对非工作区代码返回 DISABLE，该位置以后不再产生事件
+            tool = mon.PROFILER_ID
+            disable = mon.DISABLE
+
+            def on_line(code, line):
+                if not self._want(code):
+                    return disable
+                self._tick(code.co_filename, line)
+
+            mon.use_tool_id(tool, "deepinsight")
+            mon.register_callback(tool, mon.events.LINE, on_line)
+            mon.set_events(tool, mon.events.LINE)
+        else:
+            def local(frame, event, arg):
+                if event == "line":
+                    self._tick(frame.f_code.co_filename, frame.f_lineno)
+                return local
+
+            def trace(frame, event, arg):
+                # 只为工作区代码返回局部 tracer，库函数内部不产生 line 事件
+                if event == "call" and self._want(frame.f_code):
+                    return local
+                return None
+
+            sys.settrace(trace)
+            threading.settrace(trace)
+        atexit.register(self.flush)
+        threading.Thread(target=self._flush_loop, name="deepinsight-line-profile-flush", daemon=True).start()
+
+    def flush(self):
+        files = {}
+        for (fn, line), (hits, ns) in list(self.stats.items()):
+            files.setdefault(fn, []).append([line, hits, ns])
+        path = os.path.join(self.out_dir, f"lines-{self.pid}.json")
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"pid": self.pid, "root": self.root, "files": files}, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(_LINE_FLUSH_S)
+            if os.getpid() != self.pid:
+                return
+            self.flush()
+
+
+def _start():
+    line_dir = os.environ.get("DEEPINSIGHT_LINE_PROFILE_OUT")
+    if os.environ.get("DEEPINSIGHT_LINE_PROFILE") == "1" and line_dir:
+        _LineProfiler(line_dir).start()
+    out_path = os.environ.get("DEEPINSIGHT_PROFILE_OUT")
+    try:
+        interval = float(os.environ.get("DEEPINSIGHT_PROFILE", "0"))
+    except ValueError:
+        interval = 0.0
+    if not out_path or interval <= 0:
+        return
+    _Sampler(interval, out_path).start()
+
+
+def _chain():
+    # 让 PYTHONPATH 后面原有的 sitecustomize 继续生效
+    here = os.path.dirname(os.path.abspath(__file__))
+    me = sys.modules.pop("sitecustomize", None)
+    saved = sys.path[:]
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or ".") != here]
+    try:
+        import sitecustomize  # noqa: F401
+    except ImportError:
+        if me is not None:
+            sys.modules["sitecustomize"] = me
+    finally:
+        sys.path[:] = saved
+
+
+_start()
+_chain()
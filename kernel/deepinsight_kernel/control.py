@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+# 内核 -> 子进程的控制通道：内核原子地改写一个 JSON 控制文件，
+# 子进程里的 deepinsight SDK 在 step 边界按 mtime 廉价轮询（见 deepinsight.should_stop）；
+# 子进程以 __CONTROL__ {json} 行回报已生效的状态
+CONTROL_ENV = "DEEPINSIGHT_CONTROL"
+CONTROL_PREFIX = "__CONTROL__"
+CONTROL_ACTIONS = ("stop_gracefully", "pause", "resume", "set_param")
+DEFAULT_STOP_GRACE_S = 60.0
+
+
+class ControlChannel:
+    def __init__(self) -> None:
+        self._dir = Path(tempfile.mkdtemp(prefix="deepinsight_ctl_"))
+        self.path = self._dir / "control.json"
+        self.seq = 0
+        self.stop = False
+        self.stop_reason: Optional[str] = None
+        self.paused = False
+        self.params: dict[str, Any] = {}
+        self._write()
+
+    @property
+    def env(self) -> dict[str, str]:
+        return {CONTROL_ENV: str(self.path)}
+
+    def _write(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        state = {"seq": self.seq, "stop": self.stop, "paused": self.paused, "params": self.params}
+        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def apply(self, action: str, name: Optional[str] = None, value: Any = None, reason: Optional[str] = None) -> int:
+        """执行一个控制动作并返回新的序号"""
+        if action == "stop_gracefully":
+            self.stop = True
+            self.stop_reason = reason or "user"
+            self.paused = False
+        elif action == "pause":
+            self.paused = True
+        elif action == "resume":
+            self.paused = False
+        elif action == "set_param":
+            if not isinstance(name, str) or not name:
+                raise ValueError("set_param requires a name")
+            self.params[name] = value
+        else:
+            raise ValueError(f"unknown control action: {action}")
+        self.seq += 1
+        self._write()
+        return self.seq
+
+    def close(self) -> None:
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+def parse_control_line(line: str) -> Optional[dict[str, Any]]:
+    trimmed = line.strip()
+    if not trimmed.startswith(CONTROL_PREFIX):
+        return None
+    try:
+        obj = json.loads(trimmed[len(CONTROL_PREFIX) :].strip())
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Literal, Optional
+
+# 输出诊断规则引擎：所有规则的关键字编译成一个纯字面量的组合正则（对小写后的行扫描一次），
+# 只有命中关键字的规则才会再用各自的完整正则确认，因此规则增多时单行开销基本不变
+Severity = Literal["error", "warning"]
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: str
+    # 小写字面量关键字：行中出现任一关键字才会尝试 pattern
+    keywords: tuple[str, ...]
+    pattern: str
+    title: str
+    severity: Severity = "error"
+    suggestions: tuple[str, ...] = ()
+
+
+@dataclass
+class Diagnostic:
+    rule: str
+    severity: Severity
+    title: str
+    message: str
+    location: Optional[str]
+    suggestions: list[str]
+    count: int = 1
+
+    def to_event(self) -> dict[str, Any]:
+        return {
+            "rule": self.rule,
+            "severity": self.severity,
+            "title": self.title,
+            "message": self.message,
+            "location": self.location,
+            "suggestions": self.suggestions,
+            "count": self.count,
+        }
+
+
+OOM_SUGGESTIONS = (
+    "减小 batch size（最常见且立竿见影）",
+    "开启混合精度（PyTorch: torch.cuda.amp.autocast + GradScaler）",
+    "使用梯度累积（保持等效 batch size）",
+    "减少输入分辨率/序列长度/上下文窗口",
+    "启用梯度检查点（activation checkpointing）",
+    "释放无用张量与缓存（del + torch.cuda.empty_cache；仅缓解碎片）",
+    "把大张量/中间结果移到 CPU 或分块计算（chunking）",
+)
+
+WARNING_RULE = "repeated_warning"
+
+# oom 规则同时覆盖显存与主机内存；只有主机内存耗尽才与 memory_mb 上限相关
+_HOST_OOM = re.compile(r"\bMemoryError\b|Cannot allocate memory")
+
+
+def is_host_oom(diag: Diagnostic) -> bool:
+    return diag.rule == "oom" and _HOST_OOM.search(diag.message) is not None
+
+DEFAULT_RULES: tuple[Rule, ...] = (
+    Rule(
+        id="oom",
+        keywords=("out of memory", "cublas_status_alloc_failed", "resource exhausted", "memoryerror", "cannot allocate memory"),
+        pattern=r"out of memory|cublas_status_alloc_failed|resource exhausted|\bMemoryError\b|Cannot allocate memory",
+        title="显存/内存不足",
+        suggestions=OOM_SUGGESTIONS,
+    ),
+    Rule(
+        id="cuda_assert",
+        keywords=("device-side assert", "cudaerrorassert", "illegal memory access", "cuda error:", "cudnn_status_"),
+        pattern=r"device-side assert|cudaErrorAssert|illegal memory access|CUDA error:|CUDNN_STATUS_\w+",
+        title="CUDA 设备端错误",
+        suggestions=(
+            "设置 CUDA_LAUNCH_BLOCKING=1 重新运行，使报错位置与真正出错的 kernel 对齐",
+            "检查分类标签是否越界（CrossEntropyLoss 要求 0 <= target < num_classes）",
+            "检查 Embedding / index_select 等索引是否超出范围",
+            "先在 CPU 上复现，通常能得到更明确的报错信息",
+        ),
+    ),
+    Rule(
+        id="shape_mismatch",
+        keywords=(
+            "shapes cannot be multiplied",
+            "size mismatch",
+            "shape mismatch",
+            "must match the size of tensor",
+            "sizes of tensors must match",
+            "could not be broadcast",
+            ") not aligned",
+            "expected input batch_size",
+            "weight of size",
+            "cannot reshape array",
+            "is invalid for input of size",
+        ),
+        pattern=(
+            r"shapes cannot be multiplied|size mismatch|shape mismatch|must match the size of tensor"
+            r"|Sizes of tensors must match|operands could not be broadcast|\) not aligned"
+            r"|Expected input batch_size|Given groups=\d+, weight of size|cannot reshape array"
+            r"|shape '\[[^\]]*\]' is invalid for input of size"
+        ),
+        title="张量形状不匹配",
+        suggestions=(
+            "在出错行之前打印相关张量的 .shape，确认 batch 维与特征维",
+            "检查 Linear/Conv 的 in_features/in_channels 是否与上一层输出一致",
+            "检查 view/reshape 前是否需要 .contiguous() 或 flatten(1)",
+            "加载权重时 size mismatch：确认模型结构与 checkpoint 一致，或使用 strict=False 并核对缺失键",
+        ),
+    ),
+    Rule(
+        id="nan_loss",
+        keywords=("loss", "returned nan values"),
+        pattern=(
+            r"\bloss\b[^\n]{0,24}?[:=]\s*[-+]?(?:nan|inf)\b|\bnan loss|loss is (?:nan|not finite)"
+            r"|returned nan values|non-finite loss"
+        ),
+        title="损失出现 NaN/Inf",
+        suggestions=(
+            "降低学习率，或加入学习率 warmup",
+            "使用梯度裁剪（torch.nn.utils.clip_grad_norm_）",
+            "检查 log/sqrt/除法的输入，必要时加 eps",
+            "混合精度下改用 GradScaler，或对不稳定的算子使用 float32",
+            "检查输入数据中是否存在 NaN/Inf",
+        ),
+    ),
+    Rule(
+        id="dataloader_crash",
+        keywords=("dataloader worker", "insufficient shared memory", "unable to write to file", "unable to open shared memory", "bus error"),
+        pattern=(
+            r"DataLoader worker|in DataLoader worker process|insufficient shared memory"
+            r"|unable to (?:write to file|open shared memory)|Bus error"
+        ),
+        title="DataLoader 工作进程崩溃",
+        suggestions=(
+            "设置 num_workers=0 复现，以便看到数据处理代码中的真实异常",
+            "共享内存不足时增大 /dev/shm（Docker: --shm-size）或减少 num_workers",
+            "检查 Dataset.__getitem__ 是否在某些样本上抛异常或返回不一致的形状",
+        ),
+    ),
+    Rule(
+        id="file_too_large",
+        keywords=("file too large", "[errno 27]"),
+        pattern=r"\[Errno 27\]|File too large",
+        title="写出的文件超过大小上限",
+        suggestions=(
+            "检查日志/checkpoint 是否在循环中重复写入同一个文件",
+            "按 step 轮转输出文件，或只保留最近的若干个 checkpoint",
+            "确需大文件时在 exec 的 limits.file_size_mb 中调高上限",
+        ),
+    ),
+    Rule(
+        id="process_limit",
+        keywords=("resource temporarily unavailable", "can't start new thread"),
+        pattern=r"BlockingIOError: \[Errno 11\] Resource temporarily unavailable|can't start new thread",
+        title="进程/线程数达到上限",
+        suggestions=(
+            "减少 DataLoader num_workers 或进程池大小",
+            "检查是否在循环中反复创建进程/线程而没有回收",
+            "确需更多进程时在 exec 的 limits.max_processes 中调高上限",
+        ),
+    ),
+    Rule(
+        id="input_bottleneck",
+        keywords=("deepinsight warning: data loader",),
+        pattern=r"DeepInsight Warning: data loader '.*' is the bottleneck",
+        title="数据加载成为瓶颈",
+        severity="warning",
+        suggestions=(
+            "增大 DataLoader 的 num_workers，并开启 persistent_workers=True 避免每个 epoch 重启 worker",
+            "GPU 训练时设置 pin_memory=True，并适当调大 prefetch_factor",
+            "把解码/增强等重计算移到离线预处理，或改用更快的存储格式（如内存映射数组）",
+            "检查 Dataset.__getitem__ 中是否有逐样本的磁盘/网络 I/O",
+        ),
+    ),
+    Rule(
+        id=WARNING_RULE,
+        keywords=("warning: ",),
+        pattern=r"\b[A-Z]\w*Warning: ",
+        title="重复警告",
+        severity="warning",
+        suggestions=(
+            "修复警告来源，或用 warnings.filterwarnings 过滤已知无害的警告",
+        ),
+    ),
+)
+
+_WARNING_HEAD = re.compile(r"^(?P<loc>.+?):(?P<line>\d+): (?P<cat>[A-Z]\w*Warning): (?P<msg>.*)$")
+_DIGITS = re.compile(r"\d+")
+
+
+def parse_traceback_location(line: str) -> Optional[str]:
+    s = line.strip()
+    if not s.startswith('File "'):
+        return None
+    try:
+        file_part = s.split('File "', 1)[1]
+        path = file_part.split('"', 1)[0]
+        rest = s.split("line", 1)[1]
+        ln = int(rest.split(",", 1)[0].strip())
+        return f"{path}:{ln}"
+    except Exception:
+        return None
+
+
+class DiagnosticsEngine:
+    def __init__(self, rules: Iterable[Rule] = DEFAULT_RULES) -> None:
+        self.rules = {r.id: r for r in rules}
+        self._by_keyword: dict[str, list[tuple[Rule, re.Pattern[str]]]] = {}
+        for rule in self.rules.values():
+            compiled = re.compile(rule.pattern, re.IGNORECASE)
+            for kw in rule.keywords:
+                self._by_keyword.setdefault(kw, []).append((rule, compiled))
+        # 同一位置上长关键字优先
+        keywords = sorted(self._by_keyword, key=len, reverse=True)
+        self._prefilter = re.compile("|".join(re.escape(k) for k in keywords))
+
+    def match(self, line: str) -> Optional[Rule]:
+        for m in self._prefilter.finditer(line.lower()):
+            for rule, compiled in self._by_keyword[m.group()]:
+                if compiled.search(line):
+                    return rule
+        return None
+
+    def session(self) -> DiagnosticsSession:
+        return DiagnosticsSession(self)
+
+
+@dataclass
+class DiagnosticResult:
+    diagnostics: list[Diagnostic] = field(default_factory=list)
+    # 为 True 时该行只落盘、不转发（重复警告及其紧随的源码行）
+    suppress: bool = False
+
+
+class DiagnosticsSession:
+    """单次运行的诊断状态：最近的 traceback 位置、已触发的规则、重复警告计数"""
+
+    def __init__(self, engine: DiagnosticsEngine) -> None:
+        self.engine = engine
+        self.last_location: Optional[str] = None
+        self.fired: dict[str, Diagnostic] = {}
+        self._warnings: dict[str, Diagnostic] = {}
+        self._in_repeat = False
+
+    def _fire(self, rule: Rule, message: str, location: Optional[str]) -> Optional[Diagnostic]:
+        # 同一规则每次运行只上报一次，之后只累计次数
+        prev = self.fired.get(rule.id)
+        if prev is not None:
+            prev.count += 1
+            return None
+        diag = Diagnostic(rule.id, rule.severity, rule.title, message, location, list(rule.suggestions))
+        self.fired[rule.id] = diag
+        return diag
+
+    def feed(self, line: str) -> DiagnosticResult:
+        result = DiagnosticResult()
+        if self._in_repeat:
+            self._in_repeat = False
+            # warnings 模块在警告头之后会再打印一行缩进的源码
+            if line[:1].isspace() and not line.lstrip().startswith("File "):
+                result.suppress = True
+                return result
+        loc = parse_traceback_location(line)
+        if loc:
+            self.last_location = loc
+            return result
+        rule = self.engine.match(line)
+        if rule is None:
+            return result
+        if rule.id == WARNING_RULE:
+            return self._feed_warning(rule, line, result)
+        diag = self._fire(rule, line.strip(), self.last_location)
+        if diag is not None:
+            result.diagnostics.append(diag)
+        return result
+
+    def _feed_warning(self, rule: Rule, line: str, result: DiagnosticResult) -> DiagnosticResult:
+        m = _WARNING_HEAD.match(line.strip())
+        if m is not None:
+            location = f"{m.group('loc')}:{m.group('line')}"
+            key = f"{location}|{m.group('cat')}|{_DIGITS.sub('#', m.group('msg'))}"
+        else:
+            location = None
+            key = _DIGITS.sub("#", line.strip())
+        seen = self._warnings.get(key)
+        if seen is None:
+            self._warnings[key] = Diagnostic(rule.id, rule.severity, rule.title, line.strip(), location, list(rule.suggestions), count=1)
+            return result
+        seen.count += 1
+        result.suppress = True
+        self._in_repeat = True
+        return result
+
+    def finish(self) -> list[Diagnostic]:
+        """运行结束时汇总被折叠的重复警告"""
+        out = []
+        for diag in self._warnings.values():
+            if diag.count > 1:
+                diag.title = f"重复警告（共 {diag.count} 次，仅显示首次）"
+                out.append(diag)
+        return out
+
+
+_default_engine: Optional[DiagnosticsEngine] = None
+
+
+def get_engine() -> DiagnosticsEngine:
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = DiagnosticsEngine()
+    return _default_engine
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets，返回被选中点的下标"""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1], dtype=np.int64)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # NaN 会让三角形面积失效，按 0 参与选点，取值时仍返回原值
+    y_calc = np.where(np.isfinite(y), y, 0.0)
+
+    # 首尾固定，中间 n_out - 2 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # 各桶均值一次性算好，循环内只做桶内向量运算
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y_calc)))
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+    avg_x = (cum_x[edges[1:]] - cum_x[edges[:-1]]) / counts
+    avg_y = (cum_y[edges[1:]] - cum_y[edges[:-1]]) / counts
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 1 < n_out - 2:
+            cx, cy = avg_x[i + 1], avg_y[i + 1]
+        else:
+            cx, cy = x[n - 1], y_calc[n - 1]
+        ax, ay = x[a], y_calc[a]
+        bx, by = x[lo:hi], y_calc[lo:hi]
+        area = np.abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax(y: np.ndarray, n_out: int) -> np.ndarray:
+    """按等长桶取每桶的最小/最大值点，返回按原顺序排列的下标"""
+    n = len(y)
+    n_buckets = max(n_out // 2, 1)
+    if n <= n_out or n_buckets >= n:
+        return np.arange(n)
+
+    # 桶边界按 linspace 均分，桶长只差 1，不会像向上取整那样在尾部留下空桶
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    y = np.asarray(y, dtype=np.float64)
+    lo_vals = np.where(np.isnan(y), np.inf, y)
+    hi_vals = np.where(np.isnan(y), -np.inf, y)
+    i_min = np.empty(n_buckets, dtype=np.int64)
+    i_max = np.empty(n_buckets, dtype=np.int64)
+    for b in range(n_buckets):
+        lo, hi = edges[b], edges[b + 1]
+        i_min[b] = lo + int(np.argmin(lo_vals[lo:hi]))
+        i_max[b] = lo + int(np.argmax(hi_vals[lo:hi]))
+    return np.unique(np.concatenate((i_min, i_max)))
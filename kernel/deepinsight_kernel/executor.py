@@ -1,95 +1,406 @@
 from __future__ import annotations
 
 import asyncio
+import codecs
 import os
+import re
+import signal
+import subprocess
 import sys
 import tempfile
+from dataclasses import dataclass, field
 from pathlib import Path, PurePosixPath
-from typing import Awaitable, Callable, Optional
+from typing import Any, Awaitable, Callable, Optional
+
+import psutil
 
 # DeepInsight SDK path to be added to PYTHONPATH
 SDK_ROOT = Path(__file__).parent.parent.parent.resolve()
 
 
+# 进度条类输出（tqdm 等）用 \r / ANSI 光标序列反复重写同一行；
+# 读取端模拟单行终端，只按 PROGRESS_REFRESH_S 的频率转发该行的最新状态，换行时再交出最终内容
+PROGRESS_REFRESH_S = 0.1
+_READ_CHUNK = 65536
+# 单行长度上限：超过即强制断行，防止不换行的输出让缓冲无限增长。
+# __METRIC__ 行（点云、模型结构图、RL 回合批次）可能有几 MB，上限不能按读块大小取
+_MAX_LINE_CHARS = 32 * 1024 * 1024
+_ANSI_CSI = re.compile(r"\x1b\[([0-9;?]*)([@-~])")
+# 颜色 (SGR, 以 m 结尾) 之外的 CSI 序列会移动光标或擦除内容
+_ANSI_CURSOR = re.compile(r"\x1b\[[0-9;?]*[@-ln-~]")
+
+
+def _needs_render(raw: str) -> bool:
+    return "\r" in raw or "\b" in raw or ("\x1b[" in raw and _ANSI_CURSOR.search(raw) is not None)
+
+
+def _render_line(raw: str) -> str:
+    """把含 \r、退格与 CSI 序列的原始片段折叠为终端上最终可见的一行"""
+    if not _needs_render(raw):
+        return raw
+    buf: list[str] = []
+    cur = 0
+    i = 0
+    n = len(raw)
+    while i < n:
+        ch = raw[i]
+        if ch == "\r":
+            cur = 0
+        elif ch == "\b":
+            cur = max(cur - 1, 0)
+        elif ch == "\x1b":
+            m = _ANSI_CSI.match(raw, i)
+            if m is None:
+                i += 1
+                continue
+            arg, cmd = m.group(1), m.group(2)
+            if cmd == "K":
+                # 0/空：清到行尾；1：清到光标；2：清整行
+                if arg in ("", "0"):
+                    del buf[cur:]
+                elif arg == "1":
+                    buf[:cur] = [" "] * min(cur, len(buf))
+                elif arg == "2":
+                    buf = []
+            elif cmd == "G":
+                cur = max(int(arg or "1") - 1, 0)
+            elif cmd == "C":
+                cur += int(arg or "1")
+            elif cmd == "D":
+                cur = max(cur - int(arg or "1"), 0)
+            # 颜色 (m) 与上下移动等跨行序列在单行模型里无意义，直接丢弃
+            i = m.end()
+            continue
+        else:
+            if cur > len(buf):
+                buf.extend(" " * (cur - len(buf)))
+            if cur == len(buf):
+                buf.append(ch)
+            else:
+                buf[cur] = ch
+            cur += 1
+        i += 1
+    return "".join(buf).rstrip(" ")
+
+
 async def _read_stream_lines(
     stream: asyncio.StreamReader,
     on_line: Callable[[str], Awaitable[None]],
+    on_progress: Callable[[str], Awaitable[None]] | None = None,
 ) -> None:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    loop = asyncio.get_running_loop()
+    pending = ""
+    shown = ""
+    last_emit = 0.0
+    # pending 中有尚未转发的进度状态
+    dirty = False
+
+    async def deliver(line: str) -> None:
+        # 回调出错只记日志：读取循环一旦退出，管道写满后子进程会一直阻塞
+        try:
+            await on_line(line)
+        except Exception as e:
+            print(f"Output callback failed: {e}")
+
+    async def emit_progress() -> None:
+        nonlocal shown, last_emit, dirty
+        state = _render_line(pending)
+        if state != shown and on_progress is not None:
+            shown = state
+            try:
+                await on_progress(state)
+            except Exception as e:
+                print(f"Progress callback failed: {e}")
+        last_emit = loop.time()
+        dirty = False
+
     while True:
-        line = await stream.readline()
-        if not line:
+        try:
+            # 有待转发的进度状态时，最多等到下一个刷新点
+            if dirty:
+                timeout = max(last_emit + PROGRESS_REFRESH_S - loop.time(), 0.0)
+                chunk = await asyncio.wait_for(stream.read(_READ_CHUNK), timeout=timeout)
+            else:
+                chunk = await stream.read(_READ_CHUNK)
+        except asyncio.TimeoutError:
+            await emit_progress()
+            continue
+        if not chunk:
             break
-        await on_line(line.decode("utf-8", errors="replace"))
+        parts = decoder.decode(chunk).split("\n")
+        parts[0] = pending + parts[0]
+        pending = parts.pop()
+        # 长时间不换行的进度条：把最后一个 \r 之前的历史折叠成一行可见内容
+        cut = pending.rfind("\r")
+        if cut > 0:
+            pending = _render_line(pending[:cut]) + pending[cut:]
+        for part in parts:
+            await deliver(_render_line(part) + "\n")
+            shown = ""
+        # 折叠后仍超过 _MAX_LINE_CHARS（既不换行也不回车的输出）就强制按一行交出，pending 才真正有界
+        if len(pending) > _MAX_LINE_CHARS:
+            await deliver(_render_line(pending))
+            pending = ""
+            shown = ""
+        dirty = on_progress is not None and bool(pending) and _needs_render(pending)
+        if dirty and loop.time() - last_emit >= PROGRESS_REFRESH_S:
+            await emit_progress()
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        await deliver(_render_line(pending))
+
+
+def _stream_progress(
+    on_progress: Callable[[str, str], Awaitable[None]] | None,
+    stream_name: str,
+) -> Callable[[str], Awaitable[None]] | None:
+    if on_progress is None:
+        return None
+
+    async def cb(state: str) -> None:
+        await on_progress(stream_name, state)
+
+    return cb
+
+
+@dataclass(frozen=True)
+class KillPolicy:
+    # 取消/超时时先发 SIGINT（用户代码可捕获 KeyboardInterrupt 保存 checkpoint），
+    # 宽限期后对整个进程树发 SIGTERM，再不退出则 SIGKILL
+    sigint_grace_s: float = 5.0
+    sigterm_grace_s: float = 3.0
+    # 主进程正常退出后是否一并结束仍留在进程组里的后代（未 join 的 worker 等）；
+    # 默认不动，它们可能是用户有意留下的服务进程，只在 leaked_pids 里报告
+    reap_on_exit: bool = False
+
+
+@dataclass
+class ExecResult:
+    exit_code: Optional[int]
+    timed_out: bool = False
+    cancelled: bool = False
+    # 运行结束（及清理）后仍然存活的后代进程（正常情况下为空）
+    leaked_pids: list[int] = field(default_factory=list)
+
+
+_TREE_POLL_S = 0.1
+_KILL_WAIT_S = 2.0
+_READER_DRAIN_S = 5.0
+
+
+def _snapshot_tree(pid: int) -> list[psutil.Process]:
+    try:
+        return psutil.Process(pid).children(recursive=True)
+    except psutil.Error:
+        return []
 
 
-async def execute_python(
-    code: str,
+def _alive(procs: list[psutil.Process]) -> list[psutil.Process]:
+    out = []
+    for p in procs:
+        try:
+            if p.is_running() and p.status() != psutil.STATUS_ZOMBIE:
+                out.append(p)
+        except psutil.Error:
+            pass
+    return out
+
+
+def _group_members(pgid: int) -> list[psutil.Process]:
+    """进程组里仍在运行的成员（不含僵尸进程）"""
+    if os.name == "nt":
+        return []
+    # 先用 killpg(0) 廉价判断组是否为空，只有非空时才遍历进程表
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return []
+    except PermissionError:
+        pass
+    out = []
+    for p in psutil.process_iter():
+        try:
+            if os.getpgid(p.pid) == pgid:
+                out.append(p)
+        except (OSError, psutil.Error):
+            pass
+    return _alive(out)
+
+
+def _signal_tree(proc: asyncio.subprocess.Process, tracked: list[psutil.Process], sig: int) -> None:
+    if os.name != "nt":
+        # 子进程以新会话启动，进程组号即其 pid；组长退出后组内成员仍可按组发送信号
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+    elif proc.returncode is None:
+        try:
+            proc.send_signal(signal.CTRL_BREAK_EVENT if sig == signal.SIGINT else sig)
+        except (ProcessLookupError, OSError):
+            pass
+    # 自行 setsid 脱离进程组的后代单独发送
+    for p in _alive(tracked):
+        try:
+            if sig == signal.SIGINT and os.name == "nt":
+                continue
+            p.send_signal(sig)
+        except psutil.Error:
+            pass
+
+
+async def _terminate_tree(proc: asyncio.subprocess.Process, policy: KillPolicy, interrupt: bool) -> list[int]:
+    """按 SIGINT -> SIGTERM -> SIGKILL 逐级结束子进程及其全部后代，返回仍未结束的 pid"""
+    loop = asyncio.get_running_loop()
+    # 遍历进程表的扫描都放进线程，宽限期内的轮询不阻塞事件循环
+    tracked = await asyncio.to_thread(_snapshot_tree, proc.pid) if proc.returncode is None else []
+
+    async def finished() -> bool:
+        if proc.returncode is None or _alive(tracked):
+            return False
+        return not await asyncio.to_thread(_group_members, proc.pid)
+
+    kill = getattr(signal, "SIGKILL", signal.SIGTERM)
+    steps = [(signal.SIGTERM, policy.sigterm_grace_s), (kill, _KILL_WAIT_S)]
+    if interrupt:
+        steps.insert(0, (signal.SIGINT, policy.sigint_grace_s))
+    for sig, grace in steps:
+        if await finished():
+            return []
+        _signal_tree(proc, tracked, sig)
+        deadline = loop.time() + grace
+        while loop.time() < deadline:
+            await asyncio.sleep(_TREE_POLL_S)
+            if proc.returncode is None:
+                known = {p.pid for p in tracked}
+                tracked.extend(p for p in await asyncio.to_thread(_snapshot_tree, proc.pid) if p.pid not in known)
+            elif await finished():
+                return []
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=_KILL_WAIT_S)
+    except asyncio.TimeoutError:
+        pass
+    left = {p.pid for p in _alive(tracked)}
+    left.update(p.pid for p in await asyncio.to_thread(_group_members, proc.pid))
+    left.discard(proc.pid)
+    if left:
+        print(f"Process tree of {proc.pid} not fully terminated, leftover pids: {sorted(left)}")
+    return sorted(left)
+
+
+async def _run_process(
+    args: list[str],
+    env: dict[str, str],
+    cwd: str | None,
     timeout_s: float,
     on_stdout: Callable[[str], Awaitable[None]],
     on_stderr: Callable[[str], Awaitable[None]],
-    cancel_event: asyncio.Event | None = None,
-) -> tuple[Optional[int], bool, bool]:
-    env = dict(os.environ)
-    env["PYTHONUTF8"] = "1"
-    env["PYTHONIOENCODING"] = "utf-8"
-    env["PYTHONPATH"] = str(SDK_ROOT) + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    cancel_event: asyncio.Event | None,
+    on_progress: Callable[[str, str], Awaitable[None]] | None,
+    kill_policy: KillPolicy | None,
+    on_spawn: Callable[[int], None] | None,
+    exec_prefix: list[str] | None,
+) -> ExecResult:
+    spawn_kwargs: dict[str, Any] = {}
+    if os.name == "nt":
+        spawn_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        spawn_kwargs["start_new_session"] = True
+    if exec_prefix:
+        # 资源上限（rlimit / cgroup）由启动器设置后再 exec 到目标命令
+        args = [*exec_prefix, *args]
 
     proc = await asyncio.create_subprocess_exec(
-        sys.executable,
-        "-X",
-        "utf8",
-        "-u",
-        "-c",
-        code,
+        *args,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
         env=env,
+        cwd=cwd,
+        **spawn_kwargs,
     )
+    if on_spawn is not None:
+        on_spawn(proc.pid)
 
     tasks: list[asyncio.Task[None]] = []
     if proc.stdout is not None:
-        tasks.append(asyncio.create_task(_read_stream_lines(proc.stdout, on_stdout)))
+        tasks.append(asyncio.create_task(_read_stream_lines(proc.stdout, on_stdout, _stream_progress(on_progress, "stdout"))))
     if proc.stderr is not None:
-        tasks.append(asyncio.create_task(_read_stream_lines(proc.stderr, on_stderr)))
-
-    timed_out = False
-    cancelled = False
-    try:
-        cancel_waiter = cancel_event.wait() if cancel_event is not None else None
-        proc_waiter = proc.wait()
-
-        waiters = [asyncio.create_task(proc_waiter)]
-        if cancel_waiter is not None:
-            waiters.append(asyncio.create_task(cancel_waiter))
+        tasks.append(asyncio.create_task(_read_stream_lines(proc.stderr, on_stderr, _stream_progress(on_progress, "stderr"))))
+
+    result = ExecResult(exit_code=None)
+    waiters = [asyncio.create_task(proc.wait())]
+    if cancel_event is not None:
+        waiters.append(asyncio.create_task(cancel_event.wait()))
+    done, pending = await asyncio.wait(waiters, timeout=timeout_s, return_when=asyncio.FIRST_COMPLETED)
+    for p in pending:
+        p.cancel()
+
+    policy = kill_policy or KillPolicy()
+    if proc.returncode is None:
+        if done:
+            result.cancelled = True
+        else:
+            result.timed_out = True
+        result.leaked_pids = await _terminate_tree(proc, policy, interrupt=True)
+    elif policy.reap_on_exit:
+        # 主进程正常退出后，清理仍留在进程组里的孙进程（DataLoader worker、进程池等）
+        result.leaked_pids = await _terminate_tree(proc, policy, interrupt=False)
+    else:
+        left = await asyncio.to_thread(_group_members, proc.pid)
+        result.leaked_pids = sorted(p.pid for p in left if p.pid != proc.pid)
+    await proc.wait()
+    result.exit_code = proc.returncode
 
-        done, pending = await asyncio.wait(waiters, timeout=timeout_s, return_when=asyncio.FIRST_COMPLETED)
-        for p in pending:
-            p.cancel()
+    if tasks:
+        # 泄漏的后代可能仍持有管道写端，读取任务不能无限等待 EOF
+        _, stuck = await asyncio.wait(tasks, timeout=_READER_DRAIN_S)
+        for t in stuck:
+            t.cancel()
+    return result
 
-        if not done:
-            raise asyncio.TimeoutError
 
-        if cancel_event is not None and cancel_event.is_set() and proc.returncode is None:
-            cancelled = True
-            proc.terminate()
-            try:
-                await asyncio.wait_for(proc.wait(), timeout=3)
-            except asyncio.TimeoutError:
-                proc.kill()
-                await proc.wait()
-    except asyncio.TimeoutError:
-        timed_out = True
-        proc.terminate()
-        try:
-            await asyncio.wait_for(proc.wait(), timeout=3)
-        except asyncio.TimeoutError:
-            proc.kill()
-            await proc.wait()
+async def execute_python(
+    code: str,
+    timeout_s: float,
+    on_stdout: Callable[[str], Awaitable[None]],
+    on_stderr: Callable[[str], Awaitable[None]],
+    cancel_event: asyncio.Event | None = None,
+    on_progress: Callable[[str, str], Awaitable[None]] | None = None,
+    extra_env: dict[str, str] | None = None,
+    kill_policy: KillPolicy | None = None,
+    on_spawn: Callable[[int], None] | None = None,
+    exec_prefix: list[str] | None = None,
+) -> ExecResult:
+    env = dict(os.environ)
+    env["PYTHONUTF8"] = "1"
+    env["PYTHONIOENCODING"] = "utf-8"
+    env["PYTHONPATH"] = str(SDK_ROOT) + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    _apply_extra_env(env, extra_env)
+
+    return await _run_process(
+        [sys.executable, "-X", "utf8", "-u", "-c", code],
+        env,
+        None,
+        timeout_s,
+        on_stdout,
+        on_stderr,
+        cancel_event,
+        on_progress,
+        kill_policy,
+        on_spawn,
+        exec_prefix,
+    )
 
-    if tasks:
-        await asyncio.gather(*tasks, return_exceptions=True)
 
-    return proc.returncode, timed_out, cancelled
+def _apply_extra_env(env: dict[str, str], extra_env: dict[str, str] | None) -> None:
+    # PYTHONPATH 前置到已有路径之前而不是覆盖（profiler 的引导目录需要排在最前面）
+    for key, value in (extra_env or {}).items():
+        if key == "PYTHONPATH" and env.get(key):
+            env[key] = value + os.pathsep + env[key]
+        else:
+            env[key] = value
 
 
 def _validate_rel_posix_path(p: str) -> str:
@@ -108,8 +419,13 @@ async def execute_python_project(
     on_stdout: Callable[[str], Awaitable[None]],
     on_stderr: Callable[[str], Awaitable[None]],
     cancel_event: asyncio.Event | None = None,
+    on_progress: Callable[[str, str], Awaitable[None]] | None = None,
+    extra_env: dict[str, str] | None = None,
+    kill_policy: KillPolicy | None = None,
+    on_spawn: Callable[[int], None] | None = None,
+    exec_prefix: list[str] | None = None,
     python_exe: str | None = None,
-) -> tuple[Optional[int], bool, bool]:
+) -> ExecResult:
     entry_norm = _validate_rel_posix_path(entry)
     file_map: dict[str, str] = {}
     for path, content in files:
@@ -132,6 +448,7 @@ async def execute_python_project(
 
         cwd = str(root)
         env["PYTHONPATH"] = cwd + os.pathsep + str(SDK_ROOT) + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+        _apply_extra_env(env, extra_env)
 
         entry_path = str(root / Path(entry_norm))
 
@@ -150,63 +467,20 @@ async def execute_python_project(
 
         actual_python = python_exe if python_exe else sys.executable
 
-        proc = await asyncio.create_subprocess_exec(
-            actual_python,
-            "-X",
-            "utf8",
-            "-u",
-            entry_path,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env=env,
-            cwd=cwd,
+        return await _run_process(
+            [actual_python, "-X", "utf8", "-u", entry_path],
+            env,
+            cwd,
+            timeout_s,
+            mapped_stdout,
+            mapped_stderr,
+            cancel_event,
+            on_progress,
+            kill_policy,
+            on_spawn,
+            exec_prefix,
         )
 
-        tasks: list[asyncio.Task[None]] = []
-        if proc.stdout is not None:
-            tasks.append(asyncio.create_task(_read_stream_lines(proc.stdout, mapped_stdout)))
-        if proc.stderr is not None:
-            tasks.append(asyncio.create_task(_read_stream_lines(proc.stderr, mapped_stderr)))
-
-        timed_out = False
-        cancelled = False
-        try:
-            cancel_waiter = cancel_event.wait() if cancel_event is not None else None
-            proc_waiter = proc.wait()
-
-            waiters = [asyncio.create_task(proc_waiter)]
-            if cancel_waiter is not None:
-                waiters.append(asyncio.create_task(cancel_waiter))
-
-            done, pending = await asyncio.wait(waiters, timeout=timeout_s, return_when=asyncio.FIRST_COMPLETED)
-            for p in pending:
-                p.cancel()
-
-            if not done:
-                raise asyncio.TimeoutError
-
-            if cancel_event is not None and cancel_event.is_set() and proc.returncode is None:
-                cancelled = True
-                proc.terminate()
-                try:
-                    await asyncio.wait_for(proc.wait(), timeout=3)
-                except asyncio.TimeoutError:
-                    proc.kill()
-                    await proc.wait()
-        except asyncio.TimeoutError:
-            timed_out = True
-            proc.terminate()
-            try:
-                await asyncio.wait_for(proc.wait(), timeout=3)
-            except asyncio.TimeoutError:
-                proc.kill()
-                await proc.wait()
-
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
-
-        return proc.returncode, timed_out, cancelled
-
 
 async def execute_python_workspace(
     workspace_root: str,
@@ -215,8 +489,13 @@ async def execute_python_workspace(
     on_stdout: Callable[[str], Awaitable[None]],
     on_stderr: Callable[[str], Awaitable[None]],
     cancel_event: asyncio.Event | None = None,
+    on_progress: Callable[[str, str], Awaitable[None]] | None = None,
+    extra_env: dict[str, str] | None = None,
+    kill_policy: KillPolicy | None = None,
+    on_spawn: Callable[[int], None] | None = None,
+    exec_prefix: list[str] | None = None,
     python_exe: str | None = None,
-) -> tuple[Optional[int], bool, bool]:
+) -> ExecResult:
     root = Path(workspace_root).resolve()
     if not root.exists() or not root.is_dir():
         raise ValueError("workspace_root is not a directory")
@@ -242,6 +521,7 @@ async def execute_python_workspace(
     env["PYTHONUTF8"] = "1"
     env["PYTHONIOENCODING"] = "utf-8"
     env["PYTHONPATH"] = str(root) + os.pathsep + str(SDK_ROOT) + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    _apply_extra_env(env, extra_env)
 
     if python_exe:
         # User specified interpreter
@@ -262,59 +542,16 @@ async def execute_python_workspace(
             else:
                 env["PATH"] = str(venv_dir / "bin") + os.pathsep + env.get("PATH", "")
 
-    proc = await asyncio.create_subprocess_exec(
-        actual_python,
-        "-X",
-        "utf8",
-        "-u",
-        str(entry_path),
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        env=env,
-        cwd=str(root),
+    return await _run_process(
+        [actual_python, "-X", "utf8", "-u", str(entry_path)],
+        env,
+        str(root),
+        timeout_s,
+        on_stdout,
+        mapped_stderr,
+        cancel_event,
+        on_progress,
+        kill_policy,
+        on_spawn,
+        exec_prefix,
     )
-
-    tasks: list[asyncio.Task[None]] = []
-    if proc.stdout is not None:
-        tasks.append(asyncio.create_task(_read_stream_lines(proc.stdout, on_stdout)))
-    if proc.stderr is not None:
-        tasks.append(asyncio.create_task(_read_stream_lines(proc.stderr, mapped_stderr)))
-
-    timed_out = False
-    cancelled = False
-    try:
-        cancel_waiter = cancel_event.wait() if cancel_event is not None else None
-        proc_waiter = proc.wait()
-
-        waiters = [asyncio.create_task(proc_waiter)]
-        if cancel_waiter is not None:
-            waiters.append(asyncio.create_task(cancel_waiter))
-
-        done, pending = await asyncio.wait(waiters, timeout=timeout_s, return_when=asyncio.FIRST_COMPLETED)
-        for p in pending:
-            p.cancel()
-
-        if not done:
-            raise asyncio.TimeoutError
-
-        if cancel_event is not None and cancel_event.is_set() and proc.returncode is None:
-            cancelled = True
-            proc.terminate()
-            try:
-                await asyncio.wait_for(proc.wait(), timeout=3)
-            except asyncio.TimeoutError:
-                proc.kill()
-                await proc.wait()
-    except asyncio.TimeoutError:
-        timed_out = True
-        proc.terminate()
-        try:
-            await asyncio.wait_for(proc.wait(), timeout=3)
-        except asyncio.TimeoutError:
-            proc.kill()
-            await proc.wait()
-
-    if tasks:
-        await asyncio.gather(*tasks, return_exceptions=True)
-
-    return proc.returncode, timed_out, cancelled
@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+# model_structure 图的服务端分层布局（Sugiyama）：DFS 去环 -> 最长路径分层 -> 长边插入虚拟节点 ->
+# 重心法上下扫描减少交叉（保留交叉数最少的排列）-> 按相邻层邻居的平均横坐标放置并消除重叠。
+# 大模型按模块层级（SDK 给出的 groups）默认折叠到不超过 MAX_VISIBLE_NODES 个可见节点；
+# 展开一个分组时其余节点保持原位，只对组内节点布局后插入到分组原来的位置（增量）。
+# 布局按 (图哈希, 展开集合) 缓存，同一个模型重复上报不会重复计算
+LAYER_SPACING = 100
+NODE_SPACING = 180
+MAX_VISIBLE_NODES = 200
+CROSSING_SWEEPS = 4
+# 虚拟节点总数上限，超出后长边不再拆分（只影响交叉的估计）
+MAX_DUMMIES = 20000
+GRAPHS_KEPT = 16
+LAYOUTS_KEPT = 256
+GROUP_PREFIX = "group:"
+ARTIFACT = "model_graph.json"
+
+
+def graph_hash(raw: dict[str, Any]) -> str:
+    h = raw.get("hash")
+    if isinstance(h, str) and h:
+        return h
+    shape = {
+        "nodes": [n.get("id") for n in raw.get("nodes", []) if isinstance(n, dict)],
+        "edges": [[e.get("source"), e.get("target")] for e in raw.get("edges", []) if isinstance(e, dict)],
+    }
+    return hashlib.sha1(json.dumps(shape, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _count_crossings(upper: list[int], lower_pos: dict[int, int], down: list[list[int]], upper_pos: dict[int, int]) -> int:
+    """相邻两层间的边交叉数：边按上端位置排序后，下端位置序列的逆序对个数（树状数组）"""
+    ends = sorted((upper_pos[u], lower_pos[v]) for u in upper for v in down[u] if v in lower_pos)
+    size = len(lower_pos) + 1
+    tree = [0] * (size + 1)
+    crossings = 0
+    for seen, (_, p) in enumerate(ends):
+        # 已插入的下端中位置大于 p 的个数
+        i, le = p + 1, 0
+        while i > 0:
+            le += tree[i]
+            i -= i & -i
+        crossings += seen - le
+        i = p + 1
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+def _place(desired: list[float]) -> list[float]:
+    """按顺序放置，保证最小间距；整体平移使总偏移为零，避免逐层向右漂移"""
+    xs: list[float] = []
+    for d in desired:
+        xs.append(max(d, xs[-1] + NODE_SPACING) if xs else d)
+    shift = sum(d - x for d, x in zip(desired, xs)) / len(xs) if xs else 0.0
+    return [x + shift for x in xs]
+
+
+def layered_layout(ids: list[str], edges: Iterable[tuple[str, str]]) -> dict[str, tuple[float, int]]:
+    """返回 {节点: (横坐标, 层号)}；ids 的顺序作为初始排列（SDK 给出的是拓扑序）"""
+    index = {v: i for i, v in enumerate(ids)}
+    n = len(ids)
+    succ: list[list[int]] = [[] for _ in range(n)]
+    pairs: set[tuple[int, int]] = set()
+    for s, t in edges:
+        i, j = index[s], index[t]
+        if i != j and (i, j) not in pairs:
+            pairs.add((i, j))
+            succ[i].append(j)
+
+    # 1. 去环：迭代 DFS，回边反向
+    state = [0] * n
+    dag: set[tuple[int, int]] = set()
+    for root in range(n):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(succ[root]))]
+        while stack:
+            v, it = stack[-1]
+            for w in it:
+                if state[w] == 1:
+                    dag.add((w, v))
+                    continue
+                dag.add((v, w))
+                if state[w] == 0:
+                    state[w] = 1
+                    stack.append((w, iter(succ[w])))
+                    break
+            else:
+                state[v] = 2
+                stack.pop()
+
+    # 2. 最长路径分层
+    out: list[list[int]] = [[] for _ in range(n)]
+    indeg = [0] * n
+    for u, v in dag:
+        out[u].append(v)
+        indeg[v] += 1
+    layer = [0] * n
+    queue = [v for v in range(n) if indeg[v] == 0]
+    for v in queue:
+        for w in out[v]:
+            layer[w] = max(layer[w], layer[v] + 1)
+            indeg[w] -= 1
+            if indeg[w] == 0:
+                queue.append(w)
+
+    # 3. 跨多层的边拆成经过虚拟节点的链
+    down: list[list[int]] = [[] for _ in range(n)]
+    up: list[list[int]] = [[] for _ in range(n)]
+    total = n
+    for u, v in sorted(dag):
+        span = layer[v] - layer[u]
+        chain = [u]
+        if span > 1 and total - n + span - 1 <= MAX_DUMMIES:
+            for k in range(1, span):
+                layer.append(layer[u] + k)
+                down.append([])
+                up.append([])
+                chain.append(total)
+                total += 1
+        chain.append(v)
+        for a, b in zip(chain, chain[1:]):
+            down[a].append(b)
+            up[b].append(a)
+
+    depth = max(layer, default=-1) + 1
+    layers: list[list[int]] = [[] for _ in range(depth)]
+    for v in range(total):
+        layers[layer[v]].append(v)
+
+    # 4. 交叉消减：重心法上下扫描，保留交叉最少的排列
+    def positions() -> list[dict[int, int]]:
+        return [{v: i for i, v in enumerate(row)} for row in layers]
+
+    def crossings(pos: list[dict[int, int]]) -> int:
+        return sum(_count_crossings(layers[k], pos[k + 1], down, pos[k]) for k in range(depth - 1))
+
+    pos = positions()
+    best, best_layers = crossings(pos), [list(row) for row in layers]
+    for sweep in range(CROSSING_SWEEPS * 2):
+        downward = sweep % 2 == 0
+        rng = range(1, depth) if downward else range(depth - 2, -1, -1)
+        for k in rng:
+            ref, nbrs = (pos[k - 1], up) if downward else (pos[k + 1], down)
+            cur = pos[k]
+
+            def bary(v: int) -> float:
+                ns = [ref[u] for u in nbrs[v] if u in ref]
+                return sum(ns) / len(ns) if ns else cur[v]
+
+            layers[k].sort(key=bary)
+            pos[k] = {v: i for i, v in enumerate(layers[k])}
+        c = crossings(pos)
+        if c < best:
+            best, best_layers = c, [list(row) for row in layers]
+        if best == 0:
+            break
+    layers = best_layers
+
+    # 5. 横坐标：先按序号排开，再向相邻层邻居的平均位置靠拢
+    x = [0.0] * total
+    for row in layers:
+        for i, v in enumerate(row):
+            x[v] = i * NODE_SPACING
+    for sweep in range(2):
+        downward = sweep % 2 == 0
+        rng = range(1, depth) if downward else range(depth - 2, -1, -1)
+        nbrs = up if downward else down
+        for k in rng:
+            row = layers[k]
+            desired = []
+            for v in row:
+                ns = nbrs[v]
+                desired.append(sum(x[u] for u in ns) / len(ns) if ns else x[v])
+            for v, xv in zip(row, _place(desired)):
+                x[v] = xv
+    left = min((x[v] for v in range(n)), default=0.0)
+    return {ids[v]: (x[v] - left, layer[v]) for v in range(n)}
+
+
+class ModelGraph:
+    """SDK 上报的完整图；节点的 data.group 是所在模块路径，groups 给出分组的父子关系"""
+
+    def __init__(self, raw: dict[str, Any]) -> None:
+        self.raw = raw
+        self.hash = graph_hash(raw)
+        self.nodes = [n for n in raw.get("nodes", []) if isinstance(n, dict) and "id" in n]
+        ids = {n["id"] for n in self.nodes}
+        self.edges = [e for e in raw.get("edges", []) if isinstance(e, dict) and e.get("source") in ids and e.get("target") in ids]
+        self.groups = {g["id"]: g for g in raw.get("groups") or [] if isinstance(g, dict) and "id" in g}
+        # 被引用但没有给出的分组按顶层分组补上
+        referenced = [(n.get("data") or {}).get("group") for n in self.nodes] + [g.get("parent") for g in list(self.groups.values())]
+        for g in referenced:
+            if isinstance(g, str) and g not in self.groups:
+                self.groups[g] = {"id": g, "type": "Module", "parent": None}
+        self._chains: dict[Optional[str], tuple[str, ...]] = {None: ()}
+        self.chain = {n["id"]: self.group_chain((n.get("data") or {}).get("group")) for n in self.nodes}
+        self.depth = {g: len(self.group_chain(g)) - 1 for g in self.groups}
+        self._default: Optional[frozenset[str]] = None
+
+    def group_chain(self, group: Optional[str]) -> tuple[str, ...]:
+        """从最外层到 group 自身的分组路径"""
+        if group not in self._chains:
+            # 先占位，父子关系成环时不会无限递归
+            self._chains[group] = (group,)
+            parent = self.groups.get(group, {}).get("parent")
+            self._chains[group] = self.group_chain(parent) + (group,)
+        return self._chains[group]
+
+    def rep(self, node_id: str, expanded: frozenset[str]) -> str:
+        """可见的代表：最外层未展开的分组，或节点本身"""
+        for g in self.chain[node_id]:
+            if g not in expanded:
+                return GROUP_PREFIX + g
+        return node_id
+
+    def default_expanded(self) -> frozenset[str]:
+        """逐层展开分组，直到再展开一层就会超过 MAX_VISIBLE_NODES"""
+        if self._default is not None:
+            return self._default
+        expanded: frozenset[str] = frozenset()
+        for d in range(max(self.depth.values(), default=-1) + 1):
+            candidate = expanded | {g for g, gd in self.depth.items() if gd == d}
+            if len({self.rep(n["id"], candidate) for n in self.nodes}) > MAX_VISIBLE_NODES:
+                break
+            expanded = candidate
+        self._default = expanded
+        return expanded
+
+    def view(self, expanded: frozenset[str]) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """折叠后的可见节点与合并后的边（同一对端点只保留一条，count 记录原始条数）"""
+        visible: dict[str, dict[str, Any]] = {}
+        members: dict[str, int] = {}
+        for n in self.nodes:
+            r = self.rep(n["id"], expanded)
+            if r == n["id"]:
+                visible[r] = n
+                continue
+            members[r] = members.get(r, 0) + 1
+            if r not in visible:
+                g = r[len(GROUP_PREFIX) :]
+                info = self.groups.get(g, {})
+                data = {
+                    "type": info.get("type", "Module"),
+                    "label": g,
+                    "group": info.get("parent"),
+                    "collapsed": True,
+                }
+                if info.get("params"):
+                    data["params"] = f"{info['params']:,}"
+                visible[r] = {"id": r, "type": "layer", "data": data}
+        for r, count in members.items():
+            visible[r]["data"]["children"] = count
+        merged: dict[tuple[str, str], dict[str, Any]] = {}
+        for e in self.edges:
+            s, t = self.rep(e["source"], expanded), self.rep(e["target"], expanded)
+            if s == t:
+                continue
+            edge = merged.get((s, t))
+            if edge is None:
+                edge = merged[(s, t)] = {"source": s, "target": t, "data": {**(e.get("data") or {}), "count": 0}}
+                if e.get("label"):
+                    edge["label"] = e["label"]
+            edge["data"]["count"] += 1
+        edges = list(merged.values())
+        for i, e in enumerate(edges):
+            e["id"] = f"e-{i}"
+        return list(visible.values()), edges
+
+
+class LayoutCache:
+    def __init__(self) -> None:
+        self._graphs: OrderedDict[str, ModelGraph] = OrderedDict()
+        self._layouts: OrderedDict[tuple[str, frozenset[str]], dict[str, Any]] = OrderedDict()
+        # 布局在线程池里计算（见 ws.py），缓存的读写需要互斥
+        self._lock = threading.RLock()
+
+    def add(self, raw: dict[str, Any]) -> ModelGraph:
+        with self._lock:
+            return self._add(raw)
+
+    def _add(self, raw: dict[str, Any]) -> ModelGraph:
+        h = graph_hash(raw)
+        graph = self._graphs.get(h)
+        if graph is None:
+            graph = self._graphs[h] = ModelGraph(raw)
+            while len(self._graphs) > GRAPHS_KEPT:
+                self._graphs.popitem(last=False)
+        self._graphs.move_to_end(h)
+        return graph
+
+    def for_run(self, store: Any, run_id: str, graph_hash_: Optional[str] = None) -> Optional[ModelGraph]:
+        """按哈希取内存中的图，不在时从 run 的附件读回"""
+        with self._lock:
+            if graph_hash_ and graph_hash_ in self._graphs:
+                return self._graphs[graph_hash_]
+        raw = store.read_artifact(run_id, ARTIFACT)
+        return self.add(json.loads(raw)) if raw is not None else None
+
+    def layout(self, graph: ModelGraph, expanded: Optional[Iterable[str]] = None) -> dict[str, Any]:
+        with self._lock:
+            return self._layout(graph, expanded)
+
+    def _layout(self, graph: ModelGraph, expanded: Optional[Iterable[str]] = None) -> dict[str, Any]:
+        exp = graph.default_expanded() if expanded is None else frozenset(g for g in expanded if g in graph.groups)
+        key = (graph.hash, exp)
+        cached = self._layouts.get(key)
+        if cached is None:
+            cached = self._compute(graph, exp)
+            self._layouts[key] = cached
+            while len(self._layouts) > LAYOUTS_KEPT:
+                self._layouts.popitem(last=False)
+        self._layouts.move_to_end(key)
+        return cached
+
+    def toggle(self, graph: ModelGraph, expanded: Optional[Iterable[str]], group: str, collapse: bool = False) -> dict[str, Any]:
+        """展开或折叠一个分组；折叠时连同其下已展开的子分组一起折叠"""
+        if group not in graph.groups:
+            raise ValueError(f"unknown group: {group}")
+        current = graph.default_expanded() if expanded is None else frozenset(g for g in expanded if g in graph.groups)
+        if collapse:
+            return self.layout(graph, frozenset(g for g in current if group not in graph.group_chain(g)))
+        # 祖先未展开时先展开祖先使该分组可见，再在其布局上增量展开
+        parents = current | set(graph.group_chain(group)[:-1])
+        self.layout(graph, parents)
+        return self.layout(graph, parents | {group})
+
+    def _compute(self, graph: ModelGraph, expanded: frozenset[str]) -> dict[str, Any]:
+        nodes, edges = graph.view(expanded)
+        coords: Optional[dict[str, tuple[float, float]]] = None
+        incremental = None
+        for g in expanded:
+            prev = self._layouts.get((graph.hash, expanded - {g}))
+            if prev is not None and GROUP_PREFIX + g in prev["positions"]:
+                coords = self._expand(graph, prev, g, nodes, edges)
+                incremental = g
+                if coords is not None:
+                    break
+        if coords is None:
+            incremental = None
+            placed = layered_layout([n["id"] for n in nodes], ((e["source"], e["target"]) for e in edges))
+            coords = {v: (x, layer * LAYER_SPACING) for v, (x, layer) in placed.items()}
+        out_nodes = [{**n, "position": {"x": round(coords[n["id"]][0]), "y": round(coords[n["id"]][1])}} for n in nodes]
+        return {
+            "hash": graph.hash,
+            "method": graph.raw.get("method"),
+            "expanded": sorted(expanded),
+            "total_nodes": len(graph.nodes),
+            "groups": list(graph.groups.values()),
+            "incremental": incremental,
+            "nodes": out_nodes,
+            "edges": edges,
+            # 增量展开用的坐标表，不发给前端
+            "positions": coords,
+        }
+
+    @staticmethod
+    def _expand(
+        graph: ModelGraph, prev: dict[str, Any], group: str, nodes: list[dict[str, Any]], edges: list[dict[str, Any]]
+    ) -> Optional[dict[str, tuple[float, float]]]:
+        """其余节点保持原位：分组原位置以下的层整体下移组内布局的高度，同层右侧的节点右移组内布局的宽度"""
+        old = prev["positions"]
+        gx, gy = old[GROUP_PREFIX + group]
+        inner = [n["id"] for n in nodes if n["id"] not in old]
+
+        def inside(v: str) -> bool:
+            if v.startswith(GROUP_PREFIX):
+                return group in graph.group_chain(v[len(GROUP_PREFIX) :])
+            return group in graph.chain[v]
+
+        # 新出现的节点必须都来自这个分组，否则退回整体布局
+        if not all(inside(v) for v in inner):
+            return None
+        inner_set = set(inner)
+        placed = layered_layout(inner, ((e["source"], e["target"]) for e in edges if e["source"] in inner_set and e["target"] in inner_set))
+        height = max((layer for _, layer in placed.values()), default=0)
+        width = max((x for x, _ in placed.values()), default=0.0)
+        coords: dict[str, tuple[float, float]] = {}
+        for n in nodes:
+            v = n["id"]
+            if v in inner_set:
+                x, layer = placed[v]
+                coords[v] = (gx + x, gy + layer * LAYER_SPACING)
+                continue
+            x, y = old[v]
+            if y > gy:
+                y += height * LAYER_SPACING
+            elif y == gy and x > gx:
+                x += width
+            coords[v] = (x, y)
+        return coords
+
+
+def public_layout(layout: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in layout.items() if k != "positions"}
+
+
+_default_cache: Optional[LayoutCache] = None
+
+
+def get_layout_cache() -> LayoutCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LayoutCache()
+    return _default_cache
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import json
+import os
+import signal
+import sys
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Any, Optional
+
+import psutil
+
+from .diagnostics import Diagnostic, is_host_oom
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+# 单次运行的资源上限：由一个极小的启动器进程设置 rlimit 后再 exec 目标命令（内核是多线程进程，不能用 preexec_fn）；
+# Linux 上若有可写的 cgroup v2 且启用了 memory/pids 控制器，则内存与进程数改用 cgroup（按 RSS 计、覆盖整棵进程树）
+_CGROUP_ROOT = Path("/sys/fs/cgroup")
+_MB = 1024 * 1024
+# RLIMIT_CPU 软限制触发 SIGXCPU，硬限制再留几秒余量后由内核 SIGKILL
+_CPU_HARD_SLACK_S = 5
+# 启动器：加入 cgroup、设置 rlimit 与 nice 后原地 exec，pid 不变，上限由目标进程及其子进程继承。
+# 以 -I -S 运行，不加载 site / sitecustomize，只用标准库
+_LAUNCHER = """\
+import json, os, resource, sys
+spec = json.loads(sys.argv[1])
+if spec["procs"]:
+    with open(spec["procs"], "w") as f:
+        f.write("0")
+for kind, soft, hard in spec["rlimits"]:
+    resource.setrlimit(kind, (soft, hard))
+if spec["nice"]:
+    os.nice(spec["nice"])
+os.execvp(sys.argv[2], sys.argv[2:])
+"""
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    memory_mb: Optional[float] = None
+    cpu_seconds: Optional[float] = None
+    file_size_mb: Optional[float] = None
+    max_processes: Optional[int] = None
+    # 子进程的 nice 增量，让训练脚本不与内核事件循环争抢 CPU
+    nice: Optional[int] = None
+
+    @classmethod
+    def from_message(cls, raw: Any) -> Optional[ResourceLimits]:
+        """解析 exec 消息里的 limits 字段；未设置任何上限时返回 None"""
+        if raw is None:
+            return None
+        if not isinstance(raw, dict):
+            raise ValueError("limits must be an object")
+        known = {f.name for f in fields(cls)}
+        unknown = set(raw) - known
+        if unknown:
+            raise ValueError(f"unknown limit: {sorted(unknown)[0]}")
+        values: dict[str, Any] = {}
+        for key, value in raw.items():
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"limit {key} must be a number")
+            if key != "nice" and value <= 0:
+                raise ValueError(f"limit {key} must be positive")
+            values[key] = int(value) if key in ("max_processes", "nice") else float(value)
+        if not values:
+            return None
+        if resource is None:
+            raise ValueError("resource limits are not supported on this platform")
+        return cls(**values)
+
+
+def _cgroup_parent(controllers: set[str]) -> Optional[Path]:
+    """内核自身 cgroup 的父级（v2 不允许向有进程的组下挂带控制器的子组，所以建兄弟组）"""
+    if not sys.platform.startswith("linux") or not (_CGROUP_ROOT / "cgroup.controllers").exists():
+        return None
+    try:
+        lines = Path("/proc/self/cgroup").read_text().splitlines()
+    except OSError:
+        return None
+    own = next((l[3:] for l in lines if l.startswith("0::")), None)
+    if own is None:
+        return None
+    parent = (_CGROUP_ROOT / own.lstrip("/")).parent
+    try:
+        enabled = set((parent / "cgroup.subtree_control").read_text().split())
+    except OSError:
+        return None
+    if not controllers <= enabled or not os.access(parent, os.W_OK):
+        return None
+    return parent
+
+
+def _read_events(path: Path) -> dict[str, int]:
+    try:
+        pairs = (line.split() for line in path.read_text().splitlines())
+        return {k: int(v) for k, v in pairs}
+    except (OSError, ValueError):
+        return {}
+
+
+class LimitEnforcer:
+    def __init__(self, limits: ResourceLimits, run_id: str) -> None:
+        self.limits = limits
+        self.cgroup: Optional[Path] = None
+        self.mechanism: dict[str, str] = {}
+        self._rlimits: list[tuple[int, int, int]] = []
+
+        wanted = set()
+        if limits.memory_mb is not None:
+            wanted.add("memory")
+        if limits.max_processes is not None:
+            wanted.add("pids")
+        if wanted:
+            self.cgroup = self._create_cgroup(run_id, wanted)
+
+        if limits.memory_mb is not None and "memory" not in self.mechanism:
+            # 退回到 RLIMIT_AS：限制的是虚拟地址空间，CUDA 等大量预留地址的库可能需要放宽
+            size = int(limits.memory_mb * _MB)
+            self._rlimits.append((resource.RLIMIT_AS, size, size))
+            self.mechanism["memory"] = "rlimit_as"
+        if limits.cpu_seconds is not None:
+            soft = max(int(limits.cpu_seconds), 1)
+            self._rlimits.append((resource.RLIMIT_CPU, soft, soft + _CPU_HARD_SLACK_S))
+            self.mechanism["cpu_seconds"] = "rlimit"
+        if limits.file_size_mb is not None:
+            size = int(limits.file_size_mb * _MB)
+            self._rlimits.append((resource.RLIMIT_FSIZE, size, size))
+            self.mechanism["file_size"] = "rlimit"
+        if limits.max_processes is not None and "processes" not in self.mechanism and hasattr(resource, "RLIMIT_NPROC"):
+            # RLIMIT_NPROC 按用户计数：在当前用户已有进程数之上再允许 max_processes 个（root 不受其约束）
+            uid = os.getuid()
+            current = 0
+            for p in psutil.process_iter(["uids"]):
+                uids = p.info.get("uids")
+                if uids is not None and uids.real == uid:
+                    current += 1
+            n = current + limits.max_processes
+            self._rlimits.append((resource.RLIMIT_NPROC, n, n))
+            self.mechanism["processes"] = "rlimit_nproc"
+
+    def _create_cgroup(self, run_id: str, controllers: set[str]) -> Optional[Path]:
+        parent = _cgroup_parent(controllers)
+        if parent is None:
+            return None
+        path = parent / f"deepinsight-{run_id}"
+        try:
+            path.mkdir()
+            if self.limits.memory_mb is not None:
+                (path / "memory.max").write_text(str(int(self.limits.memory_mb * _MB)))
+                try:
+                    (path / "memory.swap.max").write_text("0")
+                except OSError:
+                    pass
+                self.mechanism["memory"] = "cgroup"
+            if self.limits.max_processes is not None:
+                (path / "pids.max").write_text(str(self.limits.max_processes))
+                self.mechanism["processes"] = "cgroup"
+        except OSError:
+            self.mechanism.pop("memory", None)
+            self.mechanism.pop("processes", None)
+            try:
+                path.rmdir()
+            except OSError:
+                pass
+            return None
+        return path
+
+    def command_prefix(self) -> list[str]:
+        """返回加在子进程命令行之前的启动器参数"""
+        spec = {
+            "procs": str(self.cgroup / "cgroup.procs") if self.cgroup is not None else None,
+            "rlimits": list(self._rlimits),
+            "nice": self.limits.nice,
+        }
+        return [sys.executable, "-I", "-S", "-c", _LAUNCHER, json.dumps(spec)]
+
+    def describe(self) -> dict[str, Any]:
+        out = {k: v for k, v in asdict(self.limits).items() if v is not None}
+        out["mechanism"] = dict(self.mechanism)
+        return out
+
+    def classify(
+        self,
+        exit_code: Optional[int],
+        fired: dict[str, Diagnostic],
+        cpu_seconds: Optional[float],
+    ) -> Optional[dict[str, Any]]:
+        """根据退出码、cgroup 事件计数与已触发的诊断判断撞到了哪个上限"""
+        lim = self.limits
+        mem_events = _read_events(self.cgroup / "memory.events") if self.cgroup is not None else {}
+        pid_events = _read_events(self.cgroup / "pids.events") if self.cgroup is not None else {}
+        sigxcpu = -getattr(signal, "SIGXCPU", 0)
+
+        if lim.memory_mb is not None and (
+            mem_events.get("oom_kill", 0) > 0 or ("oom" in fired and is_host_oom(fired["oom"]))
+        ):
+            return {"limit": "memory_mb", "value": lim.memory_mb, "message": f"运行超出内存上限 {lim.memory_mb:g} MB"}
+        if lim.cpu_seconds is not None and (
+            (sigxcpu and exit_code == sigxcpu)
+            or (exit_code == -signal.SIGKILL and cpu_seconds is not None and cpu_seconds >= lim.cpu_seconds * 0.9)
+        ):
+            return {"limit": "cpu_seconds", "value": lim.cpu_seconds, "message": f"运行超出 CPU 时间上限 {lim.cpu_seconds:g} 秒"}
+        if lim.file_size_mb is not None and "file_too_large" in fired:
+            return {"limit": "file_size_mb", "value": lim.file_size_mb, "message": f"写出的文件超过上限 {lim.file_size_mb:g} MB"}
+        if lim.max_processes is not None and (pid_events.get("max", 0) > 0 or "process_limit" in fired):
+            return {"limit": "max_processes", "value": lim.max_processes, "message": f"子进程数超过上限 {lim.max_processes}"}
+        return None
+
+    def close(self) -> None:
+        if self.cgroup is not None:
+            try:
+                self.cgroup.rmdir()
+            except OSError:
+                pass
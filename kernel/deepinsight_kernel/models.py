@@ -56,14 +56,217 @@ class WsOom(TypedDict, total=False):
     message: str
     likely_location: Optional[str]
     suggestions: list[str]
+    allocators: Optional[list[dict[str, Any]]]
 
 
+class WsDiagnostic(TypedDict, total=False):
+    type: Literal["diagnostic"]
+    run_id: str
+    # oom | cuda_assert | shape_mismatch | nan_loss | dataloader_crash | file_too_large | process_limit | repeated_warning
+    rule: str
+    severity: Literal["error", "warning"]
+    title: str
+    message: str
+    location: Optional[str]
+    suggestions: list[str]
+    count: int
+    # 触发该诊断的日志行号（来自指标或运行结束汇总时为 None）
+    line: Optional[int]
+    # 仅 oom：deepinsight.memory_profile 最近上报的增长最多的分配位置
+    allocators: list[dict[str, Any]]
+
+
+class WsAlert(TypedDict, total=False):
+    type: Literal["alert"]
+    run_id: str
+    name: str
+    kind: Literal["nan", "spike", "divergence", "plateau"]
+    step: int
+    value: Optional[float]
+    message: str
+    severity: Literal["error", "warning"]
+    mean: float
+    std: float
+    best: Optional[float]
+    best_step: int
+    stop_run: bool
+
 
 class WsDone(TypedDict):
     type: Literal["done"]
     run_id: str
     exit_code: Optional[int]
     timed_out: bool
+    # 经由控制通道请求优雅停止时的原因（user 或 alert:<指标>:<类型>）
+    stop_reason: Optional[str]
+    # 进程树清理后仍存活的后代进程，正常为空
+    leaked_pids: list[int]
+    # wall_s, cpu_seconds, peak_rss_bytes, peak_uss_bytes, peak_processes, read_bytes, write_bytes, samples
+    resources: Optional[dict[str, Any]]
+    # 撞到的资源上限：{limit: memory_mb|cpu_seconds|file_size_mb|max_processes, value, message}，未撞到为 None
+    limit_hit: Optional[dict[str, Any]]
+
+
+class WsRunResource(TypedDict, total=False):
+    type: Literal["run_resource"]
+    run_id: str
+    ts: float
+    processes: int
+    cpu_percent: float
+    cpu_seconds: float
+    rss_bytes: int
+    uss_bytes: int
+    threads: int
+    open_files: int
+    read_bytes: int
+    write_bytes: int
+    read_bytes_per_s: float
+    write_bytes_per_s: float
+
+
+class WsProfile(TypedDict, total=False):
+    type: Literal["profile"]
+    run_id: str
+    samples: int
+    interval_s: float
+    # 火焰图树：{name, value, children}，已剪掉占比过小的节点
+    tree: dict[str, Any]
+    # 自身采样数最多的函数：{name, samples, fraction}
+    hotspots: list[dict[str, Any]]
+
+
+class WsLineProfileFile(TypedDict):
+    # 与 traceback 路径一致：工作区内为相对路径
+    path: str
+    total_ms: float
+    max_ms: float
+    # [行号, 命中次数, 累计毫秒]
+    lines: list[list[Any]]
+
+
+class WsLineProfile(TypedDict, total=False):
+    type: Literal["line_profile"]
+    run_id: str
+    total_ms: float
+    files: list[WsLineProfileFile]
+
+
+class WsSpanStats(TypedDict, total=False):
+    type: Literal["span_stats"]
+    run_id: str
+    # 按总时长降序：名称 -> {count, total_ms, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}
+    phases: dict[str, dict[str, Any]]
+    # deepinsight.tool 包装的工具：名称 -> 同上 + errors
+    tools: dict[str, dict[str, Any]]
+
+
+class WsAgentTrace(TypedDict, total=False):
+    type: Literal["agent_trace"]
+    run_id: str
+    # 增量：{id, parent, episode, role, name, content, result, error, source, ts(us), dur(us)}
+    spans: list[dict[str, Any]]
+
+
+class WsAgentEpisode(TypedDict, total=False):
+    type: Literal["agent_episode"]
+    run_id: str
+    episode: int
+    name: str
+    duration_ms: float
+    spans: int
+    error: Optional[str]
+    # 关键路径（先序）：{id, name, role, dur_ms, self_ms}
+    critical_path: list[dict[str, Any]]
+    # 关键路径上自身耗时最长的 span
+    bottleneck: Optional[dict[str, Any]]
+
+
+class WsModelLayout(TypedDict, total=False):
+    type: Literal["model_layout"]
+    request_id: Any
+    run_id: str
+    hash: str
+    method: Optional[str]
+    # 当前展开的分组；未展开的分组显示为 id 为 "group:<路径>" 的折叠节点
+    expanded: list[str]
+    total_nodes: int
+    groups: list[dict[str, Any]]
+    # 增量展开的分组（其余节点保持原位）；整体重新布局时为 None
+    incremental: Optional[str]
+    nodes: list[dict[str, Any]]
+    edges: list[dict[str, Any]]
+
+
+class WsControl(TypedDict, total=False):
+    type: Literal["control"]
+    request_id: Any
+    run_id: str
+    action: Literal["stop_gracefully", "pause", "resume", "set_param"]
+    # 控制文件的序号，子进程回报的 control_ack.seq 与之对应
+    seq: int
+    name: Optional[str]
+    value: Any
+    reason: Optional[str]
+
+
+class WsControlAck(TypedDict, total=False):
+    type: Literal["control_ack"]
+    run_id: str
+    seq: int
+    state: Literal["running", "paused", "stopping"]
+    params: dict[str, Any]
+
+
+class WsSeries(TypedDict, total=False):
+    type: Literal["series"]
+    request_id: Any
+    run_id: str
+    name: str
+    steps: list[int]
+    values: list[Optional[float]]
+    level: int
+    method: str
+    source_points: int
+
+
+class WsCompareRun(TypedDict):
+    run_id: str
+    values: list[Optional[float]]
+    summary: Optional[dict[str, Any]]
+
+
+class WsCompare(TypedDict, total=False):
+    type: Literal["compare"]
+    request_id: Any
+    name: str
+    grid: Literal["step", "time"]
+    x: list[float]
+    runs: list[WsCompareRun]
+
+
+class WsOutputSuppressed(TypedDict):
+    type: Literal["output_suppressed"]
+    run_id: str
+    count: int
+    from_line: int
+    to_line: int
+
+
+class WsLogRange(TypedDict, total=False):
+    type: Literal["log_range"]
+    request_id: Any
+    run_id: str
+    from_line: int
+    lines: list[dict[str, Any]]
+    total_lines: int
+
+
+class WsSearchLogs(TypedDict, total=False):
+    type: Literal["search_logs"]
+    request_id: Any
+    query: str
+    # 每项：run_id, line, stream, ts, data；按 run 新近程度倒序
+    results: list[dict[str, Any]]
 
 
 class WsError(TypedDict):
@@ -72,7 +275,7 @@ class WsError(TypedDict):
     run_id: Optional[str]
 
 
-WsServerMessage = Union[WsHello, WsStart, WsStdout, WsStderr, WsMetric, WsHw, WsOom, WsDone, WsError]
+WsServerMessage = Union[WsHello, WsStart, WsStdout, WsStderr, WsMetric, WsHw, WsOom, WsDiagnostic, WsAlert, WsDone, WsRunResource, WsProfile, WsLineProfile, WsSpanStats, WsAgentTrace, WsAgentEpisode, WsModelLayout, WsControl, WsControlAck, WsSeries, WsCompare, WsOutputSuppressed, WsLogRange, WsSearchLogs, WsError]
 
 
 class WsExec(TypedDict, total=False):
@@ -82,6 +285,22 @@ class WsExec(TypedDict, total=False):
     entry: str
     files: list[dict[str, Any]]
     workspace_root: str
+    max_lines_per_s: float
+    # 指标名或通配符 -> AlertConfig 字段覆盖；false 关闭该指标的检测
+    alerts: dict[str, Any]
+    # 取消/超时时 SIGINT、SIGTERM 各自的宽限期（秒），之后 SIGKILL
+    sigint_grace_s: float
+    sigterm_grace_s: float
+    # 主进程正常退出后是否结束仍留在进程组里的后代，默认 false（只在 done.leaked_pids 里报告）
+    reap_on_exit: bool
+    # 进程树资源采样间隔（秒），0 关闭
+    resource_interval_s: float
+    # 资源上限：memory_mb, cpu_seconds, file_size_mb, max_processes, nice
+    limits: dict[str, Any]
+    # 统计采样 profiler：true 或 {"interval_ms": n}
+    profile: Any
+    # 仅对工作区文件逐行计时，结束时发送 line_profile
+    line_profile: bool
 
 
 class WsCancel(TypedDict, total=False):
@@ -89,8 +308,77 @@ class WsCancel(TypedDict, total=False):
     run_id: str
 
 
+class WsControlQuery(TypedDict, total=False):
+    type: Literal["control"]
+    request_id: Any
+    run_id: str
+    action: Literal["stop_gracefully", "pause", "resume", "set_param"]
+    name: str
+    value: Any
+    # stop_gracefully 的宽限期，超时后按 cancel 处理
+    grace_s: float
+
+
 class WsRequestSystemInfo(TypedDict):
     type: Literal["request_system_info"]
 
 
-WsClientMessage = Union[WsExec, WsCancel, WsRequestSystemInfo, dict[str, Any]]
+class WsSeriesQuery(TypedDict, total=False):
+    type: Literal["series"]
+    request_id: Any
+    run_id: str
+    name: str
+    step_from: int
+    step_to: int
+    max_points: int
+    method: Literal["lttb", "minmax"]
+
+
+class WsCompareQuery(TypedDict, total=False):
+    type: Literal["compare"]
+    request_id: Any
+    run_ids: list[str]
+    name: str
+    grid: Literal["step", "time"]
+    points: int
+    mode: Literal["min", "max"]
+
+
+class WsExpandGroupQuery(TypedDict, total=False):
+    type: Literal["expand_group"]
+    request_id: Any
+    run_id: str
+    hash: str
+    group: str
+    # 客户端当前的展开集合；省略时按默认折叠视图
+    expanded: list[str]
+    collapse: bool
+
+
+class WsLogRangeQuery(TypedDict, total=False):
+    type: Literal["log_range"]
+    request_id: Any
+    run_id: str
+    from_line: int
+    to_line: int
+
+
+class WsSearchLogsQuery(TypedDict, total=False):
+    type: Literal["search_logs"]
+    request_id: Any
+    query: str
+    limit: int
+
+
+WsClientMessage = Union[
+    WsExec,
+    WsCancel,
+    WsControlQuery,
+    WsRequestSystemInfo,
+    WsSeriesQuery,
+    WsCompareQuery,
+    WsExpandGroupQuery,
+    WsLogRangeQuery,
+    WsSearchLogsQuery,
+    dict[str, Any],
+]
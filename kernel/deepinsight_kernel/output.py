@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+# 输出洪峰控制：令牌桶限制转发到前端的行数，超出部分只落盘，
+# 之后以“已省略 N 行”标记 + 最后若干行尾巴的形式补发
+DEFAULT_LINES_PER_S = 200.0
+DEFAULT_BURST = 2000
+DEFAULT_TAIL = 20
+MARKER_INTERVAL_S = 1.0
+
+
+def parse_lines_per_s(raw: Any) -> float:
+    """解析 exec 消息里的 max_lines_per_s，缺省时用 DEFAULT_LINES_PER_S"""
+    if raw is None:
+        return DEFAULT_LINES_PER_S
+    if isinstance(raw, bool):
+        raise ValueError("max_lines_per_s must be a number")
+    value = float(raw)
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError("max_lines_per_s must be a finite number > 0")
+    return value
+
+
+@dataclass
+class SuppressedSpan:
+    count: int
+    from_line: int
+    to_line: int
+    tail: list[tuple[int, str, str]]
+
+
+@dataclass
+class OutputThrottle:
+    lines_per_s: float = DEFAULT_LINES_PER_S
+    burst: int = DEFAULT_BURST
+    tail_lines: int = DEFAULT_TAIL
+    marker_interval_s: float = MARKER_INTERVAL_S
+
+    _tokens: float = field(init=False)
+    _last_refill: Optional[float] = field(init=False, default=None)
+    _last_marker: float = field(init=False, default=0.0)
+    _count: int = field(init=False, default=0)
+    _first: int = field(init=False, default=-1)
+    _last: int = field(init=False, default=-1)
+    _tail: deque[tuple[int, str, str]] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self._tokens = float(self.burst)
+        self._tail = deque(maxlen=self.tail_lines)
+
+    def _refill(self, now: float) -> None:
+        if self._last_refill is not None:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.lines_per_s)
+        self._last_refill = now
+
+    def offer(self, now: float, line_no: int, stream: str, data: str) -> bool:
+        """返回 True 表示该行可以直接转发（此前若有被省略的区间，调用方先用 take_due(force=True) 补发）；
+        否则记入被省略的区间"""
+        self._refill(now)
+        # 恢复转发时尾巴也会补发，一并从令牌里扣除
+        need = 1.0 + (len(self._tail) if self._count else 0)
+        if self._tokens >= need:
+            self._tokens -= need
+            return True
+        if self._count == 0:
+            self._first = line_no
+            self._last_marker = now
+        self._count += 1
+        self._last = line_no
+        self._tail.append((line_no, stream, data))
+        return False
+
+    def take_due(self, now: float, force: bool = False) -> Optional[SuppressedSpan]:
+        """到了补发时间（或 force）时取出当前被省略的区间，并重新开始计数"""
+        if self._count == 0:
+            return None
+        if not force and now - self._last_marker < self.marker_interval_s:
+            return None
+        tail = list(self._tail)
+        # 尾巴里的行会补发出去，不计入省略数
+        span = SuppressedSpan(
+            count=self._count - len(tail),
+            from_line=self._first,
+            to_line=tail[0][0] if tail else self._last + 1,
+            tail=tail,
+        )
+        self._count = 0
+        self._first = self._last = -1
+        self._tail.clear()
+        self._last_marker = now
+        return span
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+# 子进程内的统计采样 profiler（见 boot/sitecustomize.py）把调用栈增量追加到一个 JSON 行文件：
+# {"pid", "frames": {id: [file, name, firstlineno]}, "stacks": {"id;id;...": count}}。
+# 内核按偏移增量读取，把帧映射为相对工作区的标签后合并成一棵火焰图树。
+# 逐行计时（line_profile）由同一个引导脚本完成，运行结束后合并各进程的快照成按文件的行表
+BOOT_ROOT = Path(__file__).parent / "boot"
+PROFILE_ENV = "DEEPINSIGHT_PROFILE"
+PROFILE_OUT_ENV = "DEEPINSIGHT_PROFILE_OUT"
+LINE_PROFILE_ENV = "DEEPINSIGHT_LINE_PROFILE"
+LINE_PROFILE_OUT_ENV = "DEEPINSIGHT_LINE_PROFILE_OUT"
+DEFAULT_PROFILE_INTERVAL_S = 0.01
+MIN_PROFILE_INTERVAL_S = 0.001
+# 推送给前端的树只保留占比不低于该值的节点
+PROFILE_MIN_FRACTION = 0.002
+PROFILE_HOTSPOTS = 20
+
+
+def parse_profile_option(raw: Any) -> Optional[float]:
+    """解析 exec 消息里的 profile：true 或 {"interval_ms": n}；返回采样间隔（秒），关闭时为 None"""
+    if raw is None or raw is False:
+        return None
+    if raw is True:
+        return DEFAULT_PROFILE_INTERVAL_S
+    if not isinstance(raw, dict):
+        raise ValueError("profile must be a boolean or an object")
+    unknown = set(raw) - {"interval_ms"}
+    if unknown:
+        raise ValueError(f"unknown profile option: {sorted(unknown)[0]}")
+    interval_s = float(raw.get("interval_ms", DEFAULT_PROFILE_INTERVAL_S * 1000)) / 1000
+    return max(interval_s, MIN_PROFILE_INTERVAL_S)
+
+
+def _short_path(path: str, root: Optional[str], stdlib: Optional[str]) -> str:
+    """与 _map_trace_path 一致：工作区内的文件显示为相对路径，第三方库与标准库缩短前缀"""
+    norm = path.replace("\\", "/")
+    for prefix, label in ((root, ""), (stdlib, "<stdlib>/")):
+        if prefix:
+            p = prefix.replace("\\", "/").rstrip("/") + "/"
+            if norm.startswith(p):
+                return label + norm[len(p) :]
+    marker = "site-packages/"
+    idx = norm.rfind(marker)
+    if idx >= 0:
+        return norm[idx + len(marker) :]
+    return path
+
+
+class FlameNode:
+    __slots__ = ("name", "value", "children")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.value = 0
+        self.children: dict[str, FlameNode] = {}
+
+    def to_dict(self, min_value: int) -> dict[str, Any]:
+        kids = [c for c in self.children.values() if c.value >= min_value]
+        kids.sort(key=lambda c: c.value, reverse=True)
+        return {"name": self.name, "value": self.value, "children": [c.to_dict(min_value) for c in kids]}
+
+
+class FlameGraph:
+    """按调用路径聚合的采样计数，同时记录各函数的自身（叶子）采样数"""
+
+    def __init__(self) -> None:
+        self.root = FlameNode("all")
+        self.self_counts: dict[str, int] = {}
+        self.interval_s: Optional[float] = None
+
+    @property
+    def samples(self) -> int:
+        return self.root.value
+
+    @classmethod
+    def from_folded(cls, text: str) -> FlameGraph:
+        graph = cls()
+        for line in text.splitlines():
+            stack, _, count = line.rpartition(" ")
+            if stack and count.isdigit():
+                graph.add(stack.split(";"), int(count))
+        return graph
+
+    def add(self, labels: list[str], count: int) -> None:
+        node = self.root
+        node.value += count
+        for label in labels:
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = FlameNode(label)
+            child.value += count
+            node = child
+        if labels:
+            self.self_counts[labels[-1]] = self.self_counts.get(labels[-1], 0) + count
+
+    def hotspots(self, n: int = PROFILE_HOTSPOTS) -> list[dict[str, Any]]:
+        top = sorted(self.self_counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        total = max(self.samples, 1)
+        return [{"name": name, "samples": c, "fraction": round(c / total, 4)} for name, c in top]
+
+    def to_dict(self, min_fraction: float = PROFILE_MIN_FRACTION) -> dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "interval_s": self.interval_s,
+            "tree": self.root.to_dict(max(1, int(self.samples * min_fraction))),
+            "hotspots": self.hotspots(),
+        }
+
+    def folded(self) -> str:
+        """flamegraph.pl / speedscope 可读的折叠栈文本"""
+        out: list[str] = []
+
+        def walk(node: FlameNode, path: list[str]) -> None:
+            own = node.value - sum(c.value for c in node.children.values())
+            if own > 0 and path:
+                out.append(f"{';'.join(path)} {own}")
+            for child in node.children.values():
+                walk(child, path + [child.name.replace(";", ",")])
+
+        walk(self.root, [])
+        return "\n".join(out) + ("\n" if out else "")
+
+
+class ProfileCollector:
+    def __init__(self, interval_s: float) -> None:
+        self.interval_s = interval_s
+        self._dir = Path(tempfile.mkdtemp(prefix="deepinsight_prof_"))
+        self.path = self._dir / "profile.ndjson"
+        self.path.touch()
+        self._offset = 0
+        self._procs: dict[int, dict[str, Any]] = {}
+        self.graph = FlameGraph()
+        self.graph.interval_s = interval_s
+
+    @property
+    def env(self) -> dict[str, str]:
+        # PYTHONPATH 由执行器前置到已有路径之前，使引导用的 sitecustomize 先被导入
+        return {
+            PROFILE_ENV: repr(self.interval_s),
+            PROFILE_OUT_ENV: str(self.path),
+            "PYTHONPATH": str(BOOT_ROOT),
+        }
+
+    def _label(self, proc: dict[str, Any], fid: str) -> str:
+        label = proc["labels"].get(fid)
+        if label is None:
+            frame = proc["frames"].get(fid)
+            if frame is None:
+                label = "?"
+            else:
+                path, name, line = frame
+                label = f"{name} ({_short_path(path, proc.get('root'), proc.get('stdlib'))}:{line})"
+            proc["labels"][fid] = label
+        return label
+
+    def _merge(self, record: dict[str, Any]) -> None:
+        pid = record.get("pid")
+        if not isinstance(pid, int):
+            return
+        proc = self._procs.setdefault(pid, {"frames": {}, "labels": {}})
+        if "root" in record:
+            proc["root"] = record.get("root")
+            proc["stdlib"] = record.get("stdlib")
+        frames = record.get("frames")
+        if isinstance(frames, dict):
+            proc["frames"].update(frames)
+        stacks = record.get("stacks")
+        if not isinstance(stacks, dict):
+            return
+        for key, count in stacks.items():
+            if not isinstance(count, int):
+                continue
+            self.graph.add([self._label(proc, fid) for fid in str(key).split(";")], count)
+
+    def poll(self) -> bool:
+        """读取新追加的完整行并合并，返回是否有新采样"""
+        before = self.graph.samples
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except OSError:
+            return False
+        end = data.rfind(b"\n")
+        if end < 0:
+            return False
+        self._offset += end + 1
+        for raw in data[: end + 1].splitlines():
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                self._merge(record)
+        return self.graph.samples != before
+
+    def close(self) -> None:
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class LineProfileCollector:
+    def __init__(self) -> None:
+        self._dir = Path(tempfile.mkdtemp(prefix="deepinsight_lines_"))
+
+    @property
+    def env(self) -> dict[str, str]:
+        return {
+            LINE_PROFILE_ENV: "1",
+            LINE_PROFILE_OUT_ENV: str(self._dir),
+            "PYTHONPATH": str(BOOT_ROOT),
+        }
+
+    def collect(self) -> dict[str, Any]:
+        """合并所有进程的快照，返回 {total_ms, files: [{path, total_ms, max_ms, lines: [[line, hits, ms]]}]}"""
+        merged: dict[str, dict[int, list[int]]] = {}
+        for snap_path in self._dir.glob("lines-*.json"):
+            try:
+                snap = json.loads(snap_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            root = snap.get("root")
+            for path, rows in (snap.get("files") or {}).items():
+                table = merged.setdefault(_short_path(path, root, None), {})
+                for line, hits, ns in rows:
+                    rec = table.setdefault(int(line), [0, 0])
+                    rec[0] += int(hits)
+                    rec[1] += int(ns)
+        files = []
+        for path, table in merged.items():
+            lines = [[line, hits, round(ns / 1e6, 3)] for line, (hits, ns) in sorted(table.items())]
+            files.append(
+                {
+                    "path": path,
+                    "total_ms": round(sum(r[2] for r in lines), 3),
+                    "max_ms": max((r[2] for r in lines), default=0.0),
+                    "lines": lines,
+                }
+            )
+        files.sort(key=lambda f: f["total_ms"], reverse=True)
+        return {"total_ms": round(sum(f["total_ms"] for f in files), 3), "files": files}
+
+    def close(self) -> None:
+        shutil.rmtree(self._dir, ignore_errors=True)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import numpy as np
+
+from .downsample import lttb, minmax
+from .store import PYRAMID_FANOUT, MetricStore
+
+# 选层时允许的过采样倍数：候选点数不超过 max_points * OVERSAMPLE 才在该层做精细降采样
+OVERSAMPLE = 4
+MAX_POINTS_LIMIT = 20000
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def to_json_list(arr: np.ndarray) -> list:
+    # JSON 不支持 NaN/Inf，统一转为 null
+    if arr.dtype.kind == "f" and not np.isfinite(arr).all():
+        return np.where(np.isfinite(arr), arr, None).tolist()
+    return arr.tolist()
+
+
+def _expand_rows(rows: np.ndarray, lo: float, hi: float) -> tuple[np.ndarray, np.ndarray]:
+    # 每个聚合行展开为极小、极大两个点，按 step 先后排列，保证曲线形状不丢峰谷
+    min_first = rows[:, 2] <= rows[:, 4]
+    x = np.empty(len(rows) * 2, dtype=np.float64)
+    y = np.empty(len(rows) * 2, dtype=np.float64)
+    x[0::2] = np.where(min_first, rows[:, 2], rows[:, 4])
+    y[0::2] = np.where(min_first, rows[:, 3], rows[:, 5])
+    x[1::2] = np.where(min_first, rows[:, 4], rows[:, 2])
+    y[1::2] = np.where(min_first, rows[:, 5], rows[:, 3])
+    keep = (x >= lo) & (x <= hi)
+    # 单点行的极小极大是同一个点，去重
+    keep[1::2] &= rows[:, 2] != rows[:, 4]
+    return x[keep], y[keep]
+
+
+def load_series_xy(
+    store: MetricStore,
+    run_id: str,
+    name: str,
+    step_from: Optional[int] = None,
+    step_to: Optional[int] = None,
+    max_points: int = 1000,
+) -> tuple[np.ndarray, np.ndarray, int, int]:
+    """按目标点数挑选金字塔层级读出候选点，返回 (steps, values, level, 估算原始点数)"""
+    estimated = store.estimate_points(run_id, name, step_from, step_to)
+    levels = store.pyramid_levels(run_id, name)
+    level = 0
+    while level < levels and estimated / PYRAMID_FANOUT**level > max_points * OVERSAMPLE:
+        level += 1
+
+    lo = -np.inf if step_from is None else step_from
+    hi = np.inf if step_to is None else step_to
+    while level > 0:
+        x, y = _expand_rows(store.read_rows(run_id, name, level, step_from, step_to), lo, hi)
+        # 块索引只给出上界，窄范围可能选层过粗；点数不足时退回更细的一层
+        if len(x) >= max_points:
+            # 聚合行只给出极值点，补上范围内的首尾原始点，与 LTTB 一样保留曲线端点
+            ex, ey = store.edge_points(run_id, name, step_from, step_to)
+            if len(ex):
+                head = slice(0, 0) if x[0] == ex[0] else slice(0, 1)
+                tail = slice(0, 0) if x[-1] == ex[1] else slice(1, 2)
+                x = np.concatenate((ex[head], x, ex[tail]))
+                y = np.concatenate((ey[head], y, ey[tail]))
+            return x, y, level, estimated
+        level -= 1
+
+    steps, _, values = store.read_series(run_id, name, step_from, step_to)
+    return steps.astype(np.float64), values, level, estimated
+
+
+def query_series(
+    store: MetricStore,
+    run_id: str,
+    name: str,
+    step_from: Optional[int] = None,
+    step_to: Optional[int] = None,
+    max_points: int = 1000,
+    method: str = "lttb",
+) -> dict[str, Any]:
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"unknown method: {method}")
+    max_points = min(max(int(max_points), 3), MAX_POINTS_LIMIT)
+
+    x, y, level, estimated = load_series_xy(store, run_id, name, step_from, step_to, max_points)
+    if len(x) > max_points:
+        idx = lttb(x, y, max_points) if method == "lttb" else minmax(y, max_points)
+        x, y = x[idx], y[idx]
+
+    return {
+        "run_id": run_id,
+        "name": name,
+        "steps": x.astype(np.int64).tolist(),
+        "values": to_json_list(y),
+        "level": level,
+        "method": method,
+        "source_points": estimated,
+    }
+
+
+def series_summary(store: MetricStore, run_id: str, name: str, mode: str = "min") -> Optional[dict[str, Any]]:
+    """最优值/最优步/最终值；最优值取自金字塔顶层聚合行，结果精确且不扫描原始点"""
+    levels = store.pyramid_levels(run_id, name)
+    rows = store.read_rows(run_id, name, levels)
+    if len(rows) == 0:
+        return None
+    if mode == "max":
+        vals = np.where(np.isnan(rows[:, 5]), -np.inf, rows[:, 5])
+        i = int(np.argmax(vals))
+        best, best_step = rows[i, 5], rows[i, 4]
+    else:
+        vals = np.where(np.isnan(rows[:, 3]), np.inf, rows[:, 3])
+        i = int(np.argmin(vals))
+        best, best_step = rows[i, 3], rows[i, 2]
+    steps, _, values = store.sample_points(run_id, name, 2)
+    count = float(rows[:, 7].sum())
+    mean = float(rows[:, 6].sum()) / count if count else None
+    return {
+        "best": to_json_list(np.array([best]))[0],
+        "best_step": int(best_step),
+        "final": to_json_list(values[-1:])[0],
+        "final_step": int(steps[-1]),
+        "mean": mean,
+        "points": store.estimate_points(run_id, name),
+    }
+
+
+def compare_runs(
+    store: MetricStore,
+    run_ids: list[str],
+    name: str,
+    grid: str = "step",
+    points: int = 500,
+    mode: str = "min",
+) -> dict[str, Any]:
+    """把多个 run 的同名指标重采样到公共 step/时间网格上，并附带每个 run 的摘要"""
+    if grid not in ("step", "time"):
+        raise ValueError(f"unknown grid: {grid}")
+    if mode not in ("min", "max"):
+        raise ValueError(f"unknown mode: {mode}")
+    points = min(max(int(points), 2), MAX_POINTS_LIMIT)
+
+    curves: list[Optional[tuple[np.ndarray, np.ndarray]]] = []
+    for run_id in run_ids:
+        x, y, _, _ = load_series_xy(store, run_id, name, max_points=points)
+        if len(x) == 0:
+            curves.append(None)
+            continue
+        if grid == "time":
+            # 用等距抽样的 (step, ts) 把降采样后的 step 映射为相对开始的秒数
+            s_steps, s_ts, _ = store.sample_points(run_id, name, 4096)
+            order = np.argsort(s_steps, kind="stable")
+            x = np.interp(x, s_steps[order], s_ts[order] - s_ts.min())
+        order = np.argsort(x, kind="stable")
+        curves.append((x[order], y[order]))
+
+    present = [c for c in curves if c is not None]
+    if not present:
+        return {"name": name, "grid": grid, "x": [], "runs": [{"run_id": r, "values": [], "summary": None} for r in run_ids]}
+
+    lo = min(float(c[0][0]) for c in present)
+    hi = max(float(c[0][-1]) for c in present)
+    xs = np.linspace(lo, hi, points) if hi > lo else np.array([lo])
+
+    runs = []
+    for run_id, curve in zip(run_ids, curves):
+        if curve is None:
+            runs.append({"run_id": run_id, "values": [None] * len(xs), "summary": None})
+            continue
+        cx, cy = curve
+        # 超出该 run 自身覆盖范围的网格点置空，不做外推
+        values = np.interp(xs, cx, cy)
+        values[(xs < cx[0]) | (xs > cx[-1])] = np.nan
+        runs.append(
+            {
+                "run_id": run_id,
+                "values": to_json_list(values),
+                "summary": series_summary(store, run_id, name, mode),
+            }
+        )
+
+    return {
+        "name": name,
+        "grid": grid,
+        "x": (xs.round().astype(np.int64) if grid == "step" else xs).tolist(),
+        "runs": runs,
+    }
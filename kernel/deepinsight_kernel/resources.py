@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import psutil
+
+# 单次运行的进程树资源采样：每次采样遍历子进程及其全部后代并求和。
+# CPU 时间与 I/O 字节按 pid 记住最后一次读数再求和，进程退出后其已消耗的量仍计入总数
+DEFAULT_RESOURCE_INTERVAL_S = 1.0
+MIN_RESOURCE_INTERVAL_S = 0.1
+
+
+def _proc_stats(p: psutil.Process) -> Optional[tuple[float, int, int, int, int, int, int]]:
+    try:
+        with p.oneshot():
+            cpu = p.cpu_times()
+            try:
+                mem = p.memory_full_info()
+                uss = int(getattr(mem, "uss", 0))
+            except (psutil.AccessDenied, AttributeError):
+                mem = p.memory_info()
+                uss = 0
+            threads = p.num_threads()
+            files = p.num_fds() if os.name != "nt" else p.num_handles()
+            try:
+                io = p.io_counters()
+                rb, wb = int(io.read_bytes), int(io.write_bytes)
+            except (psutil.AccessDenied, AttributeError):
+                rb = wb = 0
+        return cpu.user + cpu.system, int(mem.rss), uss, threads, files, rb, wb
+    except psutil.Error:
+        return None
+
+
+class ProcessTreeSampler:
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._cpu: dict[int, float] = {}
+        self._read: dict[int, int] = {}
+        self._write: dict[int, int] = {}
+        self._last: Optional[tuple[float, float, int, int]] = None
+        self.samples = 0
+        self.peak_rss = 0
+        self.peak_uss = 0
+        self.peak_processes = 0
+
+    def sample(self) -> Optional[dict[str, Any]]:
+        """采样一次整棵进程树；主进程已退出时返回 None"""
+        with self._lock:
+            try:
+                root = psutil.Process(self.pid)
+                procs = [root, *root.children(recursive=True)]
+            except psutil.Error:
+                return None
+            rss = uss = threads = files = alive = 0
+            for p in procs:
+                st = _proc_stats(p)
+                if st is None:
+                    continue
+                cpu_s, p_rss, p_uss, p_threads, p_files, rb, wb = st
+                alive += 1
+                rss += p_rss
+                uss += p_uss
+                threads += p_threads
+                files += p_files
+                self._cpu[p.pid] = cpu_s
+                self._read[p.pid] = rb
+                self._write[p.pid] = wb
+            if alive == 0:
+                return None
+            now = time.monotonic()
+            cpu_total = sum(self._cpu.values())
+            read_total = sum(self._read.values())
+            write_total = sum(self._write.values())
+            if self._last is None:
+                dt = now - self.started
+                cpu_pct = cpu_total / dt * 100 if dt > 0 else 0.0
+                read_rate = read_total / dt if dt > 0 else 0.0
+                write_rate = write_total / dt if dt > 0 else 0.0
+            else:
+                t0, c0, r0, w0 = self._last
+                dt = max(now - t0, 1e-6)
+                cpu_pct = max(cpu_total - c0, 0.0) / dt * 100
+                read_rate = max(read_total - r0, 0) / dt
+                write_rate = max(write_total - w0, 0) / dt
+            self._last = (now, cpu_total, read_total, write_total)
+            self.samples += 1
+            self.peak_rss = max(self.peak_rss, rss)
+            self.peak_uss = max(self.peak_uss, uss)
+            self.peak_processes = max(self.peak_processes, alive)
+            return {
+                "ts": time.time(),
+                "processes": alive,
+                "cpu_percent": round(cpu_pct, 1),
+                "cpu_seconds": round(cpu_total, 3),
+                "rss_bytes": rss,
+                "uss_bytes": uss,
+                "threads": threads,
+                "open_files": files,
+                "read_bytes": read_total,
+                "write_bytes": write_total,
+                "read_bytes_per_s": round(read_rate, 1),
+                "write_bytes_per_s": round(write_rate, 1),
+            }
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "wall_s": round(time.monotonic() - self.started, 3),
+                "cpu_seconds": round(sum(self._cpu.values()), 3),
+                "peak_rss_bytes": self.peak_rss,
+                "peak_uss_bytes": self.peak_uss,
+                "peak_processes": self.peak_processes,
+                "read_bytes": sum(self._read.values()),
+                "write_bytes": sum(self._write.values()),
+                "samples": self.samples,
+            }
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from .store import MetricStore, get_store
+
+# 跨 run 的日志全文索引：SQLite FTS5 trigram 分词，只存倒排不存原文（content=''），
+# 命中后按行号回 log.ndjson 取原文。rowid = run_seq << 32 | line_no，run_seq 按开始时间递增，
+# 因而 ORDER BY rowid DESC 即按新近程度排序
+INDEX_BATCH_LINES = 2000
+INDEX_IDLE_S = 1.0
+MIN_QUERY_CHARS = 3
+_LINE_BITS = 32
+
+
+class SearchUnavailableError(RuntimeError):
+    """索引无法建立（例如 SQLite 不支持 FTS5 trigram），搜索不可用"""
+
+
+class LogSearchIndex:
+    def __init__(self, store: MetricStore) -> None:
+        self.store = store
+        # sqlite 连接只在这个单线程 executor 里使用，插入与查询天然串行，也不占用事件循环
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deepinsight-search")
+        self._db: Optional[sqlite3.Connection] = None
+        self._watch: dict[str, int] = {}
+        self._error: Optional[str] = None
+
+    # ---- 以下方法只在 executor 线程中调用 ----
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(str(self.store.root / "search.db"))
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "run_seq INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT UNIQUE, indexed_lines INTEGER, complete INTEGER)"
+            )
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS lines USING fts5(data, tokenize='trigram', content='', detail='full')"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _register(self, run_ids: list[str]) -> dict[str, tuple[int, int, int]]:
+        db = self._connect()
+        db.executemany("INSERT OR IGNORE INTO runs (run_id, indexed_lines, complete) VALUES (?, 0, 0)", [(r,) for r in run_ids])
+        db.commit()
+        out = {}
+        for run_id in run_ids:
+            row = db.execute("SELECT run_seq, indexed_lines, complete FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            out[run_id] = (int(row[0]), int(row[1]), int(row[2]))
+        return out
+
+    def _insert(self, run_id: str, run_seq: int, start: int, texts: list[str], complete: bool) -> None:
+        db = self._connect()
+        base = run_seq << _LINE_BITS
+        db.executemany("INSERT INTO lines (rowid, data) VALUES (?, ?)", [(base + start + i, t) for i, t in enumerate(texts)])
+        db.execute(
+            "UPDATE runs SET indexed_lines = ?, complete = ? WHERE run_id = ?",
+            (start + len(texts), 1 if complete else 0, run_id),
+        )
+        db.commit()
+
+    def _query(self, query: str, limit: int) -> list[tuple[str, int]]:
+        db = self._connect()
+        phrase = '"' + query.replace('"', '""') + '"'
+        rows = db.execute(
+            "SELECT rowid FROM lines WHERE lines MATCH ? ORDER BY rowid DESC LIMIT ?", (phrase, limit)
+        ).fetchall()
+        seqs = {r[0] >> _LINE_BITS for r in rows}
+        names = {}
+        for seq in seqs:
+            row = db.execute("SELECT run_id FROM runs WHERE run_seq = ?", (seq,)).fetchone()
+            if row:
+                names[seq] = row[0]
+        return [(names[r[0] >> _LINE_BITS], r[0] & ((1 << _LINE_BITS) - 1)) for r in rows if (r[0] >> _LINE_BITS) in names]
+
+    def _index_run(self, run_id: str, start: int, limit: int) -> tuple[int, bool]:
+        """读出 run 从 start 起至多 limit 行新日志并写入索引，返回 (行数, 是否已索引完)"""
+        # 先判断是否结束再取行数：结束之后不会再有新行，complete 不会漏掉最后一批
+        finished = not self.store.is_active(run_id)
+        total = self.store.log_line_count(run_id)
+        end = min(total, start + limit)
+        records = self.store.read_log(run_id, start, end) if end > start else []
+        complete = finished and start + len(records) >= total
+        if records or complete:
+            seq = self._register([run_id])[run_id][0]
+            self._insert(run_id, seq, start, [str(r.get("data", "")) for r in records], complete)
+        return len(records), complete
+
+    def _search(self, query: str, limit: int) -> list[dict[str, Any]]:
+        results = []
+        for run_id, line_no in self._query(query, limit):
+            try:
+                rec = self.store.read_log(run_id, line_no, line_no + 1)
+            except (OSError, ValueError):
+                continue
+            if not rec:
+                continue
+            results.append(
+                {
+                    "run_id": run_id,
+                    "line": line_no,
+                    "stream": rec[0].get("stream"),
+                    "ts": rec[0].get("ts"),
+                    "data": rec[0].get("data"),
+                }
+            )
+        return results
+
+    # ---- 事件循环侧 ----
+
+    async def _call(self, fn: Any, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _backfill(self) -> None:
+        # 启动时按开始时间从旧到新登记尚未索引完的历史 run，保证 run_seq 与新近程度一致
+        runs = sorted(await self._call(self.store.list_runs), key=lambda m: m.get("started_at") or 0)
+        ids = [m["run_id"] for m in runs if isinstance(m.get("run_id"), str)]
+        state = await self._call(self._register, ids)
+        for run_id, (_, indexed, complete) in state.items():
+            if not complete:
+                self._watch[run_id] = indexed
+
+    async def watch(self, run_id: str) -> None:
+        """新 run 开始时登记，之后由后台任务增量索引其输出"""
+        if self._error is not None:
+            return
+        state = await self._call(self._register, [run_id])
+        self._watch[run_id] = state[run_id][1]
+
+    async def index_step(self, budget: int = INDEX_BATCH_LINES) -> int:
+        """为登记中的 run 索引至多 budget 行新输出，返回本次处理的行数"""
+        done = 0
+        for run_id in list(self._watch):
+            if done >= budget:
+                break
+            start = self._watch[run_id]
+            try:
+                n, complete = await self._call(self._index_run, run_id, start, budget - done)
+            except (OSError, ValueError):
+                self._watch.pop(run_id, None)
+                continue
+            self._watch[run_id] = start + n
+            done += n
+            if complete:
+                self._watch.pop(run_id, None)
+        return done
+
+    async def run(self) -> None:
+        try:
+            await self._backfill()
+        except Exception as e:
+            self._error = str(e)
+            print(f"Log index unavailable: {e}")
+            return
+        while True:
+            try:
+                n = await self.index_step()
+            except Exception as e:
+                print(f"Log index step failed: {e}")
+                n = 0
+            await asyncio.sleep(0 if n >= INDEX_BATCH_LINES else INDEX_IDLE_S)
+
+    async def search(self, query: str, limit: int = 50) -> list[dict[str, Any]]:
+        if len(query) < MIN_QUERY_CHARS:
+            raise ValueError(f"query must be at least {MIN_QUERY_CHARS} characters")
+        limit = min(max(int(limit), 1), 500)
+        if self._error is not None:
+            raise SearchUnavailableError(f"log search index unavailable: {self._error}")
+        return await self._call(self._search, query, limit)
+
+
+_default_index: Optional[LogSearchIndex] = None
+
+
+def get_search_index() -> LogSearchIndex:
+    global _default_index
+    if _default_index is None:
+        _default_index = LogSearchIndex(get_store())
+    return _default_index
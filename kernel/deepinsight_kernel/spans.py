@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import json
+import random
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+# deepinsight.span / timed 产生的计时区间：子进程按批输出 __SPANS__ {json}，
+# 批内 names 为新出现的 {编号: 名称}，rows 为 [id, parent, 名称编号, 起点(us), 时长(us), step, 线程, 可选属性]。
+# 内核按名称聚合计数/总时长与分位数（蓄水池采样，内存有界），并把每个区间转成 Chrome trace 的 X 事件落盘
+SPANS_PREFIX = "__SPANS__"
+RESERVOIR_SIZE = 4096
+# 运行中推送 span_stats 的间隔（秒）
+SPAN_STATS_PUSH_S = 2.0
+
+
+def parse_spans_line(line: str) -> Optional[dict[str, Any]]:
+    trimmed = line.strip()
+    if not trimmed.startswith(SPANS_PREFIX):
+        return None
+    try:
+        obj = json.loads(trimmed[len(SPANS_PREFIX) :].strip())
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) and isinstance(obj.get("rows"), list) else None
+
+
+class DurationStats:
+    """单个名称的时长统计：精确的计数/总和/最大值 + 定长蓄水池估计分位数"""
+
+    __slots__ = ("count", "total_us", "max_us", "sample", "_rng")
+
+    def __init__(self, seed: int = 0) -> None:
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self.sample: list[int] = []
+        self._rng = random.Random(seed)
+
+    def add(self, dur_us: int) -> None:
+        self.count += 1
+        self.total_us += dur_us
+        if dur_us > self.max_us:
+            self.max_us = dur_us
+        if len(self.sample) < RESERVOIR_SIZE:
+            self.sample.append(dur_us)
+        else:
+            j = self._rng.randrange(self.count)
+            if j < RESERVOIR_SIZE:
+                self.sample[j] = dur_us
+
+    def summary(self) -> dict[str, Any]:
+        p50, p90, p99 = np.percentile(np.asarray(self.sample, dtype=np.float64), [50, 90, 99]) if self.sample else (0.0, 0.0, 0.0)
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_us / 1000, 3),
+            "mean_ms": round(self.total_us / self.count / 1000, 3) if self.count else 0.0,
+            "p50_ms": round(float(p50) / 1000, 3),
+            "p90_ms": round(float(p90) / 1000, 3),
+            "p99_ms": round(float(p99) / 1000, 3),
+            "max_ms": round(self.max_us / 1000, 3),
+        }
+
+
+class SpanCollector:
+    def __init__(self) -> None:
+        self.stats: dict[str, DurationStats] = {}
+        self._names: dict[int, dict[str, str]] = {}
+        self.changed = False
+
+    def name_of(self, pid: int, idx: Any) -> str:
+        return self._names.get(pid, {}).get(str(idx), "?")
+
+    def add(self, batch: dict[str, Any]) -> list[dict[str, Any]]:
+        """合并一批 span，返回对应的 Chrome trace 事件"""
+        pid = batch.get("pid") if isinstance(batch.get("pid"), int) else 0
+        try:
+            origin_us = float(batch.get("origin") or 0.0) * 1e6
+        except (TypeError, ValueError):
+            origin_us = 0.0
+        names = self._names.setdefault(pid, {})
+        new_names = batch.get("names")
+        if isinstance(new_names, dict):
+            names.update({str(k): str(v) for k, v in new_names.items()})
+        events: list[dict[str, Any]] = []
+        for row in batch["rows"]:
+            if not isinstance(row, list) or len(row) < 7:
+                continue
+            span_id, parent, idx, start_us, dur_us, step, tid = row[:7]
+            # 畸形行（时间字段不是数字）直接跳过，不让一行坏数据中断整批
+            try:
+                start_us, dur_us = float(start_us), int(dur_us)
+            except (TypeError, ValueError, OverflowError):
+                continue
+            name = names.get(str(idx), "?")
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = DurationStats(seed=len(self.stats))
+            stats.add(dur_us)
+            args: dict[str, Any] = {"id": span_id, "parent": parent, "step": step}
+            if len(row) > 7 and isinstance(row[7], dict):
+                args.update(row[7])
+            events.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": round(origin_us + start_us),
+                    "dur": dur_us,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        self.changed = self.changed or bool(events)
+        return events
+
+    def summary(self) -> dict[str, Any]:
+        self.changed = False
+        ordered = sorted(self.stats.items(), key=lambda kv: kv[1].total_us, reverse=True)
+        return {name: st.summary() for name, st in ordered}
+
+
+def chrome_trace_chunks(events: Iterator[str]) -> Iterator[bytes]:
+    """把逐行的 trace 事件包装成 Chrome trace / Perfetto 可直接打开的 JSON"""
+    yield b'{"displayTimeUnit":"ms","traceEvents":['
+    first = True
+    for line in events:
+        line = line.strip()
+        if not line:
+            continue
+        yield (line if first else "," + line).encode("utf-8")
+        first = False
+    yield b"]}"
@@ -0,0 +1,742 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import wraps
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+# 每个 series 一组列文件：<stem>.step(int64) / <stem>.ts(float64) / <stem>.value(float64)
+# <stem>.idx 为块索引：每 BLOCK_POINTS 个点一行 (step_min, step_max)，范围读取只触碰命中的块
+BLOCK_POINTS = 4096
+FLUSH_POINTS = 2048
+FLUSH_INTERVAL_S = 1.0
+
+# 单次日志范围读取最多返回的行数
+LOG_RANGE_LIMIT = 5000
+
+# run 目录下允许读写的文本附件
+RUN_ARTIFACTS = ("profile.folded", "line_profile.json", "trace.ndjson", "model_graph.json")
+
+_STEP_DTYPE = np.dtype("<i8")
+_TS_DTYPE = np.dtype("<f8")
+_VALUE_DTYPE = np.dtype("<f8")
+_IDX_DTYPE = np.dtype("<i8")
+
+# 多分辨率金字塔：第 k 层每行聚合 PYRAMID_FANOUT**k 个原始点
+# 行格式 (float64)：step_lo, step_hi, min_step, min, max_step, max, sum, count
+PYRAMID_FANOUT = 64
+PYRAMID_COLS = 8
+_PYRAMID_CHUNK_ROWS = 4096
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def _locked(method):
+    # 写入在事件循环线程，查询可能在 to_thread 的工作线程：共用一把可重入锁
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def default_store_root() -> Path:
+    """默认存储目录，可通过 DEEPINSIGHT_HOME 覆盖"""
+    home = os.environ.get("DEEPINSIGHT_HOME")
+    if home:
+        return Path(home)
+    return Path.home() / ".deepinsight"
+
+
+def _series_stem(name: str) -> str:
+    safe = _SAFE_NAME.sub("_", name)[:48] or "series"
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+    return f"{safe}-{digest}"
+
+
+def _is_scalar(value: Any) -> bool:
+    # bool 是 int 的子类，按 0/1 存储
+    return isinstance(value, (int, float))
+
+
+def _write_json_atomic(path: Path, obj: Any) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _points_to_rows(steps: np.ndarray, values: np.ndarray) -> np.ndarray:
+    rows = np.empty((len(steps), PYRAMID_COLS), dtype=np.float64)
+    rows[:, 0] = steps
+    rows[:, 1] = steps
+    rows[:, 2] = steps
+    rows[:, 3] = values
+    rows[:, 4] = steps
+    rows[:, 5] = values
+    finite = ~np.isnan(values)
+    rows[:, 6] = np.where(finite, values, 0.0)
+    rows[:, 7] = finite
+    return rows
+
+
+def _aggregate_rows(rows: np.ndarray) -> np.ndarray:
+    """把 (n * FANOUT, COLS) 的行按 FANOUT 分组聚合为 (n, COLS)"""
+    g = rows.reshape(-1, PYRAMID_FANOUT, PYRAMID_COLS)
+    n = g.shape[0]
+    ar = np.arange(n)
+    # NaN 不参与极值比较；整组都是 NaN 时结果仍为 NaN
+    i_min = np.argmin(np.where(np.isnan(g[:, :, 3]), np.inf, g[:, :, 3]), axis=1)
+    i_max = np.argmax(np.where(np.isnan(g[:, :, 5]), -np.inf, g[:, :, 5]), axis=1)
+    out = np.empty((n, PYRAMID_COLS), dtype=np.float64)
+    out[:, 0] = g[:, :, 0].min(axis=1)
+    out[:, 1] = g[:, :, 1].max(axis=1)
+    out[:, 2] = g[ar, i_min, 2]
+    out[:, 3] = g[ar, i_min, 3]
+    out[:, 4] = g[ar, i_max, 4]
+    out[:, 5] = g[ar, i_max, 5]
+    out[:, 6] = g[:, :, 6].sum(axis=1)
+    out[:, 7] = g[:, :, 7].sum(axis=1)
+    return out
+
+
+def _pyramid_path(base: Path, level: int) -> Path:
+    return base.with_suffix(f".p{level}")
+
+
+def _pyramid_rows(base: Path, level: int) -> int:
+    try:
+        return _pyramid_path(base, level).stat().st_size // (PYRAMID_COLS * 8)
+    except OSError:
+        return 0
+
+
+def _read_pyramid(base: Path, level: int, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+    n = _pyramid_rows(base, level)
+    end = n if end is None else min(end, n)
+    if end <= start:
+        return np.empty((0, PYRAMID_COLS), dtype=np.float64)
+    mm = np.memmap(_pyramid_path(base, level), dtype=np.float64, mode="r", shape=(n, PYRAMID_COLS))
+    rows = np.array(mm[start:end])
+    del mm
+    return rows
+
+
+@dataclass
+class _SeriesBuffer:
+    stem: str
+    steps: list[int] = field(default_factory=list)
+    ts: list[float] = field(default_factory=list)
+    values: list[float] = field(default_factory=list)
+    # 已落盘的点数，用于补全块索引
+    flushed: int = 0
+
+
+@dataclass
+class _RunState:
+    run_dir: Path
+    meta: dict[str, Any]
+    series: dict[str, _SeriesBuffer] = field(default_factory=dict)
+    objects: list[str] = field(default_factory=list)
+    logs: list[str] = field(default_factory=list)
+    # 日志总行数（含尚未落盘的缓冲），即下一行的行号
+    log_lines: int = 0
+    last_flush: float = field(default_factory=time.monotonic)
+
+
+class MetricStore:
+    """按 run 持久化指标与输出：标量走列式 series 文件，其它值追加到 objects.ndjson，
+    stdout/stderr 逐行追加到 log.ndjson（log.idx 记录每行的字节偏移）"""
+
+    def __init__(self, root: Path | str | None = None) -> None:
+        self.root = Path(root) if root is not None else default_store_root()
+        self.runs_dir = self.root / "runs"
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        self._active: dict[str, _RunState] = {}
+        self._lock = threading.RLock()
+
+    # ---- 写入 ----
+
+    def _run_dir(self, run_id: str) -> Path:
+        if not run_id or "/" in run_id or "\\" in run_id or run_id in (".", ".."):
+            raise ValueError("invalid run_id")
+        return self.runs_dir / run_id
+
+    def _state(self, run_id: str) -> _RunState:
+        st = self._active.get(run_id)
+        if st is None:
+            run_dir = self._run_dir(run_id)
+            meta = self._read_meta(run_dir) or {"run_id": run_id, "started_at": time.time(), "series": {}}
+            (run_dir / "series").mkdir(parents=True, exist_ok=True)
+            st = _RunState(run_dir=run_dir, meta=meta, log_lines=self._count_log_lines(run_dir))
+            for name, stem in meta.get("series", {}).items():
+                st.series[name] = _SeriesBuffer(stem=stem, flushed=self._count_points(run_dir, stem))
+            self._active[run_id] = st
+        return st
+
+    @staticmethod
+    def _series_buffer(st: _RunState, name: str) -> _SeriesBuffer:
+        buf = st.series.get(name)
+        if buf is None:
+            buf = _SeriesBuffer(stem=_series_stem(name))
+            st.series[name] = buf
+            st.meta.setdefault("series", {})[name] = buf.stem
+            _write_json_atomic(st.run_dir / "meta.json", st.meta)
+        return buf
+
+    @_locked
+    def start_run(self, run_id: str, meta: Optional[dict[str, Any]] = None) -> None:
+        st = self._state(run_id)
+        st.meta.update(meta or {})
+        st.meta["status"] = "running"
+        _write_json_atomic(st.run_dir / "meta.json", st.meta)
+
+    @_locked
+    def append_metric(self, run_id: str, name: str, value: Any, step: int, ts: Optional[float] = None) -> None:
+        st = self._state(run_id)
+        ts_f = time.time() if ts is None else float(ts)
+        if _is_scalar(value):
+            buf = self._series_buffer(st, name)
+            buf.steps.append(int(step))
+            buf.ts.append(ts_f)
+            buf.values.append(float(value))
+            if len(buf.steps) >= FLUSH_POINTS:
+                self._flush_series(st, buf)
+        else:
+            st.objects.append(
+                json.dumps({"name": name, "step": int(step), "ts": ts_f, "value": value}, ensure_ascii=False)
+            )
+        if time.monotonic() - st.last_flush >= FLUSH_INTERVAL_S:
+            self._flush_run(st)
+
+    @_locked
+    def append_points(
+        self,
+        run_id: str,
+        name: str,
+        steps: np.ndarray,
+        ts: np.ndarray,
+        values: np.ndarray,
+    ) -> None:
+        """批量追加标量点（导入等场景），与逐点 append_metric 写入同一列文件"""
+        st = self._state(run_id)
+        buf = self._series_buffer(st, name)
+        buf.steps.extend(np.asarray(steps, dtype=_STEP_DTYPE).tolist())
+        buf.ts.extend(np.asarray(ts, dtype=_TS_DTYPE).tolist())
+        buf.values.extend(np.asarray(values, dtype=_VALUE_DTYPE).tolist())
+        if len(buf.steps) >= FLUSH_POINTS:
+            self._flush_series(st, buf)
+
+    @_locked
+    def append_log(self, run_id: str, stream: str, data: str, ts: Optional[float] = None) -> int:
+        """追加一行输出，返回其行号（从 0 开始）"""
+        st = self._state(run_id)
+        ts_f = time.time() if ts is None else float(ts)
+        st.logs.append(json.dumps({"ts": ts_f, "stream": stream, "data": data}, ensure_ascii=False))
+        line_no = st.log_lines
+        st.log_lines += 1
+        if len(st.logs) >= FLUSH_POINTS or time.monotonic() - st.last_flush >= FLUSH_INTERVAL_S:
+            self._flush_run(st)
+        return line_no
+
+    @_locked
+    def finish_run(self, run_id: str, **fields: Any) -> None:
+        st = self._state(run_id)
+        self._flush_run(st)
+        st.meta["finished_at"] = time.time()
+        st.meta["status"] = "finished"
+        st.meta.update(fields)
+        _write_json_atomic(st.run_dir / "meta.json", st.meta)
+        self._active.pop(run_id, None)
+
+    @_locked
+    def delete_run(self, run_id: str) -> None:
+        """删除 run 目录（含未落盘的缓冲），用于撤销失败的导入"""
+        run_dir = self._run_dir(run_id)
+        self._active.pop(run_id, None)
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    @_locked
+    def flush(self, run_id: Optional[str] = None) -> None:
+        states = [self._active[run_id]] if run_id in self._active else ([] if run_id else list(self._active.values()))
+        for st in states:
+            self._flush_run(st)
+
+    def _flush_run(self, st: _RunState) -> None:
+        for buf in st.series.values():
+            if buf.steps:
+                self._flush_series(st, buf)
+        if st.objects:
+            with open(st.run_dir / "objects.ndjson", "a", encoding="utf-8") as f:
+                f.write("\n".join(st.objects) + "\n")
+            st.objects.clear()
+        if st.logs:
+            self._flush_logs(st)
+        st.last_flush = time.monotonic()
+
+    def _flush_logs(self, st: _RunState) -> None:
+        encoded = [(line + "\n").encode("utf-8") for line in st.logs]
+        with open(st.run_dir / "log.ndjson", "ab") as f:
+            pos = f.tell()
+            f.write(b"".join(encoded))
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        offsets = pos + np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        with open(st.run_dir / "log.idx", "ab") as f:
+            f.write(offsets.astype(_IDX_DTYPE).tobytes())
+        st.logs.clear()
+
+    def _flush_series(self, st: _RunState, buf: _SeriesBuffer) -> None:
+        base = st.run_dir / "series" / buf.stem
+        steps = np.asarray(buf.steps, dtype=_STEP_DTYPE)
+        with open(base.with_suffix(".step"), "ab") as f:
+            f.write(steps.tobytes())
+        with open(base.with_suffix(".ts"), "ab") as f:
+            f.write(np.asarray(buf.ts, dtype=_TS_DTYPE).tobytes())
+        with open(base.with_suffix(".value"), "ab") as f:
+            f.write(np.asarray(buf.values, dtype=_VALUE_DTYPE).tobytes())
+
+        # 补齐新写满的块的索引行
+        start = buf.flushed
+        total = start + len(steps)
+        first_block = start // BLOCK_POINTS
+        full_blocks = total // BLOCK_POINTS
+        if full_blocks > first_block:
+            all_steps = np.memmap(base.with_suffix(".step"), dtype=_STEP_DTYPE, mode="r")
+            rows = []
+            for b in range(first_block, full_blocks):
+                chunk = all_steps[b * BLOCK_POINTS : (b + 1) * BLOCK_POINTS]
+                rows.append((int(chunk.min()), int(chunk.max())))
+            del all_steps
+            with open(base.with_suffix(".idx"), "ab") as f:
+                f.write(np.asarray(rows, dtype=_IDX_DTYPE).tobytes())
+
+        self._update_pyramid(base, total)
+
+        buf.flushed = total
+        buf.steps.clear()
+        buf.ts.clear()
+        buf.values.clear()
+
+    def _update_pyramid(self, base: Path, total: int) -> None:
+        """增量补齐各层金字塔中新写满的行；缺失的层（旧数据）也会在这里补建"""
+        src_count = total
+        level = 1
+        while src_count >= PYRAMID_FANOUT:
+            have = _pyramid_rows(base, level)
+            complete = src_count // PYRAMID_FANOUT
+            if complete > have:
+                with open(_pyramid_path(base, level), "ab") as f:
+                    for chunk_start in range(have, complete, _PYRAMID_CHUNK_ROWS):
+                        chunk_end = min(chunk_start + _PYRAMID_CHUNK_ROWS, complete)
+                        lo, hi = chunk_start * PYRAMID_FANOUT, chunk_end * PYRAMID_FANOUT
+                        if level == 1:
+                            steps_mm = np.memmap(base.with_suffix(".step"), dtype=_STEP_DTYPE, mode="r", shape=(total,))
+                            values_mm = np.memmap(base.with_suffix(".value"), dtype=_VALUE_DTYPE, mode="r", shape=(total,))
+                            src = _points_to_rows(np.asarray(steps_mm[lo:hi]), np.asarray(values_mm[lo:hi]))
+                            del steps_mm, values_mm
+                        else:
+                            src = _read_pyramid(base, level - 1, lo, hi)
+                        f.write(_aggregate_rows(src).tobytes())
+            src_count = complete
+            level += 1
+
+    # ---- 读取 ----
+
+    @staticmethod
+    def _read_meta(run_dir: Path) -> Optional[dict[str, Any]]:
+        try:
+            with open(run_dir / "meta.json", "r", encoding="utf-8") as f:
+                obj = json.load(f)
+            return obj if isinstance(obj, dict) else None
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _count_points(run_dir: Path, stem: str) -> int:
+        try:
+            return (run_dir / "series" / f"{stem}.step").stat().st_size // _STEP_DTYPE.itemsize
+        except OSError:
+            return 0
+
+    def has_run(self, run_id: str) -> bool:
+        return run_id in self._active or (self._run_dir(run_id) / "meta.json").exists()
+
+    def is_active(self, run_id: str) -> bool:
+        return run_id in self._active
+
+    @_locked
+    def list_runs(self) -> list[dict[str, Any]]:
+        runs = []
+        for run_dir in self.runs_dir.iterdir():
+            if not run_dir.is_dir():
+                continue
+            meta = self._active[run_dir.name].meta if run_dir.name in self._active else self._read_meta(run_dir)
+            if meta is not None:
+                runs.append(meta)
+        runs.sort(key=lambda m: m.get("started_at") or 0, reverse=True)
+        return runs
+
+    @_locked
+    def get_run(self, run_id: str) -> Optional[dict[str, Any]]:
+        run_dir = self._run_dir(run_id)
+        st = self._active.get(run_id)
+        meta = st.meta if st is not None else self._read_meta(run_dir)
+        if meta is None:
+            return None
+        out = dict(meta)
+        out["series"] = {
+            name: {"points": self._count_points(run_dir, stem) + (len(st.series[name].steps) if st and name in st.series else 0)}
+            for name, stem in meta.get("series", {}).items()
+        }
+        return out
+
+    def series_names(self, run_id: str) -> list[str]:
+        meta = self.get_run(run_id)
+        return list(meta["series"].keys()) if meta else []
+
+    def _series_base(self, run_id: str, name: str) -> Optional[Path]:
+        run_dir = self._run_dir(run_id)
+        st = self._active.get(run_id)
+        if st is not None:
+            if name not in st.series:
+                return None
+            if st.series[name].steps:
+                self._flush_series(st, st.series[name])
+            return run_dir / "series" / st.series[name].stem
+        meta = self._read_meta(run_dir)
+        if meta is None or name not in meta.get("series", {}):
+            return None
+        return run_dir / "series" / meta["series"][name]
+
+    @staticmethod
+    def _block_ranges(base: Path, total: int, lo: float, hi: float) -> list[tuple[int, int]]:
+        # 用块索引挑出可能命中的块，最后一个未满块总是需要扫描
+        try:
+            idx = np.fromfile(base.with_suffix(".idx"), dtype=_IDX_DTYPE).reshape(-1, 2)
+        except (OSError, ValueError):
+            idx = np.empty((0, 2), dtype=_IDX_DTYPE)
+        hit = np.nonzero((idx[:, 1] >= lo) & (idx[:, 0] <= hi))[0]
+        ranges: list[tuple[int, int]] = []
+        for b in hit.tolist():
+            start, end = b * BLOCK_POINTS, (b + 1) * BLOCK_POINTS
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        tail_start = len(idx) * BLOCK_POINTS
+        if tail_start < total:
+            if ranges and ranges[-1][1] == tail_start:
+                ranges[-1] = (ranges[-1][0], total)
+            else:
+                ranges.append((tail_start, total))
+        return ranges
+
+    @_locked
+    def estimate_points(self, run_id: str, name: str, step_from: Optional[int] = None, step_to: Optional[int] = None) -> int:
+        """按块索引估算范围内的点数（上界），不读取列数据"""
+        base = self._series_base(run_id, name)
+        if base is None:
+            return 0
+        total = self._count_points(base.parent.parent, base.name)
+        lo = -math.inf if step_from is None else step_from
+        hi = math.inf if step_to is None else step_to
+        return sum(end - start for start, end in self._block_ranges(base, total, lo, hi))
+
+    @_locked
+    def read_rows(
+        self,
+        run_id: str,
+        name: str,
+        level: int,
+        step_from: Optional[int] = None,
+        step_to: Optional[int] = None,
+    ) -> np.ndarray:
+        """读取第 level 层金字塔中与范围相交的聚合行；尚未凑满一行的尾部由更细的层及原始点补齐"""
+        base = self._series_base(run_id, name)
+        if base is None:
+            return np.empty((0, PYRAMID_COLS), dtype=np.float64)
+        total = self._count_points(base.parent.parent, base.name)
+        self._update_pyramid(base, total)
+        lo = -math.inf if step_from is None else step_from
+        hi = math.inf if step_to is None else step_to
+
+        parts = []
+        covered = 0
+        for lv in range(level, 0, -1):
+            span = PYRAMID_FANOUT**lv
+            start = covered // span
+            rows = _read_pyramid(base, lv, start)
+            if len(rows):
+                parts.append(rows[(rows[:, 1] >= lo) & (rows[:, 0] <= hi)])
+                covered = (start + len(rows)) * span
+        if covered < total:
+            steps, _, values = self._read_columns(base, total, [(covered, total)], lo, hi)
+            parts.append(_points_to_rows(steps.astype(np.float64), values))
+        if not parts:
+            return np.empty((0, PYRAMID_COLS), dtype=np.float64)
+        return np.concatenate(parts)
+
+    @_locked
+    def pyramid_levels(self, run_id: str, name: str) -> int:
+        base = self._series_base(run_id, name)
+        if base is None:
+            return 0
+        total = self._count_points(base.parent.parent, base.name)
+        levels = 0
+        while total >= PYRAMID_FANOUT:
+            total //= PYRAMID_FANOUT
+            levels += 1
+        return levels
+
+    @_locked
+    def sample_points(self, run_id: str, name: str, n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """按下标等距抽取至多 n 个点（含首尾），只读取被抽中的元素"""
+        base = self._series_base(run_id, name)
+        if base is None:
+            return np.empty(0, _STEP_DTYPE), np.empty(0, _TS_DTYPE), np.empty(0, _VALUE_DTYPE)
+        total = self._count_points(base.parent.parent, base.name)
+        if total == 0:
+            return np.empty(0, _STEP_DTYPE), np.empty(0, _TS_DTYPE), np.empty(0, _VALUE_DTYPE)
+        idx = np.unique(np.linspace(0, total - 1, min(n, total)).astype(np.int64))
+        out = []
+        for ext, dtype in ((".step", _STEP_DTYPE), (".ts", _TS_DTYPE), (".value", _VALUE_DTYPE)):
+            mm = np.memmap(base.with_suffix(ext), dtype=dtype, mode="r", shape=(total,))
+            out.append(np.asarray(mm[idx]))
+            del mm
+        return out[0], out[1], out[2]
+
+    @_locked
+    def edge_points(
+        self, run_id: str, name: str, step_from: Optional[int] = None, step_to: Optional[int] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """范围内按写入顺序的首、尾两个原始点 (steps, values)，只读取命中的首尾块"""
+        empty = (np.empty(0, np.float64), np.empty(0, _VALUE_DTYPE))
+        base = self._series_base(run_id, name)
+        if base is None:
+            return empty
+        total = self._count_points(base.parent.parent, base.name)
+        lo = -math.inf if step_from is None else step_from
+        hi = math.inf if step_to is None else step_to
+        blocks = [
+            (b, min(b + BLOCK_POINTS, end))
+            for start, end in self._block_ranges(base, total, lo, hi)
+            for b in range(start, end, BLOCK_POINTS)
+        ]
+        first = last = None
+        for block in blocks:
+            steps, _, values = self._read_columns(base, total, [block], lo, hi)
+            if len(steps):
+                first = (steps[0], values[0])
+                break
+        for block in reversed(blocks):
+            steps, _, values = self._read_columns(base, total, [block], lo, hi)
+            if len(steps):
+                last = (steps[-1], values[-1])
+                break
+        if first is None or last is None:
+            return empty
+        return np.array([first[0], last[0]], dtype=np.float64), np.array([first[1], last[1]], dtype=_VALUE_DTYPE)
+
+    @_locked
+    def read_series(
+        self,
+        run_id: str,
+        name: str,
+        step_from: Optional[int] = None,
+        step_to: Optional[int] = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """读取 [step_from, step_to] 范围内的点，返回 (steps, ts, values)"""
+        base = self._series_base(run_id, name)
+        empty = (np.empty(0, _STEP_DTYPE), np.empty(0, _TS_DTYPE), np.empty(0, _VALUE_DTYPE))
+        if base is None:
+            return empty
+        total = self._count_points(base.parent.parent, base.name)
+        if total == 0:
+            return empty
+
+        lo = -math.inf if step_from is None else step_from
+        hi = math.inf if step_to is None else step_to
+
+        ranges = self._block_ranges(base, total, lo, hi)
+        if not ranges:
+            return empty
+
+        steps, ts, values = self._read_columns(base, total, ranges, lo, hi, with_ts=True)
+        return steps, ts, values
+
+    @staticmethod
+    def _read_columns(
+        base: Path,
+        total: int,
+        ranges: list[tuple[int, int]],
+        lo: float,
+        hi: float,
+        with_ts: bool = False,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        steps_mm = np.memmap(base.with_suffix(".step"), dtype=_STEP_DTYPE, mode="r", shape=(total,))
+        ts_mm = np.memmap(base.with_suffix(".ts"), dtype=_TS_DTYPE, mode="r", shape=(total,)) if with_ts else None
+        values_mm = np.memmap(base.with_suffix(".value"), dtype=_VALUE_DTYPE, mode="r", shape=(total,))
+        parts_s, parts_t, parts_v = [], [], []
+        for start, end in ranges:
+            s = np.asarray(steps_mm[start:end])
+            mask = (s >= lo) & (s <= hi)
+            parts_s.append(s[mask])
+            if ts_mm is not None:
+                parts_t.append(np.asarray(ts_mm[start:end])[mask])
+            parts_v.append(np.asarray(values_mm[start:end])[mask])
+        del steps_mm, ts_mm, values_mm
+        ts = np.concatenate(parts_t) if parts_t else np.empty(0, _TS_DTYPE)
+        return np.concatenate(parts_s), ts, np.concatenate(parts_v)
+
+    def iter_series_chunks(
+        self, run_id: str, name: str, chunk_points: int = 65536
+    ) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """按固定大小分块顺序读出整条 series，供导出等流式场景使用"""
+        base = self._series_base(run_id, name)
+        if base is None:
+            return
+        total = self._count_points(base.parent.parent, base.name)
+        for start in range(0, total, chunk_points):
+            end = min(start + chunk_points, total)
+            out = []
+            for ext, dtype in ((".step", _STEP_DTYPE), (".ts", _TS_DTYPE), (".value", _VALUE_DTYPE)):
+                mm = np.memmap(base.with_suffix(ext), dtype=dtype, mode="r", shape=(total,))
+                out.append(np.array(mm[start:end]))
+                del mm
+            yield out[0], out[1], out[2]
+
+    @staticmethod
+    def _count_log_lines(run_dir: Path) -> int:
+        try:
+            return (run_dir / "log.idx").stat().st_size // _IDX_DTYPE.itemsize
+        except OSError:
+            return 0
+
+    def log_line_count(self, run_id: str) -> int:
+        st = self._active.get(run_id)
+        if st is not None:
+            return st.log_lines
+        return self._count_log_lines(self._run_dir(run_id))
+
+    @_locked
+    def read_log(self, run_id: str, from_line: int, to_line: int) -> list[dict[str, Any]]:
+        """按行号读取 [from_line, to_line) 的日志，借助 log.idx 直接定位字节偏移"""
+        run_dir = self._run_dir(run_id)
+        st = self._active.get(run_id)
+        if st is not None and st.logs:
+            self._flush_logs(st)
+        total = self._count_log_lines(run_dir)
+        from_line = max(from_line, 0)
+        to_line = min(to_line, total)
+        if from_line >= to_line:
+            return []
+        offsets = np.memmap(run_dir / "log.idx", dtype=_IDX_DTYPE, mode="r", shape=(total,))
+        start = int(offsets[from_line])
+        end = int(offsets[to_line]) if to_line < total else None
+        del offsets
+        with open(run_dir / "log.ndjson", "rb") as f:
+            f.seek(start)
+            raw = f.read() if end is None else f.read(end - start)
+        out = []
+        # 不能用 splitlines：数据里未转义的 U+2028 等字符也会被它当成换行
+        for line in raw.decode("utf-8", errors="replace").split("\n"):
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                out.append({"ts": None, "stream": "stdout", "data": line})
+        return out
+
+    def iter_log(self, run_id: str) -> Iterator[dict[str, Any]]:
+        run_dir = self._run_dir(run_id)
+        st = self._active.get(run_id)
+        if st is not None and st.logs:
+            self._flush_logs(st)
+        try:
+            f = open(run_dir / "log.ndjson", "r", encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def iter_objects(self, run_id: str, name: Optional[str] = None) -> Iterator[dict[str, Any]]:
+        """逐行读取非标量指标，不整体载入内存"""
+        run_dir = self._run_dir(run_id)
+        st = self._active.get(run_id)
+        if st is not None and st.objects:
+            self._flush_run(st)
+        try:
+            f = open(run_dir / "objects.ndjson", "r", encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    continue
+                if name is None or obj.get("name") == name:
+                    yield obj
+
+    @_locked
+    def write_artifact(self, run_id: str, name: str, text: str) -> None:
+        """保存 run 的文本附件（profile.folded、line_profile.json 等）"""
+        if name not in RUN_ARTIFACTS:
+            raise ValueError(f"unknown artifact: {name}")
+        path = self._run_dir(run_id) / name
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+
+    def append_artifact(self, run_id: str, name: str, lines: list[str]) -> None:
+        if name not in RUN_ARTIFACTS:
+            raise ValueError(f"unknown artifact: {name}")
+        if lines:
+            with open(self._run_dir(run_id) / name, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def iter_artifact_lines(self, run_id: str, name: str) -> Iterator[str]:
+        """逐行读取追加型附件，不整体载入内存"""
+        if name not in RUN_ARTIFACTS:
+            raise ValueError(f"unknown artifact: {name}")
+        try:
+            f = open(self._run_dir(run_id) / name, "r", encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            yield from f
+
+    @_locked
+    def read_artifact(self, run_id: str, name: str) -> Optional[str]:
+        if name not in RUN_ARTIFACTS:
+            raise ValueError(f"unknown artifact: {name}")
+        try:
+            return (self._run_dir(run_id) / name).read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+
+_default_store: Optional[MetricStore] = None
+
+
+def get_store() -> MetricStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = MetricStore()
+    return _default_store
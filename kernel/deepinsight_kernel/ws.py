@@ -3,15 +3,36 @@ from __future__ import annotations
 import asyncio
 import json
 import sys
-from typing import Optional
+from typing import Any, Optional
 from uuid import UUID, uuid4
 
 from fastapi import WebSocket, WebSocketDisconnect
 
-from .executor import execute_python, execute_python_project, execute_python_workspace
+from .executor import KillPolicy, execute_python, execute_python_project, execute_python_workspace
 from .models import WsClientMessage, WsServerMessage
 from .hw import read_hw_snapshot, get_system_info
 from .security import check_code_safety
+from .output import MARKER_INTERVAL_S, OutputThrottle, SuppressedSpan, parse_lines_per_s
+from .store import LOG_RANGE_LIMIT, get_store
+from .query import compare_runs, query_series
+from .search import get_search_index
+from .diagnostics import Diagnostic, get_engine
+from .anomaly import MetricMonitor, parse_alert_config
+from .profiler import LineProfileCollector, ProfileCollector, parse_profile_option
+from .spans import SPAN_STATS_PUSH_S, SpanCollector, parse_spans_line
+from .agent_trace import AgentTraceCollector
+from .graph_layout import ARTIFACT as MODEL_GRAPH_ARTIFACT, ModelGraph, get_layout_cache, public_layout
+from .limits import LimitEnforcer, ResourceLimits
+from .resources import DEFAULT_RESOURCE_INTERVAL_S, MIN_RESOURCE_INTERVAL_S, ProcessTreeSampler
+from .control import CONTROL_ACTIONS, DEFAULT_STOP_GRACE_S, ControlChannel, parse_control_line
+
+
+# 写入 run 元数据的告警条数上限
+ALERTS_KEPT = 100
+# 写入 run 元数据的 Agent 任务摘要条数上限
+EPISODES_KEPT = 100
+# 运行中推送火焰图的间隔（秒）
+PROFILE_PUSH_S = 2.0
 
 
 async def _ws_send(websocket: WebSocket, payload: WsServerMessage) -> None:
@@ -45,45 +66,48 @@ def _parse_metric_line(line: str) -> Optional[tuple[str, Any, int]]:
         step_i = 0
     return (name, value, step_i)
 
-def _is_oom_line(line: str) -> bool:
-    low = line.lower()
-    return (
-        "out of memory" in low
-        or "cuda out of memory" in low
-        or "cublas_status_alloc_failed" in low
-        or "resource exhausted" in low
-    )
-
-def _parse_traceback_location(line: str) -> Optional[str]:
-    s = line.strip()
-    if not s.startswith('File "'):
-        return None
-    try:
-        file_part = s.split('File "', 1)[1]
-        path = file_part.split('"', 1)[0]
-        rest = s.split("line", 1)[1]
-        ln = int(rest.split(",", 1)[0].strip())
-        return f"{path}:{ln}"
-    except Exception:
-        return None
-
-def _oom_suggestions() -> list[str]:
-    return [
-        "减小 batch size（最常见且立竿见影）",
-        "开启混合精度（PyTorch: torch.cuda.amp.autocast + GradScaler）",
-        "使用梯度累积（保持等效 batch size）",
-        "减少输入分辨率/序列长度/上下文窗口",
-        "启用梯度检查点（activation checkpointing）",
-        "释放无用张量与缓存（del + torch.cuda.empty_cache；仅缓解碎片）",
-        "把大张量/中间结果移到 CPU 或分块计算（chunking）",
-    ]
-
 async def handle_ws(websocket: WebSocket) -> None:
     await websocket.accept()
 
     current_task: asyncio.Task[None] | None = None
     current_run_id: str | None = None
     cancel_event: asyncio.Event | None = None
+    control: ControlChannel | None = None
+    stop_timer: asyncio.Task[None] | None = None
+
+    async def stop_after_grace(chan: ControlChannel, event: asyncio.Event, grace_s: float) -> None:
+        # 子进程没有在宽限期内自行结束时，回退为普通取消
+        await asyncio.sleep(grace_s)
+        if control is chan:
+            event.set()
+
+    async def send_control(
+        action: str,
+        name: Optional[str] = None,
+        value: Any = None,
+        reason: Optional[str] = None,
+        grace_s: float = DEFAULT_STOP_GRACE_S,
+        request_id: Any = None,
+    ) -> None:
+        nonlocal stop_timer
+        if control is None or cancel_event is None:
+            raise ValueError("No running task")
+        seq = control.apply(action, name, value, reason)
+        if action == "stop_gracefully" and stop_timer is None:
+            stop_timer = asyncio.create_task(stop_after_grace(control, cancel_event, grace_s))
+        await _ws_send(
+            websocket,
+            {
+                "type": "control",
+                "request_id": request_id,
+                "run_id": current_run_id,
+                "action": action,
+                "seq": seq,
+                "name": name,
+                "value": value,
+                "reason": control.stop_reason if action == "stop_gracefully" else None,
+            },
+        )
 
     hw_task: asyncio.Task[None] | None = None
     try:
@@ -142,22 +166,43 @@ async def handle_ws(websocket: WebSocket) -> None:
                 msg = None
 
             if isinstance(msg, dict) and msg.get("type") == "cancel":
-                run_id = msg.get("run_id")
-                if not isinstance(run_id, str):
+                target_run_id = msg.get("run_id")
+                if not isinstance(target_run_id, str):
                     await _ws_send(websocket, {"type": "error", "message": "Missing run_id", "run_id": None})
                     continue
                 try:
-                    UUID(run_id)
+                    UUID(target_run_id)
                 except Exception:
                     await _ws_send(websocket, {"type": "error", "message": "Invalid run_id", "run_id": None})
                     continue
 
-                if current_run_id != run_id or cancel_event is None:
-                    await _ws_send(websocket, {"type": "error", "message": "No running task", "run_id": run_id})
+                if current_run_id != target_run_id or cancel_event is None:
+                    await _ws_send(websocket, {"type": "error", "message": "No running task", "run_id": target_run_id})
                     continue
                 cancel_event.set()
                 continue
 
+            if isinstance(msg, dict) and msg.get("type") == "control":
+                target_run_id = msg.get("run_id")
+                action = msg.get("action")
+                if current_run_id is None or current_run_id != target_run_id:
+                    await _ws_send(websocket, {"type": "error", "message": "No running task", "run_id": target_run_id if isinstance(target_run_id, str) else None})
+                    continue
+                if action not in CONTROL_ACTIONS:
+                    await _ws_send(websocket, {"type": "error", "message": f"Unknown control action: {action}", "run_id": target_run_id})
+                    continue
+                try:
+                    await send_control(
+                        str(action),
+                        name=msg.get("name"),
+                        value=msg.get("value"),
+                        grace_s=float(msg.get("grace_s", DEFAULT_STOP_GRACE_S)),
+                        request_id=msg.get("request_id"),
+                    )
+                except (TypeError, ValueError, OSError) as e:
+                    await _ws_send(websocket, {"type": "error", "message": str(e), "run_id": target_run_id})
+                continue
+
             if isinstance(msg, dict) and msg.get("type") == "request_system_info":
                 try:
                     sys_info = get_system_info()
@@ -167,6 +212,104 @@ async def handle_ws(websocket: WebSocket) -> None:
                     print(f"Failed to refresh system info: {e}")
                 continue
 
+            if isinstance(msg, dict) and msg.get("type") == "series":
+                try:
+                    result = await asyncio.to_thread(
+                        query_series,
+                        get_store(),
+                        str(msg.get("run_id", "")),
+                        str(msg.get("name", "")),
+                        step_from=msg.get("step_from"),
+                        step_to=msg.get("step_to"),
+                        max_points=int(msg.get("max_points", 1000)),
+                        method=str(msg.get("method", "lttb")),
+                    )
+                except Exception as e:
+                    await _ws_send(websocket, {"type": "error", "message": str(e), "run_id": msg.get("run_id")})
+                    continue
+                await _ws_send(websocket, {"type": "series", "request_id": msg.get("request_id"), **result})
+                continue
+
+            if isinstance(msg, dict) and msg.get("type") == "compare":
+                run_ids = msg.get("run_ids")
+                if not isinstance(run_ids, list) or not all(isinstance(r, str) for r in run_ids):
+                    await _ws_send(websocket, {"type": "error", "message": "Missing run_ids", "run_id": None})
+                    continue
+                try:
+                    result = await asyncio.to_thread(
+                        compare_runs,
+                        get_store(),
+                        run_ids,
+                        str(msg.get("name", "")),
+                        grid=str(msg.get("grid", "step")),
+                        points=int(msg.get("points", 500)),
+                        mode=str(msg.get("mode", "min")),
+                    )
+                except Exception as e:
+                    await _ws_send(websocket, {"type": "error", "message": str(e), "run_id": None})
+                    continue
+                await _ws_send(websocket, {"type": "compare", "request_id": msg.get("request_id"), **result})
+                continue
+
+            if isinstance(msg, dict) and msg.get("type") == "expand_group":
+                layout_run_id = str(msg.get("run_id", ""))
+                expanded = msg.get("expanded")
+                try:
+                    layouts = get_layout_cache()
+                    graph = await asyncio.to_thread(layouts.for_run, get_store(), layout_run_id, msg.get("hash"))
+                    if graph is None:
+                        raise ValueError("model graph not found")
+                    result = await asyncio.to_thread(
+                        layouts.toggle,
+                        graph,
+                        expanded if isinstance(expanded, list) else None,
+                        str(msg.get("group", "")),
+                        bool(msg.get("collapse", False)),
+                    )
+                except Exception as e:
+                    await _ws_send(websocket, {"type": "error", "message": str(e), "run_id": msg.get("run_id")})
+                    continue
+                await _ws_send(
+                    websocket,
+                    {"type": "model_layout", "request_id": msg.get("request_id"), "run_id": layout_run_id, **public_layout(result)},
+                )
+                continue
+
+            if isinstance(msg, dict) and msg.get("type") == "log_range":
+                try:
+                    log_run_id = str(msg.get("run_id", ""))
+                    from_line = int(msg.get("from_line", 0))
+                    to_line = min(int(msg.get("to_line", from_line + LOG_RANGE_LIMIT)), from_line + LOG_RANGE_LIMIT)
+                    lines = get_store().read_log(log_run_id, from_line, to_line)
+                    total = get_store().log_line_count(log_run_id)
+                except Exception as e:
+                    await _ws_send(websocket, {"type": "error", "message": str(e), "run_id": msg.get("run_id")})
+                    continue
+                await _ws_send(
+                    websocket,
+                    {
+                        "type": "log_range",
+                        "request_id": msg.get("request_id"),
+                        "run_id": log_run_id,
+                        "from_line": from_line,
+                        "lines": lines,
+                        "total_lines": total,
+                    },
+                )
+                continue
+
+            if isinstance(msg, dict) and msg.get("type") == "search_logs":
+                try:
+                    results = await get_search_index().search(str(msg.get("query", "")), int(msg.get("limit", 50)))
+                except Exception as e:
+                    await _ws_send(websocket, {"type": "error", "message": str(e), "run_id": None})
+                    continue
+                await _ws_send(
+                    websocket,
+                    {"type": "search_logs", "request_id": msg.get("request_id"), "query": msg.get("query"), "results": results},
+                )
+                continue
+
             if isinstance(msg, dict) and msg.get("type") == "exec":
                 if current_task is not None and not current_task.done():
                     await _ws_send(
@@ -197,47 +340,278 @@ async def handle_ws(websocket: WebSocket) -> None:
                         )
                         continue
                 
+                try:
+                    alert_configs = parse_alert_config(msg.get("alerts"))
+                    resource_interval_s = float(msg.get("resource_interval_s", DEFAULT_RESOURCE_INTERVAL_S))
+                    reap_on_exit = msg.get("reap_on_exit", False)
+                    if not isinstance(reap_on_exit, bool):
+                        raise ValueError("reap_on_exit must be a boolean")
+                    kill_policy = KillPolicy(
+                        sigint_grace_s=float(msg.get("sigint_grace_s", KillPolicy.sigint_grace_s)),
+                        sigterm_grace_s=float(msg.get("sigterm_grace_s", KillPolicy.sigterm_grace_s)),
+                        reap_on_exit=reap_on_exit,
+                    )
+                    limits = ResourceLimits.from_message(msg.get("limits"))
+                    profile_interval_s = parse_profile_option(msg.get("profile"))
+                    line_profile = msg.get("line_profile", False)
+                    if not isinstance(line_profile, bool):
+                        raise ValueError("line_profile must be a boolean")
+                    lines_per_s = parse_lines_per_s(msg.get("max_lines_per_s"))
+                except (TypeError, ValueError) as e:
+                    await _ws_send(websocket, {"type": "error", "message": f"exec 参数无效：{e}", "run_id": None})
+                    continue
+
                 current_run_id = str(uuid4())
                 cancel_event = asyncio.Event()
+                control = ControlChannel()
+                stop_timer = None
                 run_id = current_run_id
+                store = get_store()
+                # 建 cgroup、统计 RLIMIT_NPROC 基数要遍历进程表，放进线程里做
+                enforcer = await asyncio.to_thread(LimitEnforcer, limits, run_id) if limits is not None else None
+                exec_prefix = enforcer.command_prefix() if enforcer is not None else None
+                profiler = ProfileCollector(profile_interval_s) if profile_interval_s is not None else None
+                line_profiler = LineProfileCollector() if line_profile else None
+
+                try:
+                    store.start_run(
+                        run_id,
+                        {
+                            "entry": entry_raw if isinstance(entry_raw, str) else None,
+                            "workspace_root": workspace_root if isinstance(workspace_root, str) else None,
+                            "code": code if not workspace_root and not files_raw else None,
+                        },
+                    )
+                except Exception as e:
+                    print(f"Failed to record run {run_id}: {e}")
+                try:
+                    await get_search_index().watch(run_id)
+                except Exception as e:
+                    print(f"Failed to index run {run_id}: {e}")
 
                 await _ws_send(websocket, {"type": "start", "run_id": run_id})
 
-                saw_oom = False
-                last_tb_location: str | None = None
+                diagnostics = get_engine().session()
+                monitor = MetricMonitor(alert_configs)
+                progress_open = False
+                loop = asyncio.get_running_loop()
+                throttle = OutputThrottle(lines_per_s=lines_per_s)
+
+                def terminal_text(line: str) -> str:
+                    # 终端上还停留着进度条状态时，先回到行首并清行，再写完整的一行
+                    nonlocal progress_open
+                    if progress_open:
+                        progress_open = False
+                        return "\r\x1b[K" + line
+                    return line
+
+                async def on_progress(stream: str, state: str) -> None:
+                    nonlocal progress_open
+                    progress_open = True
+                    await _ws_send(websocket, {"type": stream, "data": "\r" + state + "\x1b[K", "run_id": run_id})
+
+                async def send_suppressed(span: SuppressedSpan) -> None:
+                    if span.count:
+                        await _ws_send(
+                            websocket,
+                            {
+                                "type": "output_suppressed",
+                                "run_id": run_id,
+                                "count": span.count,
+                                "from_line": span.from_line,
+                                "to_line": span.to_line,
+                            },
+                        )
+                        marker = f"... 已省略 {span.count} 行输出（第 {span.from_line + 1}-{span.to_line} 行，可通过 log_range 获取）...\n"
+                        await _ws_send(websocket, {"type": "stdout", "data": terminal_text(marker), "run_id": run_id})
+                    for _, stream, data in span.tail:
+                        await _ws_send(websocket, {"type": stream, "data": terminal_text(data), "run_id": run_id})
+
+                spans = SpanCollector()
+                agents = AgentTraceCollector()
+                episodes: list[dict[str, Any]] = []
+
+                async def send_span_stats() -> None:
+                    event: dict[str, Any] = {"type": "span_stats", "run_id": run_id, "phases": spans.summary()}
+                    if agents.tools:
+                        event["tools"] = agents.tool_summary()
+                    await _ws_send(websocket, event)
+
+                async def publish_span_stats() -> None:
+                    while True:
+                        await asyncio.sleep(SPAN_STATS_PUSH_S)
+                        if spans.changed:
+                            await send_span_stats()
+
+                model_graphs: set[str] = set()
+
+                async def lay_out_model(raw: dict[str, Any]) -> dict[str, Any]:
+                    """model_structure 换成服务端布局后的折叠视图，完整图存为 run 附件供展开时使用"""
+                    layouts = get_layout_cache()
+
+                    def add_graph() -> ModelGraph:
+                        # 序列化与写盘同样可能很慢（上万节点），和建图一起放进工作线程
+                        graph = layouts.add(raw)
+                        if graph.hash not in model_graphs:
+                            model_graphs.add(graph.hash)
+                            store.write_artifact(run_id, MODEL_GRAPH_ARTIFACT, json.dumps(raw, ensure_ascii=False))
+                        return graph
+
+                    try:
+                        graph = await asyncio.to_thread(add_graph)
+                        return public_layout(await asyncio.to_thread(layouts.layout, graph))
+                    except Exception as e:
+                        print(f"Failed to lay out model graph: {e}")
+                        return raw
+
+                async def on_spans(batch: dict[str, Any]) -> None:
+                    events = spans.add(batch)
+                    try:
+                        store.append_artifact(run_id, "trace.ndjson", [json.dumps(ev, ensure_ascii=False) for ev in events])
+                    except Exception as e:
+                        print(f"Failed to store spans: {e}")
+                    compact, finished = agents.add(events)
+                    if compact:
+                        await _ws_send(websocket, {"type": "agent_trace", "run_id": run_id, "spans": compact})
+                    for summary in finished:
+                        if len(episodes) < EPISODES_KEPT:
+                            episodes.append(summary)
+                        await _ws_send(websocket, {"type": "agent_episode", "run_id": run_id, **summary})
+
+                span_task = asyncio.create_task(publish_span_stats())
+
+                # deepinsight.memory_profile 最近一次上报的增长最多的分配位置，附到 OOM 诊断里
+                memory_top: Optional[list[Any]] = None
+
+                async def send_diagnostic(diag: Diagnostic, line_no: Optional[int]) -> None:
+                    event = {"type": "diagnostic", "run_id": run_id, "line": line_no, **diag.to_event()}
+                    if diag.rule == "oom" and memory_top:
+                        event["allocators"] = memory_top
+                    await _ws_send(websocket, event)
+                    if diag.rule == "oom":
+                        # 兼容旧前端：OOM 仍单独发送 oom 事件
+                        await _ws_send(
+                            websocket,
+                            {
+                                "type": "oom",
+                                "run_id": run_id,
+                                "message": diag.message,
+                                "likely_location": diag.location,
+                                "suggestions": diag.suggestions,
+                                "allocators": memory_top,
+                            },
+                        )
+
+                async def forward_line(stream: str, line: str) -> None:
+                    # 完整输出总是落盘；转发到前端的行数受 throttle 限制，重复警告只落盘
+                    result = diagnostics.feed(line)
+                    try:
+                        line_no = store.append_log(run_id, stream, line)
+                    except Exception as e:
+                        print(f"Failed to store {stream}: {e}")
+                        line_no = -1
+                    for diag in result.diagnostics:
+                        await send_diagnostic(diag, line_no)
+                    if result.suppress:
+                        return
+                    now = loop.time()
+                    if throttle.offer(now, line_no, stream, line):
+                        span = throttle.take_due(now, force=True)
+                        if span is not None:
+                            await send_suppressed(span)
+                        await _ws_send(websocket, {"type": stream, "data": terminal_text(line), "run_id": run_id})
+                        return
+                    span = throttle.take_due(now)
+                    if span is not None:
+                        await send_suppressed(span)
+
+                async def publish_suppressed() -> None:
+                    # 洪峰后进程可能不再输出，定时补发省略标记与尾巴，不依赖下一行到来
+                    while True:
+                        await asyncio.sleep(MARKER_INTERVAL_S)
+                        span = throttle.take_due(loop.time())
+                        if span is not None:
+                            await send_suppressed(span)
+
+                suppress_task = asyncio.create_task(publish_suppressed())
 
                 async def on_stdout(line: str) -> None:
+                    nonlocal memory_top
                     metric = _parse_metric_line(line)
                     if metric is not None:
                         name, value, step = metric
+                        if name == "model_structure" and isinstance(value, dict) and isinstance(value.get("nodes"), list):
+                            value = await lay_out_model(value)
+                        if name == "memory_profile" and isinstance(value, dict) and value.get("top"):
+                            memory_top = value["top"]
+                        try:
+                            store.append_metric(run_id, name, value, step)
+                        except Exception as e:
+                            print(f"Failed to store metric {name}: {e}")
                         await _ws_send(
                             websocket,
                             {"type": "metric", "run_id": run_id, "name": name, "value": value, "step": step},
                         )
+                        for alert in monitor.observe(name, value, step):
+                            await _ws_send(websocket, {"type": "alert", "run_id": run_id, **alert})
+                            if alert.get("stop_run") and control is not None and not control.stop:
+                                await send_control("stop_gracefully", reason=f"alert:{alert['name']}:{alert['kind']}")
+                        return
+                    batch = parse_spans_line(line)
+                    if batch is not None:
+                        await on_spans(batch)
                         return
-                    await _ws_send(websocket, {"type": "stdout", "data": line, "run_id": run_id})
+                    ack = parse_control_line(line)
+                    if ack is not None:
+                        await _ws_send(websocket, {"type": "control_ack", "run_id": run_id, **ack})
+                        return
+                    await forward_line("stdout", line)
 
                 async def on_stderr(line: str) -> None:
-                    nonlocal saw_oom, last_tb_location
-                    loc = _parse_traceback_location(line)
-                    if loc:
-                        last_tb_location = loc
-                    if (not saw_oom) and _is_oom_line(line):
-                        saw_oom = True
-                        await _ws_send(
-                            websocket,
-                            {
-                                "type": "oom",
-                                "run_id": run_id,
-                                "message": line.strip(),
-                                "likely_location": last_tb_location,
-                                "suggestions": _oom_suggestions(),
-                            },
-                        )
-                    await _ws_send(websocket, {"type": "stderr", "data": line, "run_id": run_id})
+                    await forward_line("stderr", line)
+
+                sampler: ProcessTreeSampler | None = None
+                sampler_task: asyncio.Task[None] | None = None
+
+                async def publish_resources(tree: ProcessTreeSampler) -> None:
+                    # psutil 遍历进程树是阻塞调用，放到线程里执行，避免拖慢事件循环
+                    interval = max(resource_interval_s, MIN_RESOURCE_INTERVAL_S)
+                    while True:
+                        sample = await asyncio.to_thread(tree.sample)
+                        if sample is None:
+                            return
+                        await _ws_send(websocket, {"type": "run_resource", "run_id": run_id, **sample})
+                        try:
+                            for key in ("cpu_percent", "rss_bytes", "uss_bytes", "threads", "open_files", "read_bytes_per_s", "write_bytes_per_s"):
+                                store.append_metric(run_id, f"resource/{key}", sample[key], tree.samples, ts=sample["ts"])
+                        except Exception as e:
+                            print(f"Failed to store resource sample: {e}")
+                        await asyncio.sleep(interval)
+
+                async def send_profile() -> None:
+                    if profiler is not None and profiler.poll():
+                        await _ws_send(websocket, {"type": "profile", "run_id": run_id, **profiler.graph.to_dict()})
+
+                async def publish_profile() -> None:
+                    while True:
+                        await asyncio.sleep(PROFILE_PUSH_S)
+                        await send_profile()
+
+                profile_task = asyncio.create_task(publish_profile()) if profiler is not None else None
+
+                def on_spawn(pid: int) -> None:
+                    nonlocal sampler, sampler_task
+                    sampler = ProcessTreeSampler(pid)
+                    if resource_interval_s > 0:
+                        sampler_task = asyncio.create_task(publish_resources(sampler))
 
                 async def runner() -> None:
-                    nonlocal current_task, current_run_id, cancel_event
+                    nonlocal current_task, current_run_id, cancel_event, control, stop_timer
+                    extra_env = dict(control.env) if control is not None else {}
+                    if profiler is not None:
+                        extra_env.update(profiler.env)
+                    if line_profiler is not None:
+                        extra_env.update(line_profiler.env)
                     try:
                         if isinstance(workspace_root, str) and isinstance(entry_raw, str):
                             import os
@@ -253,13 +627,18 @@ async def handle_ws(websocket: WebSocket) -> None:
                                 head = v[0]
                                 raise ValueError(f"安全检查未通过：禁止调用 {head.name} (line {head.lineno})")
 
-                            exit_code, timed_out, cancelled = await execute_python_workspace(
+                            result = await execute_python_workspace(
                                 workspace_root=workspace_root,
                                 entry=entry_raw,
                                 timeout_s=timeout_s,
                                 on_stdout=on_stdout,
                                 on_stderr=on_stderr,
                                 cancel_event=cancel_event,
+                                on_progress=on_progress,
+                                extra_env=extra_env,
+                                kill_policy=kill_policy,
+                                on_spawn=on_spawn,
+                                exec_prefix=exec_prefix,
                                 python_exe=python_exe,
                             )
                         elif isinstance(files_raw, list) and isinstance(entry_raw, str):
@@ -280,38 +659,138 @@ async def handle_ws(websocket: WebSocket) -> None:
                                     head = v[0]
                                     raise ValueError(f"安全检查未通过：禁止调用 {head.name} (line {head.lineno})")
 
-                            exit_code, timed_out, cancelled = await execute_python_project(
+                            result = await execute_python_project(
                                 files=files,
                                 entry=entry_raw,
                                 timeout_s=timeout_s,
                                 on_stdout=on_stdout,
                                 on_stderr=on_stderr,
                                 cancel_event=cancel_event,
+                                on_progress=on_progress,
+                                extra_env=extra_env,
+                                kill_policy=kill_policy,
+                                on_spawn=on_spawn,
+                                exec_prefix=exec_prefix,
                             )
                         else:
-                            exit_code, timed_out, cancelled = await execute_python(
+                            result = await execute_python(
                                 code=code,
                                 timeout_s=timeout_s,
                                 on_stdout=on_stdout,
                                 on_stderr=on_stderr,
                                 cancel_event=cancel_event,
+                                on_progress=on_progress,
+                                extra_env=extra_env,
+                                kill_policy=kill_policy,
+                                on_spawn=on_spawn,
+                                exec_prefix=exec_prefix,
+                            )
+                        if sampler_task is not None:
+                            sampler_task.cancel()
+                        resources = sampler.summary() if sampler is not None else None
+                        profile_summary = None
+                        if profiler is not None:
+                            if profile_task is not None:
+                                profile_task.cancel()
+                            await send_profile()
+                            profile_summary = {
+                                "samples": profiler.graph.samples,
+                                "interval_s": profiler.interval_s,
+                                "hotspots": profiler.graph.hotspots(5),
+                            }
+                            try:
+                                store.write_artifact(run_id, "profile.folded", profiler.graph.folded())
+                            except Exception as e:
+                                print(f"Failed to store profile: {e}")
+                        span_task.cancel()
+                        span_summary = spans.summary() if spans.stats else None
+                        if span_summary is not None:
+                            await send_span_stats()
+                        line_summary = None
+                        if line_profiler is not None:
+                            table = line_profiler.collect()
+                            await _ws_send(websocket, {"type": "line_profile", "run_id": run_id, **table})
+                            line_summary = {"total_ms": table["total_ms"], "files": len(table["files"])}
+                            try:
+                                store.write_artifact(run_id, "line_profile.json", json.dumps(table, ensure_ascii=False))
+                            except Exception as e:
+                                print(f"Failed to store line profile: {e}")
+                        suppress_task.cancel()
+                        span = throttle.take_due(loop.time(), force=True)
+                        if span is not None:
+                            await send_suppressed(span)
+                        for diag in diagnostics.finish():
+                            await send_diagnostic(diag, None)
+                        stop_reason = control.stop_reason if control is not None else None
+                        limit_hit = None
+                        if enforcer is not None:
+                            limit_hit = enforcer.classify(
+                                result.exit_code,
+                                diagnostics.fired,
+                                resources["cpu_seconds"] if resources is not None else None,
+                            )
+                        try:
+                            store.finish_run(
+                                run_id,
+                                exit_code=result.exit_code,
+                                timed_out=result.timed_out,
+                                cancelled=result.cancelled,
+                                stop_reason=stop_reason,
+                                leaked_pids=result.leaked_pids,
+                                resources=resources,
+                                limits=enforcer.describe() if enforcer is not None else None,
+                                limit_hit=limit_hit,
+                                profile=profile_summary,
+                                line_profile=line_summary,
+                                spans=span_summary,
+                                agent_tools=agents.tool_summary() if agents.tools else None,
+                                agent_episodes=[{k: v for k, v in ep.items() if k != "critical_path"} for ep in episodes] or None,
+                                alerts=monitor.fired[:ALERTS_KEPT],
                             )
+                        except Exception as e:
+                            print(f"Failed to finish run {run_id}: {e}")
                         await _ws_send(
                             websocket,
                             {
                                 "type": "done",
                                 "run_id": run_id,
-                                "exit_code": exit_code,
-                                "timed_out": timed_out,
-                                "cancelled": cancelled,
+                                "exit_code": result.exit_code,
+                                "timed_out": result.timed_out,
+                                "cancelled": result.cancelled,
+                                "stop_reason": stop_reason,
+                                "leaked_pids": result.leaked_pids,
+                                "resources": resources,
+                                "limit_hit": limit_hit,
                             },
                         )
                     except Exception as e:
+                        try:
+                            store.finish_run(run_id, error=str(e))
+                        except Exception:
+                            pass
                         await _ws_send(websocket, {"type": "error", "message": str(e), "run_id": run_id})
                     finally:
+                        if sampler_task is not None:
+                            sampler_task.cancel()
+                        if stop_timer is not None:
+                            stop_timer.cancel()
+                        if control is not None:
+                            control.close()
+                        if enforcer is not None:
+                            enforcer.close()
+                        span_task.cancel()
+                        suppress_task.cancel()
+                        if profile_task is not None:
+                            profile_task.cancel()
+                        if profiler is not None:
+                            profiler.close()
+                        if line_profiler is not None:
+                            line_profiler.close()
                         current_task = None
                         current_run_id = None
                         cancel_event = None
+                        control = None
+                        stop_timer = None
 
                 current_task = asyncio.create_task(runner())
                 continue
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import websockets
+
+CODE = """
+import asyncio
+import time
+import deepinsight
+
+
+@deepinsight.tool
+def search(query):
+    time.sleep(0.01)
+    return ["doc1", "doc2"]
+
+
+@deepinsight.tool(name="browse")
+async def fetch_page(url):
+    await asyncio.sleep(0.08)
+    return "<html>"
+
+
+@deepinsight.tool
+def calculator(expr):
+    raise ValueError("bad expression")
+
+
+async def run(i):
+    with deepinsight.agent_episode("task", content=f"question {i}"):
+        with deepinsight.agent_span("thought", "plan the search") as step:
+            time.sleep(0.005)
+            step["result"] = "search first"
+        search("deep learning")
+        await fetch_page("https://example.com")
+        try:
+            calculator("1/0")
+        except ValueError:
+            pass
+        deepinsight.log_agent("output", "answer")
+
+
+for i in range(5):
+    asyncio.run(run(i))
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        trace, episodes, tools = [], [], None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "agent_trace":
+                trace.extend(msg["spans"])
+            if msg.get("type") == "agent_episode":
+                episodes.append(msg)
+            if msg.get("type") == "span_stats" and "tools" in msg:
+                tools = msg["tools"]
+            if msg.get("type") == "done":
+                break
+
+    if len(episodes) != 5:
+        raise SystemExit(f"expected 5 episodes: {episodes}")
+    if tools is None or set(tools) != {"search", "browse", "calculator"}:
+        raise SystemExit(f"unexpected tools: {tools}")
+    if tools["search"]["count"] != 5 or tools["calculator"]["errors"] != 5 or tools["browse"]["errors"] != 0:
+        raise SystemExit(f"tool counts wrong: {tools}")
+    if not tools["browse"]["p50_ms"] >= 80 or not 10 <= tools["search"]["p90_ms"] < 80:
+        raise SystemExit(f"tool latencies implausible: {tools}")
+
+    ep = episodes[0]
+    if ep["name"] != "task" or ep["spans"] != 6 or ep["duration_ms"] < 95:
+        raise SystemExit(f"episode summary wrong: {ep}")
+    path = [p["name"] for p in ep["critical_path"]]
+    if path[0] != "task" or "browse" not in path or "search" not in path:
+        raise SystemExit(f"critical path wrong: {path}")
+    if ep["bottleneck"]["name"] != "browse":
+        raise SystemExit(f"bottleneck should be the slow tool: {ep['bottleneck']}")
+
+    roles = {(s["role"], s["name"]) for s in trace}
+    if ("output", "output") not in roles or ("thought", "thought") not in roles:
+        raise SystemExit(f"agent spans missing: {roles}")
+    errors = [s for s in trace if s["name"] == "calculator"]
+    if not errors or "bad expression" not in (errors[0]["error"] or ""):
+        raise SystemExit(f"tool error not recorded: {errors[:1]}")
+    thought = next(s for s in trace if s["role"] == "thought")
+    if thought["result"] != "search first" or thought["episode"] != ep["episode"]:
+        raise SystemExit(f"thought span wrong: {thought}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
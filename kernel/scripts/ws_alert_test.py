@@ -0,0 +1,77 @@
+import asyncio
+import json
+import urllib.request
+
+import websockets
+
+CODE = """
+import json
+import math
+import random
+
+random.seed(0)
+for s in range(1200):
+    loss = 2 * math.exp(-s / 100) + 0.05 + random.gauss(0, 0.01)
+    if s == 600:
+        loss = 50.0
+    if s > 900:
+        loss = 0.1 * math.exp((s - 900) / 30)
+    print("__METRIC__ " + json.dumps({"name": "train/loss", "value": loss, "step": s}))
+    print("__METRIC__ " + json.dumps({"name": "val/acc", "value": 0.9, "step": s}))
+print("__METRIC__ " + json.dumps({"name": "train/loss", "value": float("nan"), "step": 1200}))
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        for bad in ({"train/*": {"bogus": 1}}, {"loss": {"spike_z": "abc"}}, {"loss": {"stop_run": "yes"}}):
+            await ws.send(json.dumps({"type": "exec", "code": "", "alerts": bad}))
+            while True:
+                msg = json.loads(await ws.recv())
+                if msg.get("type") == "error":
+                    break
+                if msg.get("type") == "start":
+                    raise SystemExit(f"invalid alerts config was accepted: {bad}")
+
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "exec",
+                    "code": CODE,
+                    "timeout_s": 60,
+                    "alerts": {"val/*": {"plateau_patience": 100}},
+                }
+            )
+        )
+        alerts = []
+        run_id = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "alert":
+                alerts.append(msg)
+            if msg.get("type") == "done":
+                break
+
+        kinds = {(a["name"], a["kind"]): a for a in alerts}
+        spike = kinds.get(("train/loss", "spike"))
+        if spike is None or spike["step"] != 600:
+            raise SystemExit(f"missing spike alert: {alerts}")
+        divergence = kinds.get(("train/loss", "divergence"))
+        if divergence is None or divergence["step"] <= 900:
+            raise SystemExit(f"missing or early divergence alert: {alerts}")
+        if ("train/loss", "nan") not in kinds:
+            raise SystemExit(f"missing nan alert: {alerts}")
+        if ("val/acc", "plateau") not in kinds:
+            raise SystemExit(f"missing plateau alert: {alerts}")
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}") as resp:
+        run = json.loads(resp.read())
+    if len(run.get("alerts", [])) != len(alerts):
+        raise SystemExit(f"alerts not recorded on run: {run.get('alerts')}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import websockets
+
+
+async def run_once(ws, scale: int) -> str:
+    await ws.send(
+        json.dumps(
+            {
+                "type": "exec",
+                "code": f"import math\nfor i in range(3000):\n    print('__METRIC__ ' + '{{\"name\":\"loss\",\"value\":%f,\"step\":%d}}' % (math.exp(-i / {scale}), i))\n",
+                "timeout_s": 30,
+            }
+        )
+    )
+    run_id = None
+    while True:
+        msg = json.loads(await ws.recv())
+        if msg.get("type") == "start":
+            run_id = msg["run_id"]
+        if msg.get("type") == "done":
+            return run_id
+
+
+async def compare(ws, run_ids: list[str], points: int) -> dict:
+    await ws.send(json.dumps({"type": "compare", "run_ids": run_ids, "name": "loss", "points": points}))
+    while True:
+        msg = json.loads(await ws.recv())
+        if msg.get("type") == "compare":
+            return msg
+        if msg.get("type") == "error":
+            raise SystemExit(msg["message"])
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        run_ids = [await run_once(ws, 500), await run_once(ws, 1000)]
+
+        msg = await compare(ws, run_ids, 100)
+
+        if len(msg["x"]) != 100 or [r["run_id"] for r in msg["runs"]] != run_ids:
+            raise SystemExit("unexpected compare grid")
+        fast, slow = (r["summary"] for r in msg["runs"])
+        if not fast["best"] < slow["best"] or fast["best_step"] != 2999:
+            raise SystemExit(f"unexpected summaries: {fast} {slow}")
+
+        # 点数少时走金字塔聚合行，曲线首尾仍应落在原始端点上
+        coarse = await compare(ws, run_ids, 10)
+        if coarse["x"][0] != 0 or coarse["x"][-1] != 2999:
+            raise SystemExit(f"unexpected coarse grid: {coarse['x']}")
+        for r in coarse["runs"]:
+            if r["values"][0] != 1.0 or r["values"][-1] is None:
+                raise SystemExit(f"missing endpoints: {r['values']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
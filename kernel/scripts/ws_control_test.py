@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import websockets
+
+CODE = """
+import time
+import deepinsight
+
+lr = deepinsight.get_param("lr", 0.1)
+deepinsight.on_param("lr", lambda v: print("lr changed", v))
+deepinsight.on_stop(lambda: print("checkpoint saved"))
+print("ready")
+step = 0
+while not deepinsight.should_stop():
+    step += 1
+    time.sleep(0.01)
+print("stopped at", step, "lr", deepinsight.get_param("lr"))
+"""
+
+
+async def recv_until(ws, pred):
+    while True:
+        msg = json.loads(await ws.recv())
+        if pred(msg):
+            return msg
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        start = await recv_until(ws, lambda m: m.get("type") == "start")
+        run_id = start["run_id"]
+        outputs: list[str] = []
+        acks: list[dict] = []
+
+        def collect(m: dict) -> bool:
+            if m.get("type") == "stdout":
+                outputs.append(m["data"])
+            if m.get("type") == "control_ack":
+                acks.append(m)
+            return False
+
+        async def control(action: str, **kw) -> dict:
+            await ws.send(json.dumps({"type": "control", "run_id": run_id, "action": action, **kw}))
+            sent = await recv_until(ws, lambda m: collect(m) or m.get("type") in ("control", "error"))
+            if sent["type"] == "error":
+                raise SystemExit(f"control {action} failed: {sent}")
+            return await recv_until(ws, lambda m: collect(m) or (m.get("type") == "control_ack" and m["seq"] >= sent["seq"]))
+
+        await recv_until(ws, lambda m: collect(m) or m.get("data") == "ready\n")
+        ack = await control("set_param", name="lr", value=0.01)
+        if ack["state"] != "running" or ack["params"].get("lr") != 0.01:
+            raise SystemExit(f"unexpected set_param ack: {ack}")
+        ack = await control("pause")
+        if ack["state"] != "paused":
+            raise SystemExit(f"unexpected pause ack: {ack}")
+        ack = await control("resume")
+        if ack["state"] != "running":
+            raise SystemExit(f"unexpected resume ack: {ack}")
+        ack = await control("stop_gracefully")
+        if ack["state"] != "stopping":
+            raise SystemExit(f"unexpected stop ack: {ack}")
+
+        done = await recv_until(ws, lambda m: collect(m) or m.get("type") == "done")
+        text = "".join(outputs)
+        if done["exit_code"] != 0 or done["cancelled"] or done.get("stop_reason") != "user":
+            raise SystemExit(f"unexpected done: {done}")
+        for needle in ("lr changed 0.01", "checkpoint saved", "lr 0.01"):
+            if needle not in text:
+                raise SystemExit(f"missing {needle!r} in output: {text!r}")
+
+        await ws.send(json.dumps({"type": "control", "run_id": run_id, "action": "pause"}))
+        err = await recv_until(ws, lambda m: m.get("type") == "error")
+        if err["message"] != "No running task":
+            raise SystemExit(f"unexpected error: {err}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import websockets
+
+CODE = """
+import math
+import sys
+import warnings
+
+warnings.simplefilter("always")
+for i in range(100):
+    warnings.warn(f"old api used {i} times", DeprecationWarning)
+print("epoch 3 loss: nan")
+
+def forward():
+    raise RuntimeError("mat1 and mat2 shapes cannot be multiplied (2x3 and 4x5)")
+
+forward()
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+
+        diagnostics = []
+        warning_lines = 0
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "stderr" and "DeprecationWarning" in msg["data"]:
+                warning_lines += 1
+            if msg.get("type") == "diagnostic":
+                diagnostics.append(msg)
+            if msg.get("type") == "done":
+                break
+
+        by_rule = {d["rule"]: d for d in diagnostics}
+        shape = by_rule.get("shape_mismatch")
+        if shape is None or not shape["location"] or not shape["location"].endswith(":12"):
+            raise SystemExit(f"missing shape_mismatch diagnostic: {diagnostics}")
+        if "nan_loss" not in by_rule:
+            raise SystemExit(f"missing nan_loss diagnostic: {diagnostics}")
+        repeated = by_rule.get("repeated_warning")
+        if repeated is None or repeated["count"] != 100:
+            raise SystemExit(f"warnings not deduplicated: {diagnostics}")
+        if warning_lines != 1:
+            raise SystemExit(f"expected one forwarded warning, got {warning_lines}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
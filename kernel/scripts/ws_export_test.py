@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from uuid import uuid4
+
+import websockets
+
+BASE = "http://127.0.0.1:8000"
+
+CODE = """
+import deepinsight
+
+for i in range(3000):
+    print('__METRIC__ ' + '{"name":"loss","value":%f,"step":%d}' % (1.0 / (i + 1), i))
+for step in range(50):
+    with deepinsight.span("step", step=step):
+        pass
+print('export done TOKEN')
+"""
+
+
+def get_json(path: str):
+    with urllib.request.urlopen(BASE + path) as resp:
+        return json.loads(resp.read())
+
+
+def export(run_id: str, fmt: str) -> tuple[str, bytes]:
+    with urllib.request.urlopen(f"{BASE}/export?run_ids={run_id}&format={fmt}") as resp:
+        return resp.headers["X-DeepInsight-Format"], resp.read()
+
+
+def post_import(data: bytes) -> tuple[int, dict]:
+    req = urllib.request.Request(f"{BASE}/runs/import", data=data, method="POST")
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def snapshot(run_id: str) -> dict:
+    series = get_json(f"/runs/{run_id}/series/loss")
+    log = get_json(f"/runs/{run_id}/log?from_line=0")
+    trace = get_json(f"/runs/{run_id}/trace")
+    return {
+        "steps": series["steps"],
+        "values": series["values"],
+        "log": [line["data"] for line in log["lines"]],
+        "trace": len(trace["traceEvents"]),
+    }
+
+
+async def main() -> None:
+    token = uuid4().hex[:12]
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE.replace("TOKEN", token), "timeout_s": 60}))
+        run_id = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "done":
+                break
+
+    original = snapshot(run_id)
+    if len(original["steps"]) != 3000 or original["trace"] != 50 or not any(token in line for line in original["log"]):
+        raise SystemExit(f"source run incomplete: {len(original['steps'])} points, {original['trace']} spans")
+
+    archives = {}
+    imported = []
+    for fmt in ("arrow", "parquet", "ndjson"):
+        actual, data = export(run_id, fmt)
+        archives[fmt] = data
+        status, body = post_import(data)
+        if status != 200 or len(body["run_ids"]) != 1:
+            raise SystemExit(f"{fmt} ({actual}) import failed: {status} {body}")
+        new_id = body["run_ids"][0]
+        # 原 run 仍在本机，导入时必须换新 id
+        if new_id == run_id:
+            raise SystemExit(f"{fmt} import overwrote the source run")
+        meta = get_json(f"/runs/{new_id}")
+        if meta.get("imported_from") != run_id or meta.get("status") == "running":
+            raise SystemExit(f"{fmt} import metadata wrong: {meta}")
+        got = snapshot(new_id)
+        if got != original:
+            diff = [k for k in original if got[k] != original[k]]
+            raise SystemExit(f"{fmt} ({actual}) round trip differs in {diff}")
+        imported.append(new_id)
+
+    # 截断或损坏的归档整体回滚，不留下半截 run
+    before = {r["run_id"] for r in get_json("/runs")["runs"]}
+    broken = {
+        "truncated arrow": archives["arrow"][: len(archives["arrow"]) // 2],
+        "truncated parquet": archives["parquet"][: len(archives["parquet"]) // 2],
+        "corrupt ndjson": archives["ndjson"][: len(archives["ndjson"]) // 2] + b"\n{not json\n",
+    }
+    for label, data in broken.items():
+        status, body = post_import(data)
+        if status != 400:
+            raise SystemExit(f"{label} not rejected: {status} {body}")
+    after = {r["run_id"] for r in get_json("/runs")["runs"]}
+    if after != before:
+        raise SystemExit(f"failed imports left runs behind: {sorted(after - before)}")
+
+    # 导入的 run 也要进入日志全文索引
+    deadline = time.time() + 10
+    hits = set()
+    while time.time() < deadline:
+        results = get_json("/search?" + urllib.parse.urlencode({"q": f"export done {token}", "limit": 10}))["results"]
+        hits = {r["run_id"] for r in results}
+        if set(imported) <= hits:
+            break
+        await asyncio.sleep(0.5)
+    if not set(imported) <= hits:
+        raise SystemExit(f"imported runs not searchable: {sorted(set(imported) - hits)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
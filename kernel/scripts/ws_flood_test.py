@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import websockets
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "exec",
+                    "code": "for i in range(200000):\n    print('line', i)\n",
+                    "timeout_s": 60,
+                }
+            )
+        )
+
+        run_id = None
+        forwarded = 0
+        suppressed = 0
+        last_line = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "stdout":
+                forwarded += 1
+                last_line = msg["data"]
+            if msg.get("type") == "output_suppressed":
+                suppressed += msg["count"]
+            if msg.get("type") == "done":
+                break
+
+        if forwarded > 20000 or suppressed == 0:
+            raise SystemExit(f"flood not throttled: forwarded={forwarded} suppressed={suppressed}")
+        if last_line != "line 199999\n":
+            raise SystemExit(f"missing tail: {last_line!r}")
+
+        await ws.send(json.dumps({"type": "log_range", "run_id": run_id, "from_line": 150000, "to_line": 150003}))
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "log_range":
+                break
+        if [l["data"] for l in msg["lines"]] != ["line 150000\n", "line 150001\n", "line 150002\n"]:
+            raise SystemExit(f"unexpected log_range: {msg['lines']}")
+        if msg["total_lines"] != 200000:
+            raise SystemExit(f"unexpected total_lines: {msg['total_lines']}")
+
+        await ws.send(json.dumps({"type": "exec", "code": "print('x')\n", "max_lines_per_s": "abc"}))
+        msg = json.loads(await ws.recv())
+        if msg.get("type") != "error" or msg.get("run_id") is not None:
+            raise SystemExit(f"bad max_lines_per_s not rejected: {msg}")
+
+        # 洪峰后进程静默：省略标记应由定时任务补发，而不是等到下一行输出
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "exec",
+                    "code": "import time\nfor i in range(5000):\n    print('line', i)\ntime.sleep(3)\nprint('after')\n",
+                    "timeout_s": 60,
+                }
+            )
+        )
+        loop = asyncio.get_running_loop()
+        started = marker_at = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                started = loop.time()
+            if msg.get("type") == "output_suppressed" and marker_at is None:
+                marker_at = loop.time()
+            if msg.get("type") == "stdout" and msg["data"].endswith("after\n"):
+                break
+            if msg.get("type") in ("done", "error"):
+                raise SystemExit(f"run ended early: {msg}")
+        if started is None or marker_at is None or marker_at - started > 2.5:
+            raise SystemExit("suppressed span not flushed while the run was quiet")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
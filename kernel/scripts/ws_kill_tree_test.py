@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+
+import psutil
+import websockets
+
+CODE = """
+import multiprocessing as mp
+import os
+import signal
+import time
+
+
+def worker(detach):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if detach:
+        os.setsid()
+    while True:
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    procs = [mp.Process(target=worker, args=(i == 0,)) for i in range(3)]
+    for p in procs:
+        p.start()
+    try:
+        print("pids", " ".join(str(p.pid) for p in procs), flush=True)
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("saving checkpoint", flush=True)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        while True:
+            time.sleep(1)
+"""
+
+# 主进程正常退出，留下一个仍在同一进程组里的后代
+LEFTOVER = """
+import multiprocessing as mp
+import os
+import time
+
+if __name__ == "__main__":
+    p = mp.Process(target=time.sleep, args=(60,))
+    p.start()
+    print("pid", p.pid, flush=True)
+    # 跳过 multiprocessing 退出时的 join
+    os._exit(0)
+"""
+
+
+async def run_leftover(ws, reap: bool) -> tuple[int, dict]:
+    await ws.send(json.dumps({"type": "exec", "code": LEFTOVER, "timeout_s": 30, "reap_on_exit": reap}))
+    pid = 0
+    while True:
+        msg = json.loads(await ws.recv())
+        if msg.get("type") == "stdout" and msg["data"].startswith("pid "):
+            pid = int(msg["data"].split()[1])
+        if msg.get("type") == "error":
+            raise SystemExit(f"exec failed: {msg}")
+        if msg.get("type") == "done":
+            return pid, msg
+
+
+def running(pid: int) -> bool:
+    return psutil.pid_exists(pid) and psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(
+            json.dumps({"type": "exec", "code": CODE, "timeout_s": 60, "sigint_grace_s": 1, "sigterm_grace_s": 1})
+        )
+        run_id = None
+        pids: list[int] = []
+        output = ""
+        started = 0.0
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "stdout":
+                output += msg["data"]
+                if msg["data"].startswith("pids "):
+                    pids = [int(p) for p in msg["data"].split()[1:]]
+                    started = time.time()
+                    await ws.send(json.dumps({"type": "cancel", "run_id": run_id}))
+            if msg.get("type") == "done":
+                break
+
+        elapsed = time.time() - started
+        if not msg["cancelled"] or msg.get("leaked_pids"):
+            raise SystemExit(f"unexpected done: {msg}")
+        if "saving checkpoint" not in output:
+            raise SystemExit(f"SIGINT was not delivered first: {output!r}")
+        alive = [p for p in pids if psutil.pid_exists(p) and psutil.Process(p).status() != psutil.STATUS_ZOMBIE]
+        if len(pids) != 3 or alive:
+            raise SystemExit(f"descendants survived: pids={pids} alive={alive}")
+        if elapsed > 8:
+            raise SystemExit(f"escalation took too long: {elapsed:.1f}s")
+
+        # 默认不清理正常退出后留下的后代，只报告；reap_on_exit 时一并结束
+        pid, done = await run_leftover(ws, False)
+        try:
+            if not running(pid) or done.get("leaked_pids") != [pid]:
+                raise SystemExit(f"leftover should be reported and kept: {done}")
+        finally:
+            if pid and running(pid):
+                psutil.Process(pid).kill()
+        pid, done = await run_leftover(ws, True)
+        if running(pid) or done.get("leaked_pids"):
+            raise SystemExit(f"leftover not reaped: {done}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import urllib.request
+
+import websockets
+
+MEMORY = """
+block = bytearray(512 * 1024 * 1024)
+print("allocated", len(block))
+"""
+
+CPU = """
+while True:
+    pass
+"""
+
+FILE_SIZE = """
+import os
+import tempfile
+
+with tempfile.TemporaryFile() as f:
+    for _ in range(8):
+        f.write(os.urandom(512 * 1024))
+"""
+
+# 显存不足与主机内存上限无关，不应归因到 memory_mb
+CUDA_OOM = """
+import sys
+print("torch.OutOfMemoryError: CUDA out of memory. Tried to allocate 2.00 GiB", file=sys.stderr)
+sys.exit(1)
+"""
+
+WITHIN = """
+block = bytearray(16 * 1024 * 1024)
+print("ok", len(block))
+"""
+
+CASES = (
+    ("memory_mb", MEMORY, {"memory_mb": 256}),
+    ("cpu_seconds", CPU, {"cpu_seconds": 1}),
+    ("file_size_mb", FILE_SIZE, {"file_size_mb": 1}),
+    (None, CUDA_OOM, {"memory_mb": 256}),
+    (None, WITHIN, {"memory_mb": 256, "cpu_seconds": 10, "file_size_mb": 1}),
+)
+
+
+async def run(code: str, limits: dict) -> tuple[str, dict]:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": code, "timeout_s": 30, "limits": limits}))
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "error":
+                raise SystemExit(f"exec failed: {msg}")
+            if msg.get("type") == "done":
+                return run_id, msg
+
+
+async def main() -> None:
+    for expected, code, limits in CASES:
+        run_id, done = await run(code, limits)
+        hit = done.get("limit_hit")
+        if (hit or {}).get("limit") != expected:
+            raise SystemExit(f"expected limit {expected}, got {hit} (exit {done.get('exit_code')})")
+        with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}") as resp:
+            meta = json.loads(resp.read())
+        if meta.get("limit_hit") != hit or not (meta.get("limits") or {}).get("mechanism"):
+            raise SystemExit(f"limits not stored: {meta.get('limits')} {meta.get('limit_hit')}")
+
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": "pass", "limits": {"memory_gb": 1}}))
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") in ("error", "start"):
+                break
+        if msg.get("type") != "error":
+            raise SystemExit(f"unknown limit accepted: {msg}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import urllib.request
+
+import websockets
+
+UTIL = """
+import json
+
+
+def slow(n):
+    total = 0
+    for i in range(n):
+        total += i * i % 7
+    return total
+
+
+def encode(n):
+    return json.dumps(list(range(n)))
+"""
+
+MAIN = """
+from util import encode, slow
+
+for _ in range(20):
+    slow(20_000)
+    encode(1000)
+print("done")
+"""
+
+
+async def main() -> None:
+    files = [{"path": "main.py", "content": MAIN}, {"path": "util.py", "content": UTIL}]
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "files": files, "entry": "main.py", "timeout_s": 60, "line_profile": True}))
+        table = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "line_profile":
+                table = msg
+            if msg.get("type") == "error":
+                raise SystemExit(f"exec failed: {msg}")
+            if msg.get("type") == "done":
+                break
+
+    if table is None:
+        raise SystemExit("no line_profile event")
+    paths = {f["path"]: f for f in table["files"]}
+    if set(paths) != {"main.py", "util.py"}:
+        raise SystemExit(f"library or absolute paths leaked into the table: {sorted(paths)}")
+    rows = {line: (hits, ms) for line, hits, ms in paths["util.py"]["lines"]}
+    # 循环体（第 8 行）每次调用执行 20000 次
+    if rows.get(8, (0, 0))[0] != 20 * 20_000:
+        raise SystemExit(f"unexpected hit count for the loop body: {rows.get(8)}")
+    hottest = max(rows, key=lambda line: rows[line][1])
+    if hottest not in (7, 8):
+        raise SystemExit(f"loop is not the hottest line: {rows}")
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}/line_profile") as resp:
+        stored = json.loads(resp.read())
+    if stored["files"] != table["files"]:
+        raise SystemExit("stored line profile differs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
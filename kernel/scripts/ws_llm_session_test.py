@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import websockets
+
+CODE = """
+import time
+import deepinsight
+
+with deepinsight.llm_session(frame_tokens=8) as s:
+    time.sleep(0.2)
+    for i in range(40):
+        s.token(f"t{i} ", token_id=i, candidates=[(f"t{i} ", 0.7, i), ("x", 0.2, 999)])
+        time.sleep(0.005)
+
+deepinsight.log_llm(token="legacy", candidates=[{"token": "legacy", "prob": 0.9}])
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        metrics: dict[str, list] = {}
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "metric":
+                metrics.setdefault(msg["name"], []).append(msg["value"])
+            if msg.get("type") == "done":
+                if msg["exit_code"] != 0:
+                    raise SystemExit(f"script failed: {msg}")
+                break
+
+    frames = metrics.get("llm_tokens", [])
+    if len(frames) != 5 or sum(len(f["tokens"]) for f in frames) != 40:
+        raise SystemExit(f"tokens not batched into frames of 8: {[len(f['tokens']) for f in frames]}")
+    f0 = frames[0]
+    if f0["ids"][:2] != [0, 1] or f0["candidates"][0] != {"tokens": ["t0 ", "x"], "probs": [0.7, 0.2], "ids": [0, 999]}:
+        raise SystemExit(f"frame arrays malformed: {f0}")
+    if [f["offset"] for f in frames] != [0, 8, 16, 24, 32]:
+        raise SystemExit("frame offsets wrong")
+    summary = metrics["llm_session"][0]
+    if not 190 <= summary["ttft_ms"] < 400:
+        raise SystemExit(f"ttft implausible: {summary}")
+    if not 50 < summary["tokens_per_s"] < 210 or summary["itl_ms"]["p50"] < 5:
+        raise SystemExit(f"decode stats implausible: {summary}")
+    if "llm/ttft_ms" not in metrics or "llm/itl_ms_p99" not in metrics:
+        raise SystemExit(f"scalar series missing: {sorted(metrics)}")
+    # 旧格式：每帧一条 token_output，候选词不再被二次 JSON 编码
+    if len(metrics["token_output"]) != 6 or not isinstance(metrics["token_candidates"][-1], list):
+        raise SystemExit(f"legacy metrics wrong: {metrics['token_output']} {metrics['token_candidates'][-1]!r}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import websockets
+
+CODE = """
+import deepinsight
+
+deepinsight.memory_profile(every=5, top=5)
+leak = []
+
+
+def grow():
+    leak.append(bytearray(256 * 1024))
+
+
+for step in range(40):
+    grow()
+    deepinsight.log_metric("loss", 1.0 / (step + 1), step)
+
+raise MemoryError("simulated allocation failure")
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        profiles = []
+        current = []
+        oom = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "metric" and msg["name"] == "memory_profile":
+                profiles.append(msg)
+            if msg.get("type") == "metric" and msg["name"] == "memory/current_bytes":
+                current.append(msg["value"])
+            if msg.get("type") == "diagnostic" and msg.get("rule") == "oom":
+                oom = msg
+            if msg.get("type") == "done":
+                break
+
+    # step 0, 5, ..., 35 共 8 次，加上 MemoryError 时的最后一次
+    if len(profiles) < 8:
+        raise SystemExit(f"expected a snapshot every 5 steps, got {len(profiles)}")
+    if current[-1] - current[0] < 30 * 256 * 1024:
+        raise SystemExit(f"traced memory did not grow: {current}")
+    top = profiles[3]["value"]["top"]
+    if not top or top[0]["location"] != "<string>:9" or top[0]["size_diff_bytes"] < 4 * 256 * 1024:
+        raise SystemExit(f"leaking line not reported as top allocator: {top}")
+    if oom is None or not oom.get("allocators"):
+        raise SystemExit(f"OOM diagnostic without allocators: {oom}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+import asyncio
+import importlib.util
+import json
+
+import websockets
+
+CODE = """
+import time
+import torch
+import torch.nn as nn
+import deepinsight
+
+
+class Block(nn.Module):
+    def __init__(self, dim):
+        super().__init__()
+        self.fc1 = nn.Linear(dim, dim)
+        self.act = nn.ReLU()
+        self.fc2 = nn.Linear(dim, dim)
+
+    def forward(self, x):
+        return x + self.fc2(self.act(self.fc1(x)))
+
+
+class Net(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.stem = nn.Linear(8, 16)
+        self.block = Block(16)
+        self.head = nn.Linear(16, 2)
+
+    def forward(self, x):
+        return self.head(self.block(self.stem(x)))
+
+
+class Dynamic(Net):
+    def forward(self, x):
+        h = self.block(self.stem(x))
+        # 依赖数据的分支，fx 符号追踪无法处理
+        if h.sum() > 0:
+            h = h * 2
+        return self.head(h)
+
+
+x = torch.randn(4, 8)
+deepinsight.watch(Net(), example_input=x)
+deepinsight.watch(Dynamic(), example_input=x)
+model = Net()
+t0 = time.perf_counter()
+deepinsight.log_model(model, x)
+t1 = time.perf_counter()
+deepinsight.log_model(model, x)
+t2 = time.perf_counter()
+print(f"timing first={t1 - t0:.6f} cached={t2 - t1:.6f}")
+"""
+
+
+def check_residual(graph, add_prefix):
+    nodes = {n["id"]: n for n in graph["nodes"]}
+    adds = [n for n in nodes if n.startswith(add_prefix)]
+    if not adds:
+        raise SystemExit(f"residual add missing: {sorted(nodes)}")
+    sources = {e["source"] for e in graph["edges"] if e["target"] == adds[0]}
+    if len(sources) != 2 or "block.fc2" not in {nodes[s]["data"].get("module") for s in sources}:
+        raise SystemExit(f"residual edges wrong: {sources}")
+    if nodes[adds[0]]["data"]["group"] != "block":
+        raise SystemExit(f"op not grouped under its module: {nodes[adds[0]]}")
+    if not any(g["id"] == "block" and g["params"] == 2 * (16 * 16 + 16) for g in graph["groups"]):
+        raise SystemExit(f"groups wrong: {graph['groups']}")
+    if not all(e.get("label") for e in graph["edges"]):
+        raise SystemExit(f"edges without shapes: {graph['edges']}")
+
+
+async def main() -> None:
+    if importlib.util.find_spec("torch") is None:
+        print("torch not installed, skipped")
+        return
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 120}))
+        graphs, stdout = [], ""
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "metric" and msg["name"] == "model_structure":
+                graphs.append(msg["value"])
+            if msg.get("type") == "stdout":
+                stdout += msg["data"]
+            if msg.get("type") == "done":
+                break
+
+    if len(graphs) != 4:
+        raise SystemExit(f"expected 4 graphs: {len(graphs)} {stdout}")
+    fx, hooks, first, cached = graphs
+    if fx["method"] != "fx" or hooks["method"] != "hooks" or "fx_error" not in hooks:
+        raise SystemExit(f"extraction methods wrong: {fx['method']} {hooks['method']}")
+    check_residual(fx, "add")
+    check_residual(hooks, "add")
+    if first != cached or first["hash"] != fx["hash"]:
+        raise SystemExit("structural cache not reused")
+    timing = dict(kv.split("=") for kv in stdout.split("timing ")[1].split())
+    if float(timing["cached"]) > float(timing["first"]) / 5:
+        raise SystemExit(f"cached call not cheap: {timing}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import time
+import urllib.request
+
+import websockets
+
+# 合成一个约 1.2 万节点的 transformer 式结构图：48 个 block，每个含 40 路注意力与 200 层 MLP
+CODE = """
+import json
+
+def build(n_layers=48, heads=40, mlp=200):
+    nodes, edges = [], []
+    groups = [{"id": "layers", "type": "ModuleList", "parent": None, "params": 0}]
+    def node(i, group, kind="Linear"):
+        nodes.append({"id": i, "type": "layer", "data": {"type": kind, "label": i, "module": i, "group": group}})
+    def edge(a, b):
+        edges.append({"source": a, "target": b, "data": {"shape": [4, 128, 768]}, "label": "4×128×768"})
+    node("embed", None, "Embedding")
+    prev = "embed"
+    for l in range(n_layers):
+        g = f"layers.{l}"
+        groups += [
+            {"id": g, "type": "Block", "parent": "layers", "params": 7},
+            {"id": g + ".attn", "type": "Attention", "parent": g, "params": 3},
+            {"id": g + ".mlp", "type": "MLP", "parent": g, "params": 4},
+        ]
+        node(f"{g}.ln1", g, "LayerNorm"); edge(prev, f"{g}.ln1")
+        for h in range(heads):
+            node(f"{g}.attn.h{h}", g + ".attn"); edge(f"{g}.ln1", f"{g}.attn.h{h}")
+        node(f"{g}.attn.cat", g + ".attn", "cat")
+        for h in range(heads):
+            edge(f"{g}.attn.h{h}", f"{g}.attn.cat")
+        node(f"{g}.attn.proj", g + ".attn"); edge(f"{g}.attn.cat", f"{g}.attn.proj")
+        node(f"{g}.add1", g, "add"); edge(prev, f"{g}.add1"); edge(f"{g}.attn.proj", f"{g}.add1")
+        node(f"{g}.ln2", g, "LayerNorm"); edge(f"{g}.add1", f"{g}.ln2")
+        for k in range(mlp):
+            node(f"{g}.mlp.f{k}", g + ".mlp", "GELU")
+            edge(f"{g}.ln2" if k == 0 else f"{g}.mlp.f{k - 1}", f"{g}.mlp.f{k}")
+        node(f"{g}.add2", g, "add"); edge(f"{g}.add1", f"{g}.add2"); edge(f"{g}.mlp.f{mlp - 1}", f"{g}.add2")
+        prev = f"{g}.add2"
+    node("head", None); edge(prev, "head")
+    return {"method": "fx", "hash": "synthetic-transformer", "nodes": nodes, "edges": edges, "groups": groups}
+
+line = "__METRIC__ " + json.dumps({"name": "model_structure", "value": build(), "step": 0})
+print(line)
+print(line)
+"""
+
+
+async def recv_layout(ws) -> dict:
+    # 其间可能夹着 hw 等广播消息
+    while True:
+        msg = json.loads(await ws.recv())
+        if msg.get("type") in ("model_layout", "error"):
+            return msg
+
+
+def positions(layout):
+    return {n["id"]: (n["position"]["x"], n["position"]["y"]) for n in layout["nodes"]}
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws", max_size=None) as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        graphs = []
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "metric" and msg["name"] == "model_structure":
+                graphs.append(msg["value"])
+            if msg.get("type") == "done":
+                break
+
+        if len(graphs) != 2 or graphs[0] != graphs[1]:
+            raise SystemExit(f"expected the same cached layout twice: {len(graphs)}")
+        view = graphs[0]
+        if view["total_nodes"] < 10_000 or len(view["nodes"]) > 200 or view["expanded"] != ["layers"]:
+            raise SystemExit(f"default view not collapsed: {len(view['nodes'])} nodes, expanded={view['expanded']}")
+        pos = positions(view)
+        if len(set(pos.values())) != len(pos) or pos["head"][1] <= pos["group:layers.47"][1] or pos["group:layers.1"][1] <= pos["group:layers.0"][1]:
+            raise SystemExit("layers not ordered top to bottom")
+        block = next(n for n in view["nodes"] if n["id"] == "group:layers.3")
+        if not block["data"].get("collapsed") or block["data"]["children"] != 246:
+            raise SystemExit(f"collapsed group wrong: {block}")
+
+        t0 = time.perf_counter()
+        await ws.send(json.dumps({"type": "expand_group", "request_id": 1, "run_id": run_id, "hash": view["hash"], "expanded": view["expanded"], "group": "layers.3"}))
+        expanded = await recv_layout(ws)
+        elapsed = time.perf_counter() - t0
+        if expanded.get("type") != "model_layout" or expanded["incremental"] != "layers.3" or elapsed > 2:
+            raise SystemExit(f"expand failed: {str(expanded)[:300]} ({elapsed:.2f}s)")
+        new = positions(expanded)
+        if "group:layers.3" in new or "group:layers.3.attn" not in new or len(set(new.values())) != len(new):
+            raise SystemExit("expanded group not replaced by its children")
+        gy = pos["group:layers.3"][1]
+        if any(new[k] != pos[k] for k in pos if k in new and pos[k][1] < gy):
+            raise SystemExit("nodes above the expanded group moved")
+
+        await ws.send(json.dumps({"type": "expand_group", "request_id": 2, "run_id": run_id, "expanded": expanded["expanded"], "group": "layers.3", "collapse": True}))
+        collapsed = await recv_layout(ws)
+        if collapsed.get("expanded") != ["layers"] or positions(collapsed) != pos:
+            raise SystemExit("collapse should return the cached default view")
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}/model_graph?expanded=layers,layers.0,layers.0.mlp") as resp:
+        full = json.loads(resp.read())
+    if not any(n["id"] == "layers.0.mlp.f199" for n in full["nodes"]):
+        raise SystemExit("HTTP layout did not expand nested groups")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+import asyncio
+import base64
+import json
+
+import numpy as np
+import websockets
+
+CODE = """
+import numpy as np
+import deepinsight
+
+rng = np.random.default_rng(0)
+n, d = 100000, 32
+centers = rng.normal(0, 6, (4, d))
+labels = rng.choice(4, n, p=[0.7, 0.25, 0.045, 0.005])
+x = centers[labels] + rng.normal(0, 1, (n, d))
+deepinsight.watch(x, name="stratified", labels=labels, max_points=2000)
+deepinsight.watch(x, name="voxel", labels=labels, max_points=2000, method="voxel")
+deepinsight.watch(rng.random((300, 2)), name="small", labels=rng.random(300))
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        buffers, legacy = {}, []
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "metric" and msg["name"] == "ml_points_buffer":
+                buffers[msg["value"]["name"]] = msg["value"]
+            if msg.get("type") == "metric" and msg["name"] == "ml_points":
+                legacy.append(msg["value"])
+            if msg.get("type") == "done":
+                break
+
+    if set(buffers) != {"stratified", "voxel", "small"}:
+        raise SystemExit(f"point clouds missing: {sorted(buffers)} {msg}")
+    strat = buffers["stratified"]
+    pos = np.frombuffer(base64.b64decode(strat["positions"]), "<f4").reshape(-1, 3)
+    colors = np.frombuffer(base64.b64decode(strat["colors"]), "<f4").reshape(-1, 3)
+    if strat["total"] != 100000 or pos.shape[0] != strat["count"] or not 1900 <= strat["count"] <= 2004:
+        raise SystemExit(f"stratified budget wrong: {strat['count']}")
+    if colors.shape != pos.shape or strat["legend"]["classes"] != [0, 1, 2, 3]:
+        raise SystemExit(f"label colors wrong: {strat['legend']}")
+    if len({tuple(c) for c in colors.tolist()}) != 4:
+        raise SystemExit("rare class lost by stratified sampling")
+    if strat["projection"] != "pca" or sum(strat["explained_variance"]) < 0.8:
+        raise SystemExit(f"projection does not capture the clusters: {strat['explained_variance']}")
+
+    voxel = buffers["voxel"]
+    if voxel["method"] != "voxel" or not 1000 <= voxel["count"] <= 2000:
+        raise SystemExit(f"voxel downsampling wrong: {voxel['count']}")
+
+    small = buffers["small"]
+    if small["method"] != "all" or small["count"] != 300 or small["projection"] is not None or "range" not in small["legend"]:
+        raise SystemExit(f"small cloud wrong: {small}")
+    if any(len(points) > 500 or "pos" not in points[0] for points in legacy):
+        raise SystemExit("legacy ml_points should stay small")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
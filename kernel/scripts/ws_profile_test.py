@@ -0,0 +1,81 @@
+import asyncio
+import json
+import urllib.request
+
+import websockets
+
+WORK = """
+def hot(n):
+    total = 0
+    for i in range(n):
+        total += i * i % 7
+    return total
+
+
+def cold(n):
+    return sum(range(n))
+"""
+
+MAIN = """
+import time
+from work import cold, hot
+
+end = time.process_time() + 1.5
+while time.process_time() < end:
+    hot(200_000)
+    cold(10_000)
+print("done")
+"""
+
+
+def find(node, name):
+    if name in node["name"]:
+        return node
+    for child in node["children"]:
+        hit = find(child, name)
+        if hit is not None:
+            return hit
+    return None
+
+
+async def main() -> None:
+    files = [{"path": "main.py", "content": MAIN}, {"path": "work.py", "content": WORK}]
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "files": files, "entry": "main.py", "timeout_s": 60, "profile": True}))
+        profiles = []
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "profile":
+                profiles.append(msg)
+            if msg.get("type") == "error":
+                raise SystemExit(f"exec failed: {msg}")
+            if msg.get("type") == "done":
+                break
+
+    if not profiles:
+        raise SystemExit("no profile events")
+    last = profiles[-1]
+    # 1.5s CPU 时间、10ms 间隔，应有约 150 个采样
+    if last["samples"] < 80:
+        raise SystemExit(f"too few samples: {last['samples']}")
+    node = find(last["tree"], "hot (work.py:")
+    if node is None or node["value"] < last["samples"] * 0.6:
+        raise SystemExit(f"hot() not dominant or path not rewritten: {last['hotspots']}")
+    if not last["hotspots"][0]["name"].startswith("hot (work.py:"):
+        raise SystemExit(f"unexpected top hotspot: {last['hotspots']}")
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}/profile?format=folded") as resp:
+        folded = resp.read().decode("utf-8")
+    if "hot (work.py:2)" not in folded:
+        raise SystemExit(f"folded stacks not stored: {folded[:500]}")
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}/profile") as resp:
+        tree = json.loads(resp.read())
+    if tree["samples"] != last["samples"]:
+        raise SystemExit(f"stored profile differs: {tree['samples']} != {last['samples']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
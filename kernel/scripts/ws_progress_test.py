@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+import websockets
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "exec",
+                    "code": "import sys\nfor i in range(200001):\n    sys.stderr.write('\\r%d%%|' % (i // 2000) + '#' * (i // 20000))\nsys.stderr.write('\\n')\nprint('\\x1b[32mdone\\x1b[0m')\n",
+                    "timeout_s": 30,
+                }
+            )
+        )
+
+        frames = 0
+        last_stderr = None
+        got_done_line = False
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "stderr":
+                frames += 1
+                last_stderr = msg["data"]
+            if msg.get("type") == "stdout" and "done" in msg["data"]:
+                got_done_line = True
+            if msg.get("type") == "done":
+                break
+
+        if frames > 200:
+            raise SystemExit(f"progress updates not collapsed: {frames} frames")
+        if not last_stderr or not last_stderr.rstrip("\n").endswith("100%|##########"):
+            raise SystemExit(f"unexpected final progress line: {last_stderr!r}")
+        if not got_done_line:
+            raise SystemExit("missing stdout line")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import urllib.request
+
+import websockets
+
+CODE = """
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+
+def spin(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+if __name__ == "__main__":
+    block = bytearray(200 * 1024 * 1024)
+    worker = mp.Process(target=spin, args=(1.5,))
+    worker.start()
+    spin(1.5)
+    worker.join()
+    with tempfile.TemporaryFile() as f:
+        f.write(os.urandom(20 * 1024 * 1024))
+        f.flush()
+        os.fsync(f.fileno())
+    time.sleep(0.5)
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60, "resource_interval_s": 0.2}))
+        samples = []
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "run_resource":
+                samples.append(msg)
+            if msg.get("type") == "done":
+                break
+
+    summary = msg.get("resources") or {}
+    if len(samples) < 5 or max(s["processes"] for s in samples) < 2:
+        raise SystemExit(f"process tree not sampled: {samples}")
+    if summary.get("peak_rss_bytes", 0) < 200 * 1024 * 1024:
+        raise SystemExit(f"peak rss too low: {summary}")
+    if summary.get("cpu_seconds", 0) < 1.2:
+        raise SystemExit(f"cpu seconds of the tree too low: {summary}")
+    if summary.get("write_bytes", 0) < 20 * 1024 * 1024:
+        raise SystemExit(f"write bytes too low: {summary}")
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}") as resp:
+        run = json.loads(resp.read())
+    if "resource/rss_bytes" not in run["series"] or run.get("resources") != summary:
+        raise SystemExit(f"resource telemetry not stored: {sorted(run['series'])}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import websockets
+
+N, T = 256, 3000
+CODE = f"""
+import numpy as np
+import deepinsight
+
+N, T = {N}, {T}
+period = np.arange(N) % 50 + 10
+rng = np.random.default_rng(0)
+with deepinsight.rl_vec(N, flush_s=0.2, traj_every=10, traj_envs=3) as rl:
+    for t in range(1, T + 1):
+        rl.step(np.full(N, 0.5), t % period == 0, rng.random((N, 2)), epsilon=0.05)
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        metrics = []
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "metric":
+                metrics.append(msg)
+            if msg.get("type") == "done":
+                break
+
+    if msg.get("exit_code") != 0:
+        raise SystemExit(f"run failed: {msg}")
+    if len(metrics) > 400:
+        raise SystemExit(f"rl_vec should batch its output: {len(metrics)} metric lines")
+
+    records = [m["value"] for m in metrics if m["name"] == "rl_episodes"]
+    env = [e for r in records for e in r["env"]]
+    expected = sum(T // (e % 50 + 10) for e in range(N))
+    if len(env) != expected:
+        raise SystemExit(f"expected {expected} episodes, got {len(env)}")
+    if records[-1]["first"] + len(records[-1]["env"]) != expected:
+        raise SystemExit("episode numbering is not contiguous")
+    for r in records:
+        for e, ret, length, t in zip(r["env"], r["return"], r["length"], r["t"]):
+            if length != e % 50 + 10 or abs(ret - 0.5 * length) > 1e-6 or t % length != 0:
+                raise SystemExit(f"bad episode record env={e} return={ret} length={length} t={t}")
+
+    traj = [m["value"] for m in metrics if m["name"] == "rl_trajectory"]
+    samples = sum(len(f["pos"]) for f in traj)
+    if samples != T // 10 or any(len(step) != 3 or len(step[0]) != 2 for f in traj for step in f["pos"]):
+        raise SystemExit(f"trajectory decimation wrong: {samples} samples")
+
+    names = {m["name"] for m in metrics}
+    for name in ("rl_episode", "rl_reward", "rl_pos", "rl_epsilon", "rl/return_mean", "rl/env_steps_per_s"):
+        if name not in names:
+            raise SystemExit(f"missing metric {name}: {sorted(names)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+import asyncio
+import json
+import urllib.request
+
+import websockets
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "exec",
+                    "code": "for i in range(5000):\n    print('__METRIC__ ' + '{\"name\":\"loss\",\"value\":%f,\"step\":%d}' % (1.0 / (i + 1), i))\n",
+                    "timeout_s": 20,
+                }
+            )
+        )
+
+        run_id = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "done":
+                break
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}") as resp:
+        run = json.loads(resp.read())
+    if run["series"].get("loss", {}).get("points") != 5000:
+        raise SystemExit(f"unexpected run summary: {run}")
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}/series/loss?step_from=100&step_to=109") as resp:
+        series = json.loads(resp.read())
+    if series["steps"] != list(range(100, 110)):
+        raise SystemExit(f"unexpected range read: {series['steps']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import time
+from uuid import uuid4
+
+import websockets
+
+
+async def main() -> None:
+    token = uuid4().hex[:12]
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "exec",
+                    "code": f"for i in range(5000):\n    print('step', i)\nprint('RuntimeError: 显存不足 {token}')\n",
+                    "timeout_s": 60,
+                }
+            )
+        )
+
+        run_id = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "done":
+                break
+
+        # 索引在后台增量进行，轮询直到命中
+        deadline = time.time() + 10
+        results = []
+        while time.time() < deadline:
+            await ws.send(json.dumps({"type": "search_logs", "query": f"显存不足 {token.upper()}", "request_id": 1}))
+            while True:
+                msg = json.loads(await ws.recv())
+                if msg.get("type") in ("search_logs", "error"):
+                    break
+            if msg.get("type") == "error":
+                raise SystemExit(f"search failed: {msg}")
+            results = msg["results"]
+            if results:
+                break
+            await asyncio.sleep(0.5)
+
+        if len(results) != 1 or results[0]["run_id"] != run_id or results[0]["line"] != 5000:
+            raise SystemExit(f"unexpected results: {results}")
+
+        await ws.send(json.dumps({"type": "search_logs", "query": "step 4999", "limit": 3}))
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "search_logs":
+                break
+        if not msg["results"] or msg["results"][0]["run_id"] != run_id:
+            raise SystemExit(f"most recent run not ranked first: {msg['results']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+import websockets
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(
+            json.dumps(
+                {
+                    "type": "exec",
+                    "code": "import math\nfor i in range(20000):\n    print('__METRIC__ ' + '{\"name\":\"loss\",\"value\":%f,\"step\":%d}' % (math.exp(-i / 5000), i))\n",
+                    "timeout_s": 30,
+                }
+            )
+        )
+
+        run_id = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "done":
+                break
+
+        await ws.send(
+            json.dumps({"type": "series", "request_id": 1, "run_id": run_id, "name": "loss", "max_points": 500})
+        )
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "series":
+                break
+            if msg.get("type") == "error":
+                raise SystemExit(msg["message"])
+
+        if len(msg["steps"]) != 500 or msg["steps"][0] != 0 or msg["steps"][-1] != 19999:
+            raise SystemExit(f"unexpected downsample: {len(msg['steps'])} points")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import urllib.request
+
+import websockets
+
+CODE = """
+import time
+import deepinsight
+
+
+@deepinsight.timed
+def optimizer_step():
+    time.sleep(0.001)
+
+
+for step in range(300):
+    with deepinsight.span("step", step=step):
+        with deepinsight.span("data"):
+            time.sleep(0.002)
+        with deepinsight.span("forward"):
+            time.sleep(0.004)
+        optimizer_step()
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        stats = None
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "start":
+                run_id = msg["run_id"]
+            if msg.get("type") == "span_stats":
+                stats = msg["phases"]
+            if msg.get("type") == "stdout" and "__SPANS__" in msg["data"]:
+                raise SystemExit("span batches leaked into stdout")
+            if msg.get("type") == "done":
+                break
+
+    if stats is None or set(stats) != {"step", "data", "forward", "optimizer_step"}:
+        raise SystemExit(f"unexpected phases: {stats}")
+    if any(stats[k]["count"] != 300 for k in stats):
+        raise SystemExit(f"span counts wrong: {stats}")
+    if not stats["forward"]["p50_ms"] >= 4 or not stats["step"]["p50_ms"] >= stats["forward"]["p50_ms"] + stats["data"]["p50_ms"]:
+        raise SystemExit(f"durations implausible: {stats}")
+    if list(stats)[0] != "step":
+        raise SystemExit("phases not ordered by total time")
+
+    with urllib.request.urlopen(f"http://127.0.0.1:8000/runs/{run_id}/trace") as resp:
+        trace = json.loads(resp.read())
+    events = trace["traceEvents"]
+    if len(events) != 1200 or any(e["ph"] != "X" for e in events):
+        raise SystemExit(f"unexpected trace events: {len(events)}")
+    steps = {e["args"]["id"]: e for e in events if e["name"] == "step"}
+    for e in events:
+        if e["name"] == "step":
+            continue
+        parent = steps.get(e["args"]["parent"])
+        if parent is None or not (parent["ts"] <= e["ts"] and e["ts"] + e["dur"] <= parent["ts"] + parent["dur"] + 1):
+            raise SystemExit(f"span not nested in its step: {e}")
+        if e["args"]["step"] != parent["args"]["step"]:
+            raise SystemExit(f"child step differs from parent: {e}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
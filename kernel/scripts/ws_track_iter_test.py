@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import websockets
+
+CODE = """
+import time
+import deepinsight
+
+
+class SlowLoader:
+    def __init__(self, n, delay):
+        self.n = n
+        self.delay = delay
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        for i in range(self.n):
+            time.sleep(self.delay)
+            yield [i] * 32
+
+
+fast = deepinsight.track_iter(SlowLoader(60, 0.001), name="fast", interval_s=0.2)
+assert len(fast) == 60
+for batch in fast:
+    time.sleep(0.01)
+
+for batch in deepinsight.track_iter(SlowLoader(40, 0.02), name="slow", interval_s=0.2):
+    time.sleep(0.002)
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        metrics: dict[str, list] = {}
+        diagnostics = []
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "metric":
+                metrics.setdefault(msg["name"], []).append(msg["value"])
+            if msg.get("type") == "diagnostic":
+                diagnostics.append(msg)
+            if msg.get("type") == "error":
+                raise SystemExit(f"exec failed: {msg}")
+            if msg.get("type") == "done":
+                if msg["exit_code"] != 0:
+                    raise SystemExit(f"script failed: {msg}")
+                break
+
+    # 按间隔聚合：60 个 batch 约 0.7s，只应有几次上报
+    if not 2 <= len(metrics.get("fast/wait_fraction", [])) <= 6:
+        raise SystemExit(f"metrics not aggregated per interval: {metrics.get('fast/wait_fraction')}")
+    if max(metrics["fast/wait_fraction"]) > 0.4:
+        raise SystemExit(f"fast loader reported as waiting: {metrics['fast/wait_fraction']}")
+    if min(metrics["slow/wait_fraction"]) < 0.6:
+        raise SystemExit(f"slow loader wait fraction too low: {metrics['slow/wait_fraction']}")
+    sps = metrics["fast/samples_per_s"][0]
+    if not 32 * 40 < sps < 32 * 110:
+        raise SystemExit(f"samples/s implausible: {sps}")
+    if "slow/first_batch_ms" not in metrics:
+        raise SystemExit("first batch latency missing")
+    rules = {d["rule"] for d in diagnostics}
+    if rules != {"input_bottleneck"}:
+        raise SystemExit(f"expected a single input_bottleneck diagnostic, got {diagnostics}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
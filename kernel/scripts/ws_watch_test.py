@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import websockets
+
+CODE = """
+import sys
+import deepinsight
+
+deepinsight.watch(0.5, "loss")
+print("imported:", sorted(m for m in ("numpy", "pandas", "torch", "scipy", "sklearn") if m in sys.modules))
+
+import numpy as np
+import pandas as pd
+
+
+class Trajectory(list):
+    pass
+
+
+@deepinsight.register_watch(Trajectory)
+def _(obj, name, **options):
+    deepinsight.log_metric(name or "trajectory", {"length": len(obj)})
+
+
+deepinsight.watch(Trajectory([1, 2, 3]), "traj")
+deepinsight.watch([1, 2, 3], "plain_list")
+deepinsight.watch(np.arange(1_000_000, dtype=np.float32), "big_vector")
+frame = pd.DataFrame({
+    "x": np.arange(300_000, dtype=np.float64),
+    "y": pd.array([1, None] * 150_000, dtype="Int64"),
+    "label": ["cat", "dog", "cat"] * 100_000,
+})
+deepinsight.watch(frame, "frame", chunk_rows=50_000)
+"""
+
+
+async def main() -> None:
+    async with websockets.connect("ws://127.0.0.1:8000/ws") as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "exec", "code": CODE, "timeout_s": 60}))
+        metrics, stdout = {}, ""
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") == "metric":
+                metrics[msg["name"]] = msg["value"]
+            if msg.get("type") == "stdout":
+                stdout += msg["data"]
+            if msg.get("type") == "done":
+                break
+
+    if "imported: []" not in stdout:
+        raise SystemExit(f"watch imported frameworks just to check a type: {stdout!r}")
+    if metrics.get("loss") != 0.5 or metrics.get("traj") != {"length": 3} or metrics.get("plain_list") != [1, 2, 3]:
+        raise SystemExit(f"dispatch wrong: {metrics}")
+    vec = metrics.get("big_vector") or {}
+    if vec.get("shape") != [1_000_000] or vec.get("max") != 999_999.0:
+        raise SystemExit(f"large arrays should be summarized: {str(vec)[:200]}")
+
+    frame = metrics.get("dataframe_summary") or {}
+    cols = {c["name"]: c for c in frame.get("columns", [])}
+    if frame.get("rows") != 300_000 or set(cols) != {"x", "y", "label"}:
+        raise SystemExit(f"dataframe summary wrong: {frame}")
+    if abs(cols["x"]["mean"] - 149_999.5) > 1e-6 or cols["y"]["nulls"] != 150_000 or cols["y"]["std"] != 0.0:
+        raise SystemExit(f"chunked statistics wrong: {cols}")
+    if cols["label"]["unique"] != 2 or cols["label"]["top"][0] != ["cat", 200_000]:
+        raise SystemExit(f"categorical summary wrong: {cols['label']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())